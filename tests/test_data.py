@@ -1,10 +1,19 @@
 import pandas as pd
+import pickle
 import unittest
 
-from torch import Tensor, int64
+from collections import defaultdict
+from os import listdir, makedirs, rename
+from shutil import rmtree
+from unittest import mock
+from tempfile import TemporaryDirectory
+from torch import Generator, Tensor, arange, cat, eq, float32, int16, int32, \
+    int64, tensor
 
-from torchkge.data_structures import KnowledgeGraph
+from torchkge.data_structures import KnowledgeGraph, FilterIndex
 from torchkge.exceptions import WrongArgumentsError, SanityError, SizeMismatchError
+from torchkge.utils.datasets import load_wn18rr
+from torchkge.utils.synthetic import synthetic_kg
 
 
 class TestUtils(unittest.TestCase):
@@ -56,3 +65,249 @@ class TestUtils(unittest.TestCase):
         with self.assertRaises(WrongArgumentsError):
             self.kg.split_kg(sizes=(9, 9))
 
+    def test_get_mask(self):
+        kg = synthetic_kg(300, 10, 3000, seed=2)
+        for validation in [False, True]:
+            masks = kg.get_mask(0.8, validation=validation,
+                                generator=Generator().manual_seed(0))
+            assert (sum(m.long() for m in masks) == 1).all()
+            # each entity is in the training subset
+            train_ent = cat((kg.head_idx[masks[0]], kg.tail_idx[masks[0]]))
+            assert len(train_ent.unique()) == \
+                len(cat((kg.head_idx, kg.tail_idx)).unique())
+            # each relation is split according to the shares
+            for r in range(kg.n_rel):
+                count = (kg.relations == r).sum().item()
+                sizes = kg.get_sizes(count, 0.8, validation=validation)
+                n_train = (masks[0] & (kg.relations == r)).sum().item()
+                assert n_train >= sizes[0]
+
+            same = kg.get_mask(0.8, validation=validation,
+                               generator=Generator().manual_seed(0))
+            other = kg.get_mask(0.8, validation=validation,
+                                generator=Generator().manual_seed(1))
+            assert all(eq(m1, m2).all() for m1, m2 in zip(masks, same))
+            assert not eq(masks[0], other[0]).all()
+
+        counts = arange(1, 100)
+        for validation in [False, True]:
+            sizes = KnowledgeGraph.get_group_sizes(counts, 0.8, validation)
+            for c in range(1, 100):
+                assert tuple(s[c - 1].item() for s in sizes) == \
+                    KnowledgeGraph.get_sizes(c, 0.8, validation)
+
+        kg_tr, kg_te = kg.split_kg(generator=Generator().manual_seed(3))
+        kg_tr2, _ = kg.split_kg(generator=Generator().manual_seed(3))
+        assert eq(kg_tr.head_idx, kg_tr2.head_idx).all()
+
+    def test_from_files(self):
+        df = pd.DataFrame({'from': ['e' + str(i) for i in self.df['from']],
+                           'rel': ['r' + str(i) for i in self.df['rel']],
+                           'to': ['e' + str(i) for i in self.df['to']]})
+        with TemporaryDirectory() as directory:
+            paths = [directory + '/a.tsv', directory + '/b.tsv']
+            df[:4].to_csv(paths[0], sep='\t', index=False)
+            weighted = df[4:].assign(weight=1.)
+            weighted = weighted[['from', 'rel', 'weight', 'to']]
+            weighted.to_csv(paths[1], sep='\t', index=False)
+
+            kg = KnowledgeGraph.from_files(paths[0], skiprows=1, dtype=str)
+            assert len(kg) == 4
+            # labels are indexed in their order of appearance
+            assert kg.ent2ix == {'e0': 0, 'e1': 1, 'e2': 2, 'e3': 3, 'e4': 4}
+
+            for n_threads in [1, 2]:
+                kg = KnowledgeGraph.from_files(paths[:1], skiprows=1,
+                                               dtype=str, chunk_size=16,
+                                               n_threads=n_threads)
+                kg2 = KnowledgeGraph.from_files(
+                    paths[1:], columns=('from', 'rel', 'weight', 'to'),
+                    skiprows=1, dtype=str, chunk_size=16,
+                    n_threads=n_threads, directory=directory + '/kg')
+                assert sorted(listdir(directory + '/kg')) == \
+                    ['heads.npy', 'relations.npy', 'tails.npy']
+                ix2ent = {v: k for k, v in kg.ent2ix.items()}
+                ix2rel = {v: k for k, v in kg.rel2ix.items()}
+                assert [(ix2ent[h], ix2ent[t], ix2rel[r])
+                        for h, t, r in kg] == \
+                    list(zip(df['from'][:4], df['to'][:4], df['rel'][:4]))
+                kg.sanity_check()
+                kg2.sanity_check()
+                assert len(kg2) == 5
+
+            with self.assertRaises(WrongArgumentsError):
+                KnowledgeGraph.from_files(paths, columns=('from', 'to'))
+            # types of labels are inferred on the first chunk only
+            with open(directory + '/mixed.tsv', 'w') as f:
+                f.write(''.join('{}\t0\t{}\n'.format(i, i + 1)
+                                for i in range(20)))
+            path = directory + '/mixed.tsv'
+            kg = KnowledgeGraph.from_files(path, chunk_size=16)
+            assert all(isinstance(k, int) for k in kg.ent2ix)
+            with open(path, 'a') as f:
+                f.write('a\t0\tb\n')
+            with self.assertRaises(WrongArgumentsError):
+                KnowledgeGraph.from_files(path, chunk_size=16)
+            kg = KnowledgeGraph.from_files(path, chunk_size=16, dtype=str)
+            assert len(kg) == 21
+
+            open(directory + '/empty.tsv', 'w').close()
+            with self.assertRaises(WrongArgumentsError):
+                KnowledgeGraph.from_files(directory + '/empty.tsv')
+
+    def test_FilterIndex(self):
+        dict_of_heads = defaultdict(set)
+        dict_of_tails = defaultdict(set)
+        dict_of_rels = defaultdict(set)
+        for h, t, r in self.kg:
+            dict_of_heads[(t, r)].add(h)
+            dict_of_tails[(h, r)].add(t)
+            dict_of_rels[(h, t)].add(r)
+
+        assert self.kg.index_of_heads.to_dict() == dict_of_heads
+        assert self.kg.index_of_tails.to_dict() == dict_of_tails
+        assert self.kg.index_of_rels.to_dict() == dict_of_rels
+        assert self.kg.dict_of_tails == dict_of_tails
+
+        index = self.kg.index_of_tails
+        assert len(index) == len(dict_of_tails)
+        assert set(index) == set(dict_of_tails.keys())
+        assert (0, 0) in index
+        assert (4, 0) not in index
+        assert index.get(0, 0).tolist() == [1, 2, 3, 4]
+        assert index.get(4, 0) is None
+        assert index[0, 0] == {1, 2, 3, 4}
+        with self.assertRaises(KeyError):
+            index[4, 0]
+
+        # duplicated facts are only indexed once
+        index = FilterIndex(tensor([0, 0, 1]), tensor([0, 0, 0]),
+                            tensor([2, 2, 1]), 1)
+        assert index.values.tolist() == [2, 1]
+        assert index.offsets.tolist() == [0, 1, 2]
+
+        index = FilterIndex.from_dict(dict_of_rels, self.kg.n_ent)
+        assert index.to_dict() == dict_of_rels
+
+        kg_tr, kg_te = self.kg.split_kg(sizes=(4, 5))
+        assert kg_te.index_of_heads is self.kg.index_of_heads
+        assert kg_te.index_of_rels is self.kg.index_of_rels
+
+        kg = pickle.loads(pickle.dumps(self.kg))
+        assert kg.index_of_tails.to_dict() == dict_of_tails
+
+    def test_save_load(self):
+        kg = KnowledgeGraph(self.df.assign(
+            rel=['r' + str(r) + 'é' for r in self.df['rel']]))
+        with TemporaryDirectory() as directory:
+            kg.save(directory + '/kg')
+            kg.save(directory + '/kg')
+            assert listdir(directory) == ['kg']
+            for mmap in [True, False]:
+                loaded = KnowledgeGraph.load(directory + '/kg', mmap=mmap)
+                assert loaded.ent2ix == kg.ent2ix
+                assert loaded.rel2ix == kg.rel2ix
+                assert eq(loaded.head_idx, kg.head_idx).all()
+                assert eq(loaded.relations, kg.relations).all()
+                assert loaded.index_of_heads.to_dict() == \
+                    kg.index_of_heads.to_dict()
+                assert loaded.index_of_rels.to_dict() == \
+                    kg.index_of_rels.to_dict()
+                assert len(loaded.split_kg(share=0.5)[0]) > 0
+
+            with self.assertRaises(WrongArgumentsError):
+                KnowledgeGraph.load(directory)
+            open(directory + '/file', 'w').close()
+            with self.assertRaises(WrongArgumentsError):
+                kg.save(directory)
+            kg.ent2ix = {(i,): i for i in range(kg.n_ent)}
+            with self.assertRaises(WrongArgumentsError):
+                kg.save(directory + '/kg')
+            kg2 = KnowledgeGraph.load(directory + '/kg')
+            assert kg2.ent2ix == loaded.ent2ix
+
+            # the previous graph is kept aside if the new one cannot replace
+            # it
+            kg = KnowledgeGraph(self.df[:4])
+
+            def rename_once(src, dst):
+                if patched.call_count > 1:
+                    raise OSError
+                rename(src, dst)
+
+            with mock.patch('torchkge.data_structures.rename',
+                            side_effect=rename_once) as patched:
+                with self.assertRaises(OSError):
+                    kg.save(directory + '/kg')
+            old_path = patched.call_args_list[0][0][1]
+            assert KnowledgeGraph.load(old_path).ent2ix == loaded.ent2ix
+
+    def test_index_dtype(self):
+        kg = self.kg.astype(int32)
+        assert kg.head_idx.dtype == kg.relations.dtype == int32
+        assert kg.index_of_heads.values.dtype == int32
+        assert eq(kg.head_idx, self.kg.head_idx).all()
+        assert kg.index_of_tails.to_dict() == self.kg.index_of_tails.to_dict()
+        for dtype in [int16, int32]:
+            masks = self.kg.astype(dtype).get_mask(
+                0.5, validation=True, generator=Generator().manual_seed(0))
+            reference = self.kg.get_mask(0.5, validation=True,
+                                         generator=Generator().manual_seed(0))
+            assert all(eq(m1, m2).all() for m1, m2 in zip(masks, reference))
+            for part in self.kg.astype(dtype).split_kg(share=0.5,
+                                                       validation=True):
+                assert part.index_dtype == part.tail_idx.dtype == dtype
+        kg16 = KnowledgeGraph(self.df, index_dtype=int16)
+        assert kg16.relations.dtype == int16
+
+        with self.assertRaises(WrongArgumentsError):
+            self.kg.astype(float32)
+        with self.assertRaises(WrongArgumentsError):
+            synthetic_kg(40000, 2, 100).astype(int16)
+
+        with TemporaryDirectory() as directory:
+            self.df.to_csv(directory + '/kg.tsv', sep='\t', header=False,
+                           index=False, columns=['from', 'rel', 'to'])
+            kg2 = KnowledgeGraph.from_files(directory + '/kg.tsv',
+                                            index_dtype=int32)
+            assert kg2.index_dtype == int32
+            kg.save(directory + '/kg')
+            kg2 = KnowledgeGraph.load(directory + '/kg')
+            assert kg2.tail_idx.dtype == int32
+
+    def test_dataset_cache(self):
+        with TemporaryDirectory() as data_home:
+            makedirs(data_home + '/WN18RR')
+            df = self.df.astype(str)[['from', 'rel', 'to']]
+            for name, part in [('train', df[:5]), ('valid', df[5:7]),
+                               ('test', df[7:])]:
+                part.to_csv(data_home + '/WN18RR/{}.txt'.format(name),
+                            sep='\t', header=False, index=False)
+
+            kgs = load_wn18rr(data_home)
+            assert 'meta.json' in listdir(data_home + '/WN18RR/cache')
+            cached = load_wn18rr(data_home)
+            built = load_wn18rr(data_home, cache=False)
+            for kg1, kg2, kg3 in zip(kgs, cached, built):
+                assert len(kg1) == len(kg2) == len(kg3)
+                assert kg1.ent2ix == kg2.ent2ix == kg3.ent2ix
+                assert kg1.rel2ix == kg2.rel2ix
+                assert (kg2.head_idx == kg3.head_idx).all()
+                assert (kg2.relations == kg3.relations).all()
+                assert kg2.index_of_heads.to_dict() == \
+                    kg3.index_of_heads.to_dict()
+                assert kg2.index_of_rels.to_dict() == \
+                    kg3.index_of_rels.to_dict()
+            assert all(isinstance(k, int) for k in cached[0].ent2ix)
+
+            # the cache is invalidated when the content of a file changes
+            df[7:8].to_csv(data_home + '/WN18RR/test.txt', sep='\t',
+                           header=False, index=False)
+            assert len(load_wn18rr(data_home)[2]) == 1
+            assert len(load_wn18rr(data_home)[2]) == 1
+
+            # the data set is built again if the cache is replaced while it
+            # is being read
+            rmtree(data_home + '/WN18RR/cache/kg')
+            assert len(load_wn18rr(data_home)[2]) == 1
+            assert 'kg' in listdir(data_home + '/WN18RR/cache')
@@ -1,11 +1,17 @@
 import pandas as pd
 import unittest
 
-from torch import long
+from torch import arange, long, eq, allclose, matmul, tensor
 
 from torchkge.data_structures import KnowledgeGraph
-from torchkge.evaluation import LinkPredictionEvaluator, TripletClassificationEvaluator
-from torchkge.models import TransEModel
+from torchkge.evaluation import LinkPredictionEvaluator, \
+    RelationPredictionEvaluator, TripletClassificationEvaluator, \
+    get_relation_batches
+from torchkge.inference import EntityInference
+from torchkge.models import TransEModel, TransHModel, ComplExModel, \
+    HolEModel, ConvKBModel, RESCALModel, DistMultModel, AnalogyModel, \
+    TorusEModel, TransRModel, TransDModel
+from torchkge.utils.profiling import StageTimer
 
 
 class TestUtils(unittest.TestCase):
@@ -35,6 +41,139 @@ class TestUtils(unittest.TestCase):
         evaluator.evaluate(b_size=len(self.kg))
         self.checkSanityLinkPrediction(evaluator)
 
+    def test_LinkPredictionEvaluator_blocks(self):
+        for model in [TransEModel(10, self.kg.n_ent, self.kg.n_rel, 'L1'),
+                      TransHModel(10, self.kg.n_ent, self.kg.n_rel),
+                      ComplExModel(10, self.kg.n_ent, self.kg.n_rel),
+                      HolEModel(10, self.kg.n_ent, self.kg.n_rel),
+                      ConvKBModel(10, 3, self.kg.n_ent, self.kg.n_rel)]:
+            evaluator = LinkPredictionEvaluator(model, self.kg)
+            evaluator.evaluate(b_size=4, verbose=False)
+            block_evaluator = LinkPredictionEvaluator(model, self.kg)
+            block_evaluator.evaluate(b_size=4, verbose=False, block_size=4)
+
+            assert eq(evaluator.rank_true_heads,
+                      block_evaluator.rank_true_heads).all()
+            assert eq(evaluator.rank_true_tails,
+                      block_evaluator.rank_true_tails).all()
+            assert eq(evaluator.filt_rank_true_heads,
+                      block_evaluator.filt_rank_true_heads).all()
+            assert eq(evaluator.filt_rank_true_tails,
+                      block_evaluator.filt_rank_true_tails).all()
+
+    def test_timer(self):
+        model = TransEModel(10, self.kg.n_ent, self.kg.n_rel, 'L1')
+        timer = StageTimer()
+        evaluator = LinkPredictionEvaluator(model, self.kg)
+        evaluator.evaluate(b_size=4, verbose=False, block_size=4, timer=timer)
+        report = timer.report()
+        assert report.n_facts == len(self.kg)
+        assert set(report.stages) == {'scoring', 'filter_scores', 'get_rank'}
+
+        evaluator = RelationPredictionEvaluator(model, self.kg)
+        evaluator.evaluate(b_size=4, verbose=False, timer=timer)
+        assert timer.report().n_facts == len(self.kg)
+
+    def test_score_all(self):
+        h_idx, t_idx = self.kg.head_idx, self.kg.tail_idx
+        r_idx = self.kg.relations
+        for model in [RESCALModel(10, self.kg.n_ent, self.kg.n_rel),
+                      DistMultModel(10, self.kg.n_ent, self.kg.n_rel),
+                      HolEModel(10, self.kg.n_ent, self.kg.n_rel),
+                      ComplExModel(10, self.kg.n_ent, self.kg.n_rel),
+                      AnalogyModel(10, self.kg.n_ent, self.kg.n_rel),
+                      TransEModel(10, self.kg.n_ent, self.kg.n_rel, 'L1'),
+                      TransEModel(10, self.kg.n_ent, self.kg.n_rel, 'L2'),
+                      TorusEModel(10, self.kg.n_ent, self.kg.n_rel,
+                                  'torus_L2'),
+                      TorusEModel(10, self.kg.n_ent, self.kg.n_rel,
+                                  'torus_eL2')]:
+            h, t, r, candidates = model.inference_prepare_candidates(
+                h_idx, t_idx, r_idx, entities=True)
+            assert allclose(model.score_all_tails(h_idx, r_idx),
+                            model.inference_scoring_function(h, candidates, r),
+                            atol=1e-5)
+            assert allclose(model.score_all_heads(t_idx, r_idx),
+                            model.inference_scoring_function(candidates, t, r),
+                            atol=1e-5)
+            assert allclose(model.score_all_tails(h_idx, r_idx, 2, 4),
+                            model.score_all_tails(h_idx, r_idx)[:, 2:4],
+                            atol=1e-5)
+
+            h, t, r, candidates = model.inference_prepare_candidates(
+                h_idx, t_idx, r_idx, entities=False)
+            assert allclose(model.score_all_relations(h_idx, t_idx),
+                            model.inference_scoring_function(h, t, candidates),
+                            atol=1e-5)
+
+    def test_HolE_circular_products(self):
+        model = HolEModel(9, self.kg.n_ent, self.kg.n_rel)
+        h = model.ent_emb(self.kg.head_idx)
+        t = model.ent_emb(self.kg.tail_idx)
+        r = model.rel_emb(self.kg.relations)
+        r_mat = model.get_rolling_matrix(r)
+        assert allclose(model.circular_convolution(h, r),
+                        matmul(h.view(-1, 1, 9), r_mat).view(-1, 9), atol=1e-6)
+        assert allclose(model.circular_correlation(r, t),
+                        matmul(r_mat, t.view(-1, 9, 1)).view(-1, 9), atol=1e-6)
+
+    def test_projection_cache(self):
+        for model in [TransHModel(10, self.kg.n_ent, self.kg.n_rel),
+                      TransRModel(10, 6, self.kg.n_ent, self.kg.n_rel),
+                      TransDModel(10, 6, self.kg.n_ent, self.kg.n_rel)]:
+            proj = model.project_on_all_relations(arange(self.kg.n_ent))
+            for r in range(self.kg.n_rel):
+                assert allclose(model.get_projected_entities(r), proj[:, r],
+                                atol=1e-6)
+
+            # the cache can only hold two relations
+            cache = model.projection_cache
+            cache.max_size = 2 * proj[:, 0].nelement() * proj.element_size()
+            model.fill_projection_cache(verbose=False)
+            assert len(cache) == 2
+            assert cache.size <= cache.max_size
+
+            misses = model.projection_cache.misses
+            evaluator = LinkPredictionEvaluator(model, self.kg)
+            evaluator.evaluate(b_size=2, verbose=False)
+            assert len(model.projection_cache) == 2
+            # facts are grouped by relation so each missing projection is
+            # computed once
+            assert model.projection_cache.misses == misses + self.kg.n_rel - 2
+
+            for batch in get_relation_batches(self.kg.relations, 2):
+                h_idx = self.kg.head_idx[batch]
+                t_idx = self.kg.tail_idx[batch]
+                r_idx = self.kg.relations[batch]
+                h, t, r, candidates = model.inference_prepare_candidates(
+                    h_idx, t_idx, r_idx)
+                # candidates of a single relation are not copied
+                proj = model.get_projected_entities(r_idx[0])
+                assert candidates.data_ptr() == proj.data_ptr()
+                assert allclose(model.score_all_tails(h_idx, r_idx),
+                                model.inference_scoring_function(h, candidates,
+                                                                 r),
+                                atol=1e-5)
+                assert allclose(model.score_all_heads(t_idx, r_idx),
+                                model.inference_scoring_function(candidates, t,
+                                                                 r),
+                                atol=1e-5)
+
+            # inference also groups facts by relation
+            model.fill_projection_cache(verbose=False)
+            misses = model.projection_cache.misses
+            inference = EntityInference(model, self.kg.head_idx,
+                                        self.kg.relations, top_k=3)
+            inference.evaluate(b_size=2, verbose=False)
+            assert model.projection_cache.misses == misses + self.kg.n_rel - 2
+            scores = model.score_all_tails(self.kg.head_idx, self.kg.relations)
+            assert allclose(inference.scores,
+                            scores.sort(descending=True)[0][:, :3], atol=1e-5)
+
+        # relations without facts do not yield empty batches
+        batches = get_relation_batches(tensor([0, 0, 2, 0]), 2)
+        assert [b.tolist() for b in batches] == [[0, 1], [3], [2]]
+
     def test_TripletClassificationEvaluator(self):
         model = TransEModel(100, self.kg.n_ent, self.kg.n_rel, 'L1')
         kg1, kg2 = self.kg.split_kg(sizes=(4, 5))
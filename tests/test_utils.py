@@ -1,16 +1,41 @@
+import json
 import pandas as pd
+import subprocess
+import sys
 import unittest
 
 from collections import defaultdict
-from torch import tensor, cat, eq, bool
+from os.path import join
+from tempfile import TemporaryDirectory
+from threading import active_count
+from numpy import load as load_npy
+from torch import tensor, bincount, cat, eq, bool, rand, isinf, isclose, \
+    load, save, no_grad, int16, int32, int64, manual_seed
+from torch.distributed import init_process_group, destroy_process_group
+from torch.multiprocessing import start_processes
 from torch.nn import Embedding
+from torch.optim import Adam, Adagrad, SGD, SparseAdam
 
+from torchkge.benchmarks import compare, run_benchmarks
 from torchkge.data_structures import KnowledgeGraph
+from torchkge.evaluation import LinkPredictionEvaluator, \
+    RelationPredictionEvaluator
+from torchkge.exceptions import WrongArgumentsError
 from torchkge.utils.dissimilarities import l1_dissimilarity, l2_dissimilarity, \
     l1_torus_dissimilarity, l2_torus_dissimilarity, el2_torus_dissimilarity
-from torchkge.utils.modeling import init_embedding, get_true_targets
-from torchkge.sampling import get_possible_heads_tails
+from torchkge.utils.modeling import init_embedding, get_true_targets, \
+    filter_scores
+from torchkge.sampling import get_possible_heads_tails, \
+    get_possible_entities, sample_possible_entities, \
+    BernoulliNegativeSampler, BernoulliRelationNegativeSampler, \
+    PositionalNegativeSampler, UniformNegativeSampler
 from torchkge.utils.operations import get_mask, get_rank
+from torchkge.utils.training import TrainDataLoader, Trainer, \
+    PartitionedTrainer, shard_kg, get_param_groups
+from torchkge.utils.profiling import StageTimer, TimingReport
+from torchkge.utils.synthetic import KGGenerator, synthetic_kg
+from torchkge.utils.losses import MarginLoss
+from torchkge.models import TransEModel, TransDModel
 from torchkge.utils.operations import get_dictionaries, get_tph, get_hpt, \
     get_bernoulli_probs
 
@@ -94,6 +119,11 @@ class TestUtils(unittest.TestCase):
         for k in probs.keys():
             assert (res[k] - probs[k]) < 1e-03
 
+        # keys of (entity, relation) pairs overflow compact index types
+        kg = synthetic_kg(30000, 50, 20000)
+        assert get_bernoulli_probs(kg.astype(int16)) == \
+            get_bernoulli_probs(kg)
+
     def test_dissimilarities(self):
         assert ((l1_dissimilarity(self.a, self.b) ==
                  tensor([9.1000, 4.5000])).all() == 1)
@@ -126,9 +156,28 @@ class TestUtils(unittest.TestCase):
         assert get_true_targets(self.dictionary, self.e_idx,
                                 self.r_idx, self.true_idx, 2) is None
 
+    def test_filter_scores(self):
+        kg = KnowledgeGraph(self.df)
+        scores = rand(kg.n_facts, kg.n_ent)
+
+        for true_idx in [kg.tail_idx, None]:
+            filt = filter_scores(scores, kg.index_of_tails, kg.head_idx,
+                                 kg.relations, true_idx)
+            expected = filter_scores(scores, kg.dict_of_tails, kg.head_idx,
+                                     kg.relations, true_idx)
+            assert eq(filt, expected).all()
+        assert isinf(filt.gather(1, kg.tail_idx.view(-1, 1))).all()
+
+        filt = filter_scores(scores, kg.index_of_tails, tensor([4, 0]),
+                             tensor([0, 0]), tensor([1, 1]))
+        assert not isinf(filt[0]).any()
+        assert eq(isinf(filt[1]),
+                  tensor([False, False, True, True, True, False])).all()
+
     def test_get_possible_heads_tails(self):
         kg = KnowledgeGraph(self.df)
-        h, t = get_possible_heads_tails(kg)
+        with self.assertWarns(DeprecationWarning):
+            h, t = get_possible_heads_tails(kg)
 
         assert (type(h) == dict) & (type(t) == dict)
 
@@ -141,12 +190,440 @@ class TestUtils(unittest.TestCase):
         p_t[0].add(41)
         p_t[10].add(51)
 
-        h, t = get_possible_heads_tails(kg, possible_heads=dict(p_h),
-                                        possible_tails=dict(p_t))
+        with self.assertWarns(DeprecationWarning):
+            h, t = get_possible_heads_tails(kg, possible_heads=dict(p_h),
+                                            possible_tails=dict(p_t))
 
         assert h == {0: {0, 2, 5, 40}, 1: {1}, 2: {1}, 3: {3}, 10: {50}}
         assert t == {0: {1, 2, 3, 4, 41}, 1: {2}, 2: {3}, 3: {4}, 10: {51}}
 
+    def test_get_possible_entities(self):
+        kg = KnowledgeGraph(self.df)
+        h, offsets, counts = get_possible_entities(kg.relations, kg.head_idx,
+                                                   kg.n_rel, kg.n_ent)
+        assert eq(h, tensor([0, 2, 5, 1, 1, 3])).all()
+        assert eq(offsets, tensor([0, 3, 4, 5])).all()
+        assert eq(counts, tensor([3, 1, 1, 1])).all()
+
+        # relation 1 has no possible entity
+        relations = tensor([0, 1, 2, 0, 1, 2] * 10)
+        sampled = sample_possible_entities(tensor([0, 2, 5, 3]),
+                                           tensor([0, 3, 3]),
+                                           tensor([3, 0, 1]), relations, 6)
+        assert sum(e in [0, 2, 5]
+                   for e in sampled[relations == 0].tolist()) == 20
+        assert (sampled[relations == 2] == 3).all()
+        assert ((sampled[relations == 1] >= 0) &
+                (sampled[relations == 1] < 6)).all()
+
+        # no relation has a possible entity
+        sampled = sample_possible_entities(tensor([], dtype=int64),
+                                           tensor([0, 0]), tensor([0, 0]),
+                                           tensor([0, 1, 1]), 6)
+        assert ((sampled >= 0) & (sampled < 6)).all()
+
+        sampler = PositionalNegativeSampler(kg)
+        assert sampler.possible_heads == {0: [0, 2, 5], 1: [1], 2: [1],
+                                          3: [3]}
+        assert sampler.possible_tails == {0: [1, 2, 3, 4], 1: [2], 2: [3],
+                                          3: [4]}
+        neg_heads, neg_tails = sampler.corrupt_batch(kg.head_idx, kg.tail_idx,
+                                                     kg.relations)
+        for i in range(len(kg)):
+            r = kg.relations[i].item()
+            assert neg_heads[i].item() in \
+                sampler.possible_heads[r] + [kg.head_idx[i].item()]
+            assert neg_tails[i].item() in \
+                sampler.possible_tails[r] + [kg.tail_idx[i].item()]
+
+    def test_TrainDataLoader(self):
+        kg = KnowledgeGraph(self.df)
+        for streaming, prefetch in [(False, False), (False, True),
+                                    (True, False), (True, True)]:
+            loader = TrainDataLoader(kg, batch_size=4, sampling_type='bern',
+                                     streaming=streaming, prefetch=prefetch,
+                                     record_negatives=True)
+            batches = list(loader)
+            assert len(batches) == len(loader) == 3
+            assert eq(cat([b['h'] for b in batches]), kg.head_idx).all()
+            assert eq(cat([b['r'] for b in batches]), kg.relations).all()
+            for b in batches:
+                # each negative fact differs from the positive one by its
+                # head or its tail
+                assert ((b['nh'] == b['h']) | (b['nt'] == b['t'])).all()
+
+            counter_examples = loader.get_counter_examples()
+            assert len(counter_examples) == len(kg)
+            assert eq(counter_examples.head_idx,
+                      cat([b['nh'] for b in batches])).all()
+
+        for streaming in [False, True]:
+            loader = TrainDataLoader(kg, batch_size=4, sampling_type='unif',
+                                     streaming=streaming,
+                                     record_negatives=True, n_neg=3)
+            batches = list(loader)
+            for b in batches:
+                assert len(b['nh']) == len(b['nt']) == 3 * len(b['h'])
+                # the j-th negative of the i-th fact is at index
+                # j * batch_size + i
+                assert ((b['nh'] == b['h'].repeat(3)) |
+                        (b['nt'] == b['t'].repeat(3))).all()
+            assert len(loader.get_counter_examples()) == 3 * len(kg)
+
+        loader = TrainDataLoader(kg, batch_size=4, sampling_type='unif',
+                                 streaming=True)
+        next(iter(loader))
+        with self.assertRaises(WrongArgumentsError):
+            loader.get_counter_examples()
+
+        # iterations stopped early do not leave prefetching threads behind
+        loader = TrainDataLoader(kg, batch_size=4, sampling_type='unif',
+                                 streaming=True, prefetch=True)
+        next(iter(loader))
+        n_threads = active_count()
+        for _ in range(5):
+            next(iter(loader))
+        assert active_count() == n_threads
+        assert len(list(loader)) == 3
+
+    def test_Trainer(self):
+        kg = KnowledgeGraph(self.df)
+        model = TransEModel(10, kg.n_ent, kg.n_rel)
+        for streaming in [False, True]:
+            trainer = Trainer(model, MarginLoss(0.5), kg, n_epochs=2,
+                              batch_size=4,
+                              optimizer=Adam(model.parameters()),
+                              streaming=streaming, prefetch=True)
+            assert trainer.get_counter_examples() is None
+            trainer.run()
+            assert (trainer.get_counter_examples() is None) == streaming
+
+    def test_hogwild(self):
+        kg = KnowledgeGraph(self.df)
+        shards = shard_kg(kg, 3)
+        assert sum(len(s) for s in shards) == len(kg)
+        pairs = cat([s.head_idx * kg.n_ent + s.tail_idx for s in shards])
+        assert len(set(pairs.tolist())) == len(kg)
+
+        model = TransEModel(10, kg.n_ent, kg.n_rel)
+        before = model.rel_emb.weight.detach().clone()
+        trainer = Trainer(model, MarginLoss(0.5), kg, n_epochs=2, batch_size=2,
+                          optimizer=Adam(model.parameters()), n_workers=2)
+        trainer.run()
+        # workers updated the shared parameters and the first one normalized
+        # them
+        assert not eq(model.rel_emb.weight, before).all()
+        assert isclose(model.ent_emb.weight.norm(dim=1), tensor(1.)).all()
+        assert trainer.get_counter_examples() is None
+
+        with self.assertRaises(WrongArgumentsError):
+            Trainer(model, MarginLoss(0.5), kg, n_epochs=2, batch_size=2,
+                    optimizer=Adam(model.parameters()), use_cuda='all',
+                    n_workers=2)
+
+        # workers keep the options of each parameter group and are paused
+        # while the checkpoint is saved
+        model = TransEModel(10, kg.n_ent, kg.n_rel)
+        before = model.rel_emb.weight.detach().clone()
+        optimizer = Adam([{'params': [model.ent_emb.weight]},
+                          {'params': [model.rel_emb.weight], 'lr': 0.}])
+        assert get_param_groups(model, optimizer)[1]['params'] == [1]
+        with TemporaryDirectory() as directory:
+            trainer = Trainer(model, MarginLoss(0.5), kg, n_epochs=2,
+                              batch_size=2, optimizer=optimizer, n_workers=2,
+                              checkpoint=join(directory, 'checkpoint.pt'))
+            trainer.run()
+            checkpoint = load(join(directory, 'checkpoint.pt'))
+        assert eq(model.rel_emb.weight, before).all()
+        for name, value in model.state_dict().items():
+            assert eq(checkpoint[name], value).all()
+
+    def test_distributed(self):
+        kg = KnowledgeGraph(self.df)
+        with TemporaryDirectory() as directory:
+            start_processes(train_distributed, args=(kg, directory),
+                            nprocs=2, start_method='fork')
+            states = [load(join(directory, '{}.pt'.format(rank)))
+                      for rank in range(2)]
+            sparse_states = [load(join(directory,
+                                       'sparse_{}.pt'.format(rank)))
+                             for rank in range(2)]
+            checkpoint = load(join(directory, 'checkpoint.pt'))
+        # ranks start from the same parameters and apply the same averaged
+        # updates
+        for k in states[0].keys():
+            assert isclose(states[0][k], states[1][k]).all()
+            assert isclose(states[0][k], checkpoint[k]).all()
+            assert isclose(sparse_states[0][k], sparse_states[1][k]).all()
+        norms = sparse_states[0]['ent_emb.weight'].norm(dim=1)
+        assert isclose(norms, tensor(1.)).all()
+
+    def test_sparse(self):
+        kg = KnowledgeGraph(self.df)
+        # entities 6 to 105 never appear in the graph
+        kg.n_ent += 100
+        for optimizer in [SparseAdam, Adagrad]:
+            model = TransEModel(10, kg.n_ent, kg.n_rel, sparse=True)
+            model.ent_emb.weight.data *= 2
+            before = model.ent_emb.weight.detach().clone()
+            trainer = Trainer(model, MarginLoss(0.5), kg, n_epochs=1,
+                              batch_size=4,
+                              optimizer=optimizer(model.parameters()),
+                              sampling_type='unif')
+            trainer.run()
+            assert model.ent_emb.weight.grad.is_sparse
+            # only the rows touched during the epoch were normalized
+            normalized = isclose(model.ent_emb.weight.norm(dim=1), tensor(1.))
+            unchanged = eq(model.ent_emb.weight, before).all(dim=1)
+            assert normalized[:6].all() and (normalized | unchanged).all()
+            assert unchanged.sum() >= 100 - 9
+
+        model = TransDModel(4, 3, kg.n_ent, kg.n_rel, sparse=True)
+        model.ent_emb.weight.data *= 2
+        model.ent_proj_vect.weight.data *= 2
+        model.normalize_parameters(tensor([1, 2]))
+        norms = model.ent_emb.weight.norm(dim=1)
+        assert isclose(norms[1:3], tensor(1.)).all()
+        assert isclose(norms[3:], tensor(2.)).all()
+        proj_norms = model.ent_proj_vect.weight[1:3].norm(dim=1)
+        assert isclose(proj_norms, tensor(1.)).all()
+
+    def test_dirty_entities(self):
+        kg = KnowledgeGraph(self.df)
+        model = TransEModel(10, kg.n_ent, kg.n_rel)
+        assert not model.dirty_entities.any()
+        model.ent_emb.weight.data *= 2
+
+        h, t, r = tensor([0, 1]), tensor([2, 2]), tensor([0, 1])
+        with no_grad():
+            model(h, t, r, h, tensor([3, 3]))
+        assert not model.dirty_entities.any()
+        model(h, t, r, h, tensor([3, 3]))
+        dirty = tensor([1, 1, 1, 1, 0, 0]).bool()
+        assert eq(model.dirty_entities, dirty).all()
+        assert eq(model.get_dirty_entities(), tensor([0, 1, 2, 3])).all()
+
+        model.normalize_parameters(model.get_dirty_entities())
+        norms = model.ent_emb.weight.norm(dim=1)
+        assert isclose(norms[:4], tensor(1.)).all()
+        assert isclose(norms[4:], tensor(2.)).all()
+        assert not model.dirty_entities.any()
+
+        # without indices, all entities are normalized whatever their state
+        model.ent_emb.weight.data *= 2
+        model.normalize_parameters()
+        assert isclose(model.ent_emb.weight.norm(dim=1), tensor(1.)).all()
+        assert not model.dirty_entities.any()
+
+        model.load_state_dict(model.state_dict())
+        assert model.get_dirty_entities() is None
+        model.normalize_parameters()
+
+        # with constrained training, entities are normalized after each step
+        trainer = Trainer(model, MarginLoss(0.5), kg, n_epochs=1, batch_size=4,
+                          optimizer=SGD(model.parameters(), lr=1.),
+                          constrained=True)
+        trainer.process_batch({'h': h, 't': t, 'r': r,
+                               'nh': h, 'nt': tensor([3, 3])})
+        assert isclose(model.ent_emb.weight.norm(dim=1), tensor(1.)).all()
+        assert not model.dirty_entities.any()
+
+    def test_PartitionedTrainer(self):
+        kg = KnowledgeGraph(self.df)
+        n_resident = PartitionedTrainer.get_n_resident(kg.n_ent, 3)
+        assert n_resident == 4
+        with TemporaryDirectory() as directory:
+            with self.assertRaises(WrongArgumentsError):
+                model = TransEModel(10, kg.n_ent, kg.n_rel)
+                PartitionedTrainer(model, MarginLoss(0.5), kg, 2, 2,
+                                   SGD(model.parameters(), lr=.1),
+                                   n_partitions=3, directory=directory)
+
+            model = TransEModel(10, n_resident, kg.n_rel)
+            trainer = PartitionedTrainer(model, MarginLoss(5.), kg, 2, 2,
+                                         SGD(model.parameters(), lr=.1),
+                                         n_partitions=3, directory=directory,
+                                         sampling_type='unif')
+            for k in range(9):
+                start, end = trainer.bucket_offsets[k:k + 2]
+                facts = trainer.bucket_facts[start:end]
+                assert (kg.head_idx[facts] // 2 == k // 3).all()
+                assert (kg.tail_idx[facts] // 2 == k % 3).all()
+
+            before = tensor(trainer.embeddings['ent_emb'])
+            assert isclose(before.norm(dim=1), tensor(1.)).all()
+            # a negative fact can be equal to its positive one, in which case
+            # its entities are not updated
+            manual_seed(0)
+            trainer.run()
+            assert len(trainer.losses) == 2
+            after = tensor(load_npy(join(directory, 'ent_emb.npy')))
+            assert after.shape == (kg.n_ent, 10)
+            # all entities appear in the graph and were trained
+            assert not eq(after, before).all(dim=1).any()
+            assert isclose(after.norm(dim=1), tensor(1.)).all()
+
+    def test_n_neg(self):
+        kg = KnowledgeGraph(self.df)
+        model = TransEModel(10, kg.n_ent, kg.n_rel)
+        h, t, r = kg.head_idx[:4], kg.tail_idx[:4], kg.relations[:4]
+        nh, nt = BernoulliNegativeSampler(kg, n_neg=3).corrupt_batch(h, t, r)
+        pos, neg = model(h, t, r, nh, nt)
+        assert neg.shape == (4, 3)
+        assert (neg[:, 1] == model.scoring_function(nh[4:8], nt[4:8], r)).all()
+        assert isclose(MarginLoss(0.5)(pos, neg),
+                       MarginLoss(0.5)(pos.repeat(3), neg.t().flatten()))
+
+        trainer = Trainer(model, MarginLoss(0.5), kg, n_epochs=1, batch_size=4,
+                          optimizer=Adam(model.parameters()), n_neg=3)
+        trainer.run()
+        assert len(trainer.get_counter_examples()) == 3 * len(kg)
+
+    def test_index_dtype(self):
+        for dtype in [int16, int32]:
+            kg = KnowledgeGraph(self.df, index_dtype=dtype)
+            kg_syn = synthetic_kg(50, 4, 400).astype(dtype)
+            kg_tr, kg_val, kg_te = kg_syn.split_kg(validation=True)
+            assert kg_tr.index_dtype == kg_te.relations.dtype == dtype
+            for sampler in [UniformNegativeSampler(kg, n_neg=2),
+                            BernoulliNegativeSampler(kg, n_neg=2),
+                            PositionalNegativeSampler(kg, n_neg=2),
+                            BernoulliRelationNegativeSampler(kg, n_neg=2)]:
+                negatives = sampler.corrupt_batch(kg.head_idx, kg.tail_idx,
+                                                  kg.relations)
+                assert all(n.dtype == dtype and len(n) == 2 * len(kg)
+                           for n in negatives)
+                if len(negatives) == 2:
+                    assert sampler.corrupt_kg(4, False)[0].dtype == dtype
+
+            for streaming in [False, True]:
+                batch = next(iter(TrainDataLoader(kg, 4, 'bern',
+                                                  streaming=streaming)))
+                assert batch['h'].dtype == batch['nt'].dtype == dtype
+            model = TransEModel(10, kg.n_ent, kg.n_rel)
+            pos, neg = model(batch['h'], batch['t'], batch['r'], batch['nh'],
+                             batch['nt'])
+            pos_long, _ = model(batch['h'].long(), batch['t'].long(),
+                                batch['r'].long(), batch['nh'].long(),
+                                batch['nt'].long())
+            assert isclose(pos, pos_long).all()
+
+            for model in [TransEModel(10, kg_tr.n_ent, kg_tr.n_rel),
+                          TransDModel(10, 10, kg_tr.n_ent, kg_tr.n_rel)]:
+                Trainer(model, MarginLoss(0.5), kg_tr, n_epochs=1,
+                        batch_size=64, optimizer=Adam(model.parameters()),
+                        constrained=True).run()
+                evaluator = LinkPredictionEvaluator(model, kg_te)
+                evaluator.evaluate(16, verbose=False)
+                reference = LinkPredictionEvaluator(model, kg_te.astype(int64))
+                reference.evaluate(16, verbose=False)
+                assert eq(evaluator.filt_rank_true_tails,
+                          reference.filt_rank_true_tails).all()
+                assert eq(evaluator.rank_true_heads,
+                          reference.rank_true_heads).all()
+
+                evaluator = RelationPredictionEvaluator(model, kg_te)
+                evaluator.evaluate(16, verbose=False)
+                reference = RelationPredictionEvaluator(model,
+                                                        kg_te.astype(int64))
+                reference.evaluate(16, verbose=False)
+                assert eq(evaluator.filt_rank_true_rels,
+                          reference.filt_rank_true_rels).all()
+
+    def test_StageTimer(self):
+        kg = KnowledgeGraph(self.df)
+        model = TransEModel(10, kg.n_ent, kg.n_rel)
+        received = []
+        timer = StageTimer(callback=received.append)
+        trainer = Trainer(model, MarginLoss(0.5), kg, n_epochs=2, batch_size=4,
+                          optimizer=Adam(model.parameters()),
+                          constrained=True, timer=timer)
+        trainer.run()
+        report = received[-1]
+        assert isinstance(report, TimingReport)
+        assert report.n_batches == len(received) - 1 == 6
+        assert report.n_facts == 2 * len(kg)
+        assert report.facts_per_sec > 0
+        assert list(report.stages) == ['sampling', 'forward', 'backward',
+                                       'step', 'normalize']
+        assert received[0]['epoch'] == 0 and received[-2]['epoch'] == 1
+        assert all(r['time'] >= sum(r[s] for s in report.stages)
+                   for r in report.records)
+
+        with TemporaryDirectory() as directory:
+            path = join(directory, 'trace.json')
+            timer = StageTimer(profile=True, trace_path=path)
+            Trainer(model, MarginLoss(0.5), kg, n_epochs=1, batch_size=4,
+                    optimizer=Adam(model.parameters()), timer=timer).run()
+            with open(path) as f:
+                assert 'forward' in f.read()
+
+    def test_benchmarks(self):
+        patterns = ['split_kg', 'sampler.*', 'train.*', 'link_prediction.*']
+        results = run_benchmarks(patterns, models=['TransE'], n_ent=50,
+                                 n_rel=5, n_facts=500, batch_size=64,
+                                 n_eval=20, n_calls=2, warmup=0)
+        assert list(results['results']) == ['split_kg', 'sampler.uniform',
+                                            'sampler.bernoulli',
+                                            'sampler.positional',
+                                            'sampler.bernoulli_relation',
+                                            'train.TransE',
+                                            'link_prediction.TransE']
+        result = results['results']['train.TransE']
+        assert result['n_calls'] == 2 and result['items_per_call'] == 64
+        assert result['throughput'] > 0
+        latency = result['latency']
+        assert latency['min'] <= latency['p50'] <= latency['max']
+        assert results['settings']['n_facts'] == 500
+
+        results = json.loads(json.dumps(results))
+        assert all(v == 1 for v in compare(results, results).values())
+
+    def test_synthetic_kg(self):
+        kg = synthetic_kg(1000, 20, 20000, seed=1)
+        assert isinstance(kg, KnowledgeGraph)
+        assert len(kg) == 20000 and kg.n_ent == 1000 and kg.n_rel == 20
+        h, t, r = kg.head_idx, kg.tail_idx, kg.relations
+        assert len(((h * kg.n_rel + r) * kg.n_ent + t).unique()) == len(kg)
+        assert (h != t).all()
+
+        # entity degrees and relation frequencies are skewed
+        degrees = bincount(h, minlength=1000) + bincount(t, minlength=1000)
+        degrees = degrees.sort(descending=True)[0]
+        assert degrees[:10].sum() > 0.1 * degrees.sum()
+        assert bincount(r).max() > 5 * len(kg) / kg.n_rel
+
+        generator = KGGenerator(1000, 20, seed=1)
+        types = generator.relation_types[r]
+        for kind, entities in [(0, h), (0, t), (1, t), (2, h)]:
+            # 1-1: one fact per (h, r) and (t, r), 1-N: per (t, r),
+            # N-1: per (h, r)
+            keys = entities[types == kind] * kg.n_rel + r[types == kind]
+            assert len(keys.unique()) == len(keys) > 0
+
+        assert eq(generator.generate(20000)['heads'], h).all()
+        chunks = list(KGGenerator(1000, 20).chunks(1000, chunk_size=300))
+        assert sum(len(c[0]) for c in chunks) >= 1000
+        assert max(len(c[0]) for c in chunks) <= 300
+
+        with self.assertRaises(WrongArgumentsError):
+            KGGenerator(1000, 20, cardinalities=(1., 0.))
+
+    def test_lazy_imports(self):
+        code = '; '.join(['import sys, torchkge',
+                          'from torchkge import TransEModel, KnowledgeGraph',
+                          'from torchkge.utils import Trainer, MarginLoss',
+                          'assert "pandas" not in sys.modules',
+                          'assert "TransEModel" in dir(torchkge.models)',
+                          'torchkge.utils.load_fb15k',
+                          'assert "pandas" in sys.modules'])
+        subprocess.run([sys.executable, '-c', code], check=True)
+
+        import torchkge
+        assert torchkge.TransEModel is TransEModel
+        with self.assertRaises(AttributeError):
+            torchkge.NoSuchModel
+
     def test_get_mask(self):
         m = get_mask(10, 1, 2)
         assert m.dtype == bool
@@ -161,3 +638,24 @@ class TestUtils(unittest.TestCase):
 
         assert eq(r1, tensor([5, 4])).all()
         assert eq(r2, tensor([1, 3])).all()
+
+
+def train_distributed(rank, kg, directory):
+    init_process_group('gloo',
+                       init_method='file://' + join(directory, 'store'),
+                       rank=rank, world_size=2)
+    model = TransEModel(10, kg.n_ent, kg.n_rel)
+    trainer = Trainer(model, MarginLoss(0.5), kg, n_epochs=2, batch_size=2,
+                      optimizer=Adam(model.parameters()), distributed=True,
+                      checkpoint=join(directory, 'checkpoint.pt'))
+    trainer.run()
+    assert len(trainer.losses) == 2
+    save(model.state_dict(), join(directory, '{}.pt'.format(rank)))
+
+    model = TransEModel(10, kg.n_ent, kg.n_rel, sparse=True)
+    trainer = Trainer(model, MarginLoss(0.5), kg, n_epochs=2, batch_size=2,
+                      optimizer=SGD(model.parameters(), lr=.1),
+                      distributed=True, constrained=True)
+    trainer.run()
+    save(model.state_dict(), join(directory, 'sparse_{}.pt'.format(rank)))
+    destroy_process_group()
@@ -6,12 +6,48 @@ __author__ = """Armand Boschin"""
 __email__ = 'aboschin@enst.fr'
 __version__ = '0.17.7'
 
-from torchkge.exceptions import NotYetEvaluatedError
-from torchkge.utils import MarginLoss, LogisticLoss
-from torchkge.utils import l1_dissimilarity, l2_dissimilarity
-from .data_structures import KnowledgeGraph
-from .evaluation import LinkPredictionEvaluator
-from .evaluation import TripletClassificationEvaluator
-from .models import ConvKBModel
-from .models import RESCALModel, DistMultModel, HolEModel, ComplExModel, AnalogyModel
-from .models import TransEModel, TransHModel, TransRModel, TransDModel, TorusEModel
+from importlib import import_module
+
+# public names are imported from their module the first time they are
+# accessed (PEP 562) so that `import torchkge` stays cheap
+_LAZY = {
+    'NotYetEvaluatedError': 'torchkge.exceptions',
+    'MarginLoss': 'torchkge.utils',
+    'LogisticLoss': 'torchkge.utils',
+    'l1_dissimilarity': 'torchkge.utils',
+    'l2_dissimilarity': 'torchkge.utils',
+    'KnowledgeGraph': 'torchkge.data_structures',
+    'LinkPredictionEvaluator': 'torchkge.evaluation',
+    'TripletClassificationEvaluator': 'torchkge.evaluation',
+    'ConvKBModel': 'torchkge.models',
+    'RESCALModel': 'torchkge.models',
+    'DistMultModel': 'torchkge.models',
+    'HolEModel': 'torchkge.models',
+    'ComplExModel': 'torchkge.models',
+    'AnalogyModel': 'torchkge.models',
+    'TransEModel': 'torchkge.models',
+    'TransHModel': 'torchkge.models',
+    'TransRModel': 'torchkge.models',
+    'TransDModel': 'torchkge.models',
+    'TorusEModel': 'torchkge.models',
+}
+_SUBMODULES = ['data_structures', 'evaluation', 'exceptions', 'inference',
+               'models', 'sampling', 'utils']
+
+__all__ = list(_LAZY)
+
+
+def __getattr__(name):
+    if name in _LAZY:
+        value = getattr(import_module(_LAZY[name]), name)
+    elif name in _SUBMODULES:
+        value = import_module('torchkge.' + name)
+    else:
+        raise AttributeError('module {!r} has no attribute {!r}'.format(
+            __name__, name))
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY) | set(_SUBMODULES))
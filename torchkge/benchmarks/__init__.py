@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks of the hot paths of TorchKGE on synthetic knowledge graphs.
+They can be run from the command line with `python -m torchkge.benchmarks`.
+"""
+
+from .suite import BenchmarkData, MODELS, SAMPLERS
+from .suite import compare, get_benchmarks, measure, run_benchmarks, summarize
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright TorchKGE developers
+@author: Armand Boschin <aboschin@enst.fr>
+
+Run the benchmarks of the hot paths of TorchKGE and write the results as JSON,
+e.g.::
+
+    python -m torchkge.benchmarks --only 'sampler.*' 'train.*' -o results.json
+    python -m torchkge.benchmarks --n-facts 1000000 --models TransE
+    python -m torchkge.benchmarks --baseline results.json
+
+"""
+import json
+import sys
+
+from argparse import ArgumentParser
+
+from torch import set_num_threads
+
+from .suite import MODELS, compare, get_benchmarks, run_benchmarks
+
+
+def get_parser():
+    parser = ArgumentParser(prog='python -m torchkge.benchmarks',
+                            description='Benchmark the hot paths of TorchKGE '
+                                        'on a synthetic knowledge graph.')
+    parser.add_argument('--n-ent', type=int, default=10000,
+                        help='number of entities')
+    parser.add_argument('--n-rel', type=int, default=100,
+                        help='number of relations')
+    parser.add_argument('--n-facts', type=int, default=100000,
+                        help='number of facts')
+    parser.add_argument('--batch-size', type=int, default=1024)
+    parser.add_argument('--dim', type=int, default=50,
+                        help='embedding dimension of the models')
+    parser.add_argument('--n-eval', type=int, default=1000,
+                        help='number of facts used in evaluation and '
+                             'inference')
+    parser.add_argument('--n-calls', type=int, default=5,
+                        help='number of timed calls of each benchmark')
+    parser.add_argument('--warmup', type=int, default=1,
+                        help='number of untimed calls of each benchmark')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--n-threads', type=int, default=None,
+                        help='number of threads used by torch')
+    parser.add_argument('--only', nargs='+', default=None, metavar='PATTERN',
+                        help='shell-style patterns of the benchmarks to run '
+                             "(e.g. 'sampler.*')")
+    parser.add_argument('--models', nargs='+', default=None,
+                        choices=list(MODELS),
+                        help='models used in training and link prediction')
+    parser.add_argument('--isolate', action='store_true',
+                        help='run each benchmark in a new process to measure '
+                             'its own peak RSS')
+    parser.add_argument('--baseline', default=None,
+                        help='JSON results of a previous run to compare the '
+                             'throughputs with')
+    parser.add_argument('-o', '--output', default=None,
+                        help='path of the JSON output (default: stdout)')
+    parser.add_argument('--list', action='store_true',
+                        help='list the benchmarks and exit')
+    return parser
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+
+    if args.list:
+        for name in get_benchmarks(args.models):
+            print(name)
+        return
+
+    if args.n_threads is not None:
+        set_num_threads(args.n_threads)
+
+    def callback(name, result):
+        line = '{:<30} {:>14.1f} items/s  p50 {:.2e}s'
+        print(line.format(name, result['throughput'],
+                          result['latency']['p50']), file=sys.stderr)
+
+    results = run_benchmarks(args.only, args.models, args.isolate, callback,
+                             n_ent=args.n_ent, n_rel=args.n_rel,
+                             n_facts=args.n_facts,
+                             batch_size=args.batch_size, dim=args.dim,
+                             n_eval=args.n_eval, n_calls=args.n_calls,
+                             warmup=args.warmup, seed=args.seed)
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            results['speedup'] = compare(json.load(f), results)
+
+    if args.output is None:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,438 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright TorchKGE developers
+@author: Armand Boschin <aboschin@enst.fr>
+"""
+import platform
+import subprocess
+import sys
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from fnmatch import fnmatch
+from functools import partial
+from multiprocessing import get_context
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+import torch
+
+from torch import get_num_threads, set_num_threads
+from torch.optim import Adam
+
+from .. import __version__
+from ..data_structures import KnowledgeGraph
+from ..evaluation import LinkPredictionEvaluator
+from ..inference import EntityInference, RelationInference
+from ..models import TransEModel, TransHModel, TransRModel, TransDModel, \
+    TorusEModel, RESCALModel, DistMultModel, HolEModel, ComplExModel, \
+    AnalogyModel, ConvKBModel
+from ..sampling import UniformNegativeSampler, BernoulliNegativeSampler, \
+    PositionalNegativeSampler, BernoulliRelationNegativeSampler
+from ..utils.losses import MarginLoss
+from ..utils.profiling import get_peak_memory
+from ..utils.synthetic import KGGenerator
+from ..utils.training import TrainDataLoader, process_batch
+
+MODELS = OrderedDict([
+    ('TransE', lambda dim, n_ent, n_rel: TransEModel(dim, n_ent, n_rel, 'L2')),
+    ('TransH', lambda dim, n_ent, n_rel: TransHModel(dim, n_ent, n_rel)),
+    ('TransR', lambda dim, n_ent, n_rel: TransRModel(dim, dim, n_ent, n_rel)),
+    ('TransD', lambda dim, n_ent, n_rel: TransDModel(dim, dim, n_ent, n_rel)),
+    ('TorusE', lambda dim, n_ent, n_rel: TorusEModel(dim, n_ent, n_rel,
+                                                     'torus_L2')),
+    ('RESCAL', lambda dim, n_ent, n_rel: RESCALModel(dim, n_ent, n_rel)),
+    ('DistMult', lambda dim, n_ent, n_rel: DistMultModel(dim, n_ent, n_rel)),
+    ('HolE', lambda dim, n_ent, n_rel: HolEModel(dim, n_ent, n_rel)),
+    ('ComplEx', lambda dim, n_ent, n_rel: ComplExModel(dim, n_ent, n_rel)),
+    ('Analogy', lambda dim, n_ent, n_rel: AnalogyModel(dim, n_ent, n_rel)),
+    ('ConvKB', lambda dim, n_ent, n_rel: ConvKBModel(dim, 3, n_ent, n_rel)),
+])
+
+SAMPLERS = OrderedDict([
+    ('uniform', UniformNegativeSampler),
+    ('bernoulli', BernoulliNegativeSampler),
+    ('positional', PositionalNegativeSampler),
+    ('bernoulli_relation', BernoulliRelationNegativeSampler),
+])
+
+
+class BenchmarkData(object):
+    """Synthetic knowledge graph and settings shared by the benchmarks. The
+    graph is only built the first time it is needed.
+
+    Parameters
+    ----------
+    n_ent: int
+        Number of entities.
+    n_rel: int
+        Number of relations.
+    n_facts: int
+        Number of facts of the synthetic graph, generated by a
+        :class:`torchkge.utils.synthetic.KGGenerator`.
+    batch_size: int
+        Number of facts in the batches of samplers, training and evaluation.
+    dim: int
+        Embedding dimension of the models.
+    n_eval: int
+        Number of facts used in the evaluation and inference benchmarks.
+    n_calls: int
+        Number of timed calls of each benchmark.
+    warmup: int
+        Number of untimed calls made before the timed ones.
+    seed: int
+        Seed of the random generator.
+
+    """
+    def __init__(self, n_ent=10000, n_rel=100, n_facts=100000,
+                 batch_size=1024, dim=50, n_eval=1000, n_calls=5, warmup=1,
+                 seed=0):
+        self.n_ent = n_ent
+        self.n_rel = n_rel
+        self.n_facts = n_facts
+        self.batch_size = batch_size
+        self.dim = dim
+        self.n_eval = n_eval
+        self.n_calls = n_calls
+        self.warmup = warmup
+        self.seed = seed
+
+        self._tensors = None
+        self._kg = None
+
+    @property
+    def tensors(self):
+        if self._tensors is None:
+            generator = KGGenerator(self.n_ent, self.n_rel, seed=self.seed)
+            kg = generator.generate(self.n_facts)
+            self._tensors = kg['heads'], kg['tails'], kg['relations']
+        return self._tensors
+
+    @property
+    def kg(self):
+        if self._kg is None:
+            self._kg = self.new_kg()
+        return self._kg
+
+    @property
+    def ent2ix(self):
+        return {i: i for i in range(self.n_ent)}
+
+    @property
+    def rel2ix(self):
+        return {i: i for i in range(self.n_rel)}
+
+    def new_kg(self):
+        heads, tails, relations = self.tensors
+        return KnowledgeGraph(kg={'heads': heads, 'tails': tails,
+                                  'relations': relations},
+                              ent2ix=self.ent2ix, rel2ix=self.rel2ix)
+
+    def eval_kg(self):
+        """Return the first `n_eval` facts as a knowledge graph sharing the
+        filter indexes of the whole graph."""
+        n = min(self.n_eval, len(self.kg))
+        return KnowledgeGraph(kg={'heads': self.kg.head_idx[:n],
+                                  'tails': self.kg.tail_idx[:n],
+                                  'relations': self.kg.relations[:n]},
+                              ent2ix=self.kg.ent2ix, rel2ix=self.kg.rel2ix,
+                              index_of_heads=self.kg.index_of_heads,
+                              index_of_tails=self.kg.index_of_tails,
+                              index_of_rels=self.kg.index_of_rels)
+
+    def batch_slices(self, n):
+        """Return `n` slices of `batch_size` facts, cycling over the graph."""
+        n_batches = max(len(self.kg) // self.batch_size, 1)
+        return [slice((i % n_batches) * self.batch_size,
+                      (i % n_batches + 1) * self.batch_size)
+                for i in range(n)]
+
+    def settings(self):
+        return {'n_ent': self.n_ent, 'n_rel': self.n_rel,
+                'n_facts': self.n_facts, 'batch_size': self.batch_size,
+                'dim': self.dim, 'n_eval': self.n_eval,
+                'n_calls': self.n_calls, 'warmup': self.warmup,
+                'seed': self.seed}
+
+
+def measure(function, n_calls, n_items, warmup=1):
+    """Time `n_calls` calls `function(i)` after `warmup` untimed ones.
+
+    Parameters
+    ----------
+    function: function
+        Function taking the index of the call.
+    n_calls: int
+        Number of timed calls.
+    n_items: int
+        Number of items (e.g. facts) processed by each call.
+    warmup: int
+        Number of untimed calls.
+
+    Returns
+    -------
+    result: dict
+        Number of calls, items per call, throughput in items per second,
+        latency statistics of the calls in seconds (mean, min, p50, p90, p99,
+        max) and peak resident set size of the process in bytes (it is that
+        of the benchmarking process for import benchmarks).
+
+    """
+    for i in range(warmup):
+        function(i)
+    times = []
+    for i in range(warmup, warmup + n_calls):
+        start = perf_counter()
+        function(i)
+        times.append(perf_counter() - start)
+    return summarize(times, n_items)
+
+
+def summarize(times, n_items):
+    """Return the result of :func:`torchkge.benchmarks.measure` for calls
+    of durations `times` processing `n_items` items each."""
+    n_calls = len(times)
+    times = np.array(times)
+    return {'n_calls': n_calls,
+            'items_per_call': n_items,
+            'throughput':
+                n_calls * n_items / times.sum() if times.sum() > 0 else 0.,
+            'latency': {'mean': times.mean(), 'min': times.min(),
+                        'p50': np.percentile(times, 50),
+                        'p90': np.percentile(times, 90),
+                        'p99': np.percentile(times, 99), 'max': times.max()},
+            'peak_rss': get_peak_memory()}
+
+
+def bench_knowledge_graph(data):
+    heads, tails, relations = data.tensors
+    ent2ix, rel2ix = data.ent2ix, data.rel2ix
+
+    def call(i):
+        KnowledgeGraph(kg={'heads': heads, 'tails': tails,
+                           'relations': relations},
+                       ent2ix=ent2ix, rel2ix=rel2ix)
+    return measure(call, data.n_calls, len(heads), data.warmup)
+
+
+def bench_knowledge_graph_df(data):
+    df = pd.DataFrame({'from': data.tensors[0].numpy(),
+                       'to': data.tensors[1].numpy(),
+                       'rel': data.tensors[2].numpy()})
+
+    def call(i):
+        KnowledgeGraph(df)
+    return measure(call, data.n_calls, len(df), data.warmup)
+
+
+def bench_split_kg(data):
+    kg = data.kg
+
+    def call(i):
+        kg.split_kg(share=0.8)
+    return measure(call, data.n_calls, len(kg), data.warmup)
+
+
+def bench_sampler(data, sampler):
+    kg = data.kg
+    sampler = SAMPLERS[sampler](kg)
+    slices = data.batch_slices(data.warmup + data.n_calls)
+
+    def call(i):
+        s = slices[i]
+        sampler.corrupt_batch(kg.head_idx[s], kg.tail_idx[s], kg.relations[s])
+    return measure(call, data.n_calls, len(kg.head_idx[slices[0]]),
+                   data.warmup)
+
+
+def bench_training(data, model):
+    kg = data.kg
+    model = MODELS[model](data.dim, kg.n_ent, kg.n_rel)
+    criterion = MarginLoss(0.5)
+    optimizer = Adam(model.parameters(), lr=1e-3)
+
+    # batches are drawn beforehand so that only the optimization step is timed
+    batches = []
+    while len(batches) < data.warmup + data.n_calls:
+        batches.extend(TrainDataLoader(kg, data.batch_size, 'bern'))
+
+    def call(i):
+        process_batch(model, criterion, optimizer, batches[i])
+    return measure(call, data.n_calls, len(batches[0]['h']), data.warmup)
+
+
+def bench_link_prediction(data, model):
+    kg = data.eval_kg()
+    model = MODELS[model](data.dim, kg.n_ent, kg.n_rel)
+
+    def call(i):
+        LinkPredictionEvaluator(model, kg).evaluate(data.batch_size,
+                                                    verbose=False)
+    return measure(call, data.n_calls, len(kg), data.warmup)
+
+
+def bench_relation_inference(data):
+    kg = data.eval_kg()
+    model = MODELS['TransE'](data.dim, kg.n_ent, kg.n_rel)
+
+    def call(i):
+        inference = RelationInference(model, kg.head_idx, kg.tail_idx,
+                                      top_k=10, dictionary=kg.index_of_rels)
+        inference.evaluate(data.batch_size, verbose=False)
+    return measure(call, data.n_calls, len(kg), data.warmup)
+
+
+def bench_entity_inference(data):
+    kg = data.eval_kg()
+    model = MODELS['TransE'](data.dim, kg.n_ent, kg.n_rel)
+
+    def call(i):
+        inference = EntityInference(model, kg.head_idx, kg.relations,
+                                    top_k=10, missing='tails',
+                                    dictionary=kg.index_of_tails)
+        inference.evaluate(data.batch_size, verbose=False)
+    return measure(call, data.n_calls, len(kg), data.warmup)
+
+
+IMPORTS = OrderedDict([
+    ('torchkge', 'import torchkge'),
+    ('model', 'from torchkge.models import TransEModel'),
+    ('training', 'from torchkge.utils import Trainer, MarginLoss'),
+    ('evaluation', 'from torchkge.evaluation import LinkPredictionEvaluator'),
+    ('datasets', 'from torchkge.utils.datasets import load_fb15k'),
+])
+
+# torch is imported first so that only the import of TorchKGE modules is timed
+IMPORT_CODE = '''import sys, time, torch
+start = time.perf_counter()
+{}
+print(time.perf_counter() - start, 'pandas' in sys.modules)
+'''
+
+
+def bench_import(data, statement):
+    """Time `statement` in new interpreters, once torch is imported. The
+    result also tells whether pandas was imported."""
+    times = []
+    for i in range(data.warmup + data.n_calls):
+        output = subprocess.run([sys.executable, '-c',
+                                 IMPORT_CODE.format(statement)],
+                                check=True, capture_output=True,
+                                text=True).stdout.split()
+        if i >= data.warmup:
+            times.append(float(output[0]))
+    result = summarize(times, 1)
+    result['pandas'] = output[1] == 'True'
+    return result
+
+
+def get_benchmarks(models=None):
+    """Return the benchmarks of the hot paths of TorchKGE.
+
+    Parameters
+    ----------
+    models: list of str, optional (default=None)
+        Names of the models (keys of `MODELS`) used in the training and link
+        prediction benchmarks. If None, all models are used.
+
+    Returns
+    -------
+    benchmarks: collections.OrderedDict
+        Keys are the names of the benchmarks and values are functions taking
+        a :class:`torchkge.benchmarks.BenchmarkData` and returning the result
+        of :func:`torchkge.benchmarks.measure`.
+
+    """
+    if models is None:
+        models = list(MODELS)
+    benchmarks = OrderedDict([('knowledge_graph', bench_knowledge_graph),
+                              ('knowledge_graph_df', bench_knowledge_graph_df),
+                              ('split_kg', bench_split_kg)])
+    for sampler in SAMPLERS:
+        benchmarks['sampler.' + sampler] = partial(bench_sampler,
+                                                   sampler=sampler)
+    for model in models:
+        benchmarks['train.' + model] = partial(bench_training, model=model)
+    for model in models:
+        benchmarks['link_prediction.' + model] = \
+            partial(bench_link_prediction, model=model)
+    benchmarks['inference.relation'] = bench_relation_inference
+    benchmarks['inference.entity'] = bench_entity_inference
+    for name, statement in IMPORTS.items():
+        benchmarks['import.' + name] = partial(bench_import,
+                                               statement=statement)
+    return benchmarks
+
+
+def run_isolated(name, models, settings, n_threads):
+    set_num_threads(n_threads)
+    return get_benchmarks(models)[name](BenchmarkData(**settings))
+
+
+def run_benchmarks(patterns=None, models=None, isolate=False, callback=None,
+                   **settings):
+    """Run the benchmarks whose names match one of `patterns`.
+
+    Parameters
+    ----------
+    patterns: list of str, optional (default=None)
+        Shell-style patterns (e.g. 'sampler.*') selecting the benchmarks to
+        run. If None, all benchmarks are run.
+    models: list of str, optional (default=None)
+        Names of the models used in the training and link prediction
+        benchmarks. If None, all models are used.
+    isolate: bool, optional (default=False)
+        If True, each benchmark is run in a new process so that its peak
+        resident set size is not that of the previous ones.
+    callback: function, optional (default=None)
+        Function called with the name and the result of each benchmark once
+        it is done.
+    settings:
+        Keyword arguments given to :class:`torchkge.benchmarks.BenchmarkData`.
+
+    Returns
+    -------
+    results: dict
+        Versions, platform and settings of the run along with the results of
+        the benchmarks.
+
+    """
+    benchmarks = get_benchmarks(models)
+    names = [n for n in benchmarks
+             if patterns is None or any(fnmatch(n, p) for p in patterns)]
+    data = BenchmarkData(**settings)
+
+    results = OrderedDict()
+    for name in names:
+        if isolate:
+            context = get_context('spawn')
+            with ProcessPoolExecutor(1, mp_context=context) as executor:
+                results[name] = executor.submit(run_isolated, name, models,
+                                                data.settings(),
+                                                get_num_threads()).result()
+        else:
+            results[name] = benchmarks[name](data)
+        if callback is not None:
+            callback(name, results[name])
+
+    return {'torchkge': __version__,
+            'torch': torch.__version__,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'n_threads': get_num_threads(),
+            'settings': data.settings(),
+            'results': results}
+
+
+def compare(baseline, results):
+    """Return the ratio of the throughputs in `results` to those in
+    `baseline` for the benchmarks present in both (outputs of
+    :func:`torchkge.benchmarks.run_benchmarks`).
+
+    """
+    before = {name: r['throughput']
+              for name, r in baseline['results'].items()}
+    return OrderedDict((name, r['throughput'] / before[name])
+                       for name, r in results['results'].items()
+                       if before.get(name, 0) > 0)
@@ -4,13 +4,27 @@ Copyright TorchKGE developers
 @author: Armand Boschin <aboschin@enst.fr>
 """
 
-from collections import defaultdict
+import json
 
-from pandas import DataFrame
-from torch import cat, eq, int64, long, randperm, tensor, Tensor, zeros_like
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from io import BytesIO
+from os import listdir, makedirs, rename
+from os.path import abspath, basename, dirname, exists, join
+from shutil import rmtree
+from tempfile import mkdtemp
+
+import numpy as np
+
+from numpy.lib.format import dtype_to_descr, write_array_header_1_0
+from torch import arange, bincount, cat, empty, from_numpy, iinfo, int16, \
+    int32, int64, long, minimum, ones, randperm, searchsorted, tensor, \
+    Tensor, zeros, zeros_like
 from torch.utils.data import Dataset
 
 from torchkge.exceptions import SizeMismatchError, WrongArgumentsError, SanityError
+from torchkge.utils.data import load_vocabulary, read_blocks, save_vocabulary
 from torchkge.utils.operations import get_dictionaries
 
 
@@ -43,6 +57,26 @@ class KnowledgeGraph(Dataset):
         Dictionary of possible relations :math:`r` so that the triple
         :math:`(h,r,t)` gives a true fact. The keys are tuples (h, t).
         This is computed if not passed as argument.
+    index_of_heads: torchkge.data_structures.FilterIndex, optional
+        Index of possible heads :math:`h` so that the triple :math:`(h,r,t)`
+        gives a true fact. The keys are pairs (t, r). This is computed if not
+        passed as argument (from `dict_of_heads` if it is given).
+    index_of_tails: torchkge.data_structures.FilterIndex, optional
+        Index of possible tails :math:`t` so that the triple :math:`(h,r,t)`
+        gives a true fact. The keys are pairs (h, r). This is computed if not
+        passed as argument (from `dict_of_tails` if it is given).
+    index_of_rels: torchkge.data_structures.FilterIndex, optional
+        Index of possible relations :math:`r` so that the triple
+        :math:`(h,r,t)` gives a true fact. The keys are pairs (h, t). This is
+        computed if not passed as argument (from `dict_of_rels` if it is
+        given).
+    index_dtype: torch.dtype, optional
+        Integer type (torch.int16, torch.int32 or torch.int64) in which the
+        indices of heads, tails and relations (and the values of the filter
+        indexes built from them) are stored. Compact types divide the memory
+        used by the graph while indices are cast to torch.long when they are
+        looked up in embeddings. If it is not given, indices should be
+        torch.long tensors.
 
 
     Attributes
@@ -64,11 +98,30 @@ class KnowledgeGraph(Dataset):
         List of the int key of tails for each fact.
     relations: torch.Tensor, dtype = torch.long, shape: (n_facts)
         List of the int key of relations for each fact.
+    index_dtype: torch.dtype
+        Type of `head_idx`, `tail_idx` and `relations`.
+    index_of_heads: torchkge.data_structures.FilterIndex
+        Index of possible heads for each pair (t, r).
+    index_of_tails: torchkge.data_structures.FilterIndex
+        Index of possible tails for each pair (h, r).
+    index_of_rels: torchkge.data_structures.FilterIndex
+        Index of possible relations for each pair (h, t).
+    dict_of_heads: collections.defaultdict
+        Dictionary version of `index_of_heads`. It is only built the first
+        time it is accessed.
+    dict_of_tails: collections.defaultdict
+        Dictionary version of `index_of_tails`. It is only built the first
+        time it is accessed.
+    dict_of_rels: collections.defaultdict
+        Dictionary version of `index_of_rels`. It is only built the first
+        time it is accessed.
 
     """
 
     def __init__(self, df=None, kg=None, ent2ix=None, rel2ix=None,
-                 dict_of_heads=None, dict_of_tails=None, dict_of_rels=None):
+                 dict_of_heads=None, dict_of_tails=None, dict_of_rels=None,
+                 index_of_heads=None, index_of_tails=None, index_of_rels=None,
+                 index_dtype=None):
 
         if df is None:
             if kg is None:
@@ -120,21 +173,356 @@ class KnowledgeGraph(Dataset):
             self.tail_idx = kg['tails']
             self.relations = kg['relations']
 
-        if dict_of_heads is None or dict_of_tails is None or dict_of_rels is None:
-            self.dict_of_heads = defaultdict(set)
-            self.dict_of_tails = defaultdict(set)
-            self.dict_of_rels = defaultdict(set)
-            self.evaluate_dicts()
+        try:
+            assert (len(self.head_idx) == len(self.tail_idx) ==
+                    len(self.relations))
+        except AssertionError:
+            raise SanityError("Please check the sanity of arguments.")
 
+        if index_dtype is None:
+            self.index_dtype = int64
+        else:
+            if index_dtype not in [int16, int32, int64]:
+                raise WrongArgumentsError('`index_dtype` should be '
+                                          'torch.int16, torch.int32 or '
+                                          'torch.int64.')
+            if max(self.n_ent, self.n_rel) - 1 > iinfo(index_dtype).max:
+                raise WrongArgumentsError('Indices of entities and relations '
+                                          'do not fit in '
+                                          '{}.'.format(index_dtype))
+            self.index_dtype = index_dtype
+            self.head_idx = self.head_idx.to(index_dtype)
+            self.tail_idx = self.tail_idx.to(index_dtype)
+            self.relations = self.relations.to(index_dtype)
+
+        self._dict_of_heads = dict_of_heads
+        self._dict_of_tails = dict_of_tails
+        self._dict_of_rels = dict_of_rels
+
+        if index_of_heads is None or index_of_tails is None or \
+                index_of_rels is None:
+            if dict_of_heads is None or dict_of_tails is None or \
+                    dict_of_rels is None:
+                self._dict_of_heads = None
+                self._dict_of_tails = None
+                self._dict_of_rels = None
+                self.evaluate_dicts()
+            else:
+                self.index_of_heads = FilterIndex.from_dict(dict_of_heads,
+                                                            self.n_rel)
+                self.index_of_tails = FilterIndex.from_dict(dict_of_tails,
+                                                            self.n_rel)
+                self.index_of_rels = FilterIndex.from_dict(dict_of_rels,
+                                                           self.n_ent)
         else:
-            self.dict_of_heads = dict_of_heads
-            self.dict_of_tails = dict_of_tails
-            self.dict_of_rels = dict_of_rels
+            self.index_of_heads = index_of_heads
+            self.index_of_tails = index_of_tails
+            self.index_of_rels = index_of_rels
         try:
             self.sanity_check()
         except AssertionError:
             raise SanityError("Please check the sanity of arguments.")
 
+    @classmethod
+    def from_files(cls, paths, sep='\t', columns=('from', 'rel', 'to'),
+                   skiprows=0, dtype=None, chunk_size=2 ** 26, n_threads=1,
+                   directory=None, index_dtype=None):
+        """Build a knowledge graph from large delimited text files without
+        loading them at once. Files are read by chunks which are parsed by
+        `pandas.read_csv` (in parallel if `n_threads` > 1). Labels are mapped
+        to their index as the chunks come, so that entities and relations
+        are indexed in the order they first appear (and not in sorted order
+        as when building from a data frame). Files are read once and the
+        indices can be written in files of `directory` as they come, so that
+        memory holds the vocabularies and a few chunks at most (along with
+        the filter indexes, which are built in memory once the files are
+        read).
+
+        Parameters
+        ----------
+        paths: str or list of str
+            Paths of the files. Lines should not hold quoted line breaks.
+        sep: str, optional (default='\\t')
+            Delimiter of the fields.
+        columns: tuple of str, optional (default=('from', 'rel', 'to'))
+            Names of the columns of the files. They should include 'from',
+            'to' and 'rel', other columns are ignored.
+        skiprows: int, optional (default=0)
+            Number of lines to skip at the beginning of each file (e.g. 1 for
+            a header).
+        dtype: type, optional (default=None)
+            Type of the labels (e.g. `str`). If None, the types of entity and
+            relation labels are inferred by pandas on the first chunk and
+            used for all chunks (labels are strings if they are not all of
+            the same numerical type in the first chunk).
+        chunk_size: int, optional (default=2**26)
+            Number of bytes parsed at once.
+        n_threads: int, optional (default=1)
+            Number of chunks parsed at the same time.
+        directory: str, optional (default=None)
+            If given, the indices of heads, tails and relations are written in
+            `.npy` files of this directory as chunks are read, and then
+            memory-mapped.
+        index_dtype: torch.dtype, optional (default=None)
+            Integer type of the indices (see
+            :class:`torchkge.data_structures.KnowledgeGraph`), which are
+            directly written in this type.
+
+        Returns
+        -------
+        kg: torchkge.data_structures.KnowledgeGraph
+
+        """
+        from pandas import factorize, read_csv
+
+        if isinstance(paths, str):
+            paths = [paths]
+        if not {'from', 'to', 'rel'}.issubset(columns):
+            raise WrongArgumentsError(
+                "`columns` should contain 'from', 'to' and 'rel'.")
+        np_dtype = empty(0, dtype=int64 if index_dtype is None
+                         else index_dtype).numpy().dtype
+        names = ['heads', 'tails', 'relations']
+
+        def read(block, types):
+            return read_csv(BytesIO(block), sep=sep, header=None,
+                            names=list(columns),
+                            usecols=['from', 'to', 'rel'], dtype=types)
+
+        def parse(block):
+            try:
+                df = read(block, types)
+            except ValueError:
+                raise WrongArgumentsError(
+                    'Some labels do not have the type {} given by `dtype` '
+                    'or inferred from the first chunk, consider passing '
+                    '`dtype=str`.'.format(types))
+            # labels of the chunk are replaced by codes of its labels
+            entities = factorize(np.concatenate((df['from'].values,
+                                                 df['to'].values)))
+            relations = factorize(df['rel'].values)
+            if (entities[0] < 0).any() or (relations[0] < 0).any():
+                raise SanityError('Some labels are missing in the files.')
+            return len(df), entities, relations
+
+        def index(codes, uniques, vocabulary):
+            ids = np.array([vocabulary.setdefault(u, len(vocabulary))
+                            for u in uniques.tolist()], dtype=np_dtype)
+            return ids[codes]
+
+        def get_header(n):
+            header = BytesIO()
+            write_array_header_1_0(header, {
+                'descr': dtype_to_descr(np_dtype), 'fortran_order': False,
+                'shape': (n,)})
+            return header.getvalue()
+
+        blocks = read_blocks(paths, chunk_size, skiprows)
+        first = next(blocks, None)
+        if first is None:
+            raise WrongArgumentsError('The files do not hold any fact.')
+        if dtype is None:
+            # types are inferred once so that all chunks read labels alike
+            df = read(first, None)
+            types = {'from': get_label_type(df['from'], df['to']),
+                     'to': get_label_type(df['from'], df['to']),
+                     'rel': get_label_type(df['rel'])}
+        else:
+            types = dtype
+        blocks = chain([first], blocks)
+
+        # files are read once: indices are appended to chunk lists or, if
+        # `directory` is given, to .npy files whose header is written at the
+        # end (headers of 1-D arrays are padded to the same length whatever
+        # their size)
+        chunks = [[], [], []]
+        files = []
+        if directory is not None:
+            makedirs(directory, exist_ok=True)
+            files = [open(join(directory, name + '.npy'), 'wb')
+                     for name in names]
+            for f in files:
+                f.write(get_header(0))
+
+        ent2ix, rel2ix = {}, {}
+        n = 0
+        try:
+            with ThreadPoolExecutor(n_threads) as executor:
+                # at most n_threads + 1 chunks are parsed or waiting at once
+                pending = deque()
+                while True:
+                    for block in blocks:
+                        pending.append(executor.submit(parse, block))
+                        if len(pending) > n_threads:
+                            break
+                    if not pending:
+                        break
+                    size, entities, relations = pending.popleft().result()
+                    entities = index(*entities, ent2ix)
+                    for k, array in enumerate([entities[:size],
+                                               entities[size:],
+                                               index(*relations, rel2ix)]):
+                        if files:
+                            files[k].write(array.tobytes())
+                        else:
+                            chunks[k].append(array)
+                    n += size
+            for f in files:
+                f.seek(0)
+                f.write(get_header(n))
+        finally:
+            for f in files:
+                f.close()
+
+        if n == 0:
+            raise WrongArgumentsError('The files do not hold any fact.')
+        if files:
+            arrays = [np.load(join(directory, name + '.npy'), mmap_mode='r+')
+                      for name in names]
+        else:
+            arrays = [np.concatenate(c) for c in chunks]
+        return cls(kg={'heads': from_numpy(arrays[0]),
+                       'tails': from_numpy(arrays[1]),
+                       'relations': from_numpy(arrays[2])},
+                   ent2ix=ent2ix, rel2ix=rel2ix, index_dtype=index_dtype)
+
+    def astype(self, index_dtype):
+        """Return a copy of the knowledge graph with indices stored in
+        `index_dtype`. Vocabularies are shared with the original graph.
+
+        Parameters
+        ----------
+        index_dtype: torch.dtype
+            Either torch.int16, torch.int32 or torch.int64.
+
+        Returns
+        -------
+        kg: torchkge.data_structures.KnowledgeGraph
+
+        """
+        indexes = {}
+        for which in ['heads', 'tails', 'rels']:
+            index = getattr(self, 'index_of_' + which)
+            indexes['index_of_' + which] = FilterIndex.from_csr(
+                index.keys, index.offsets, index.values.to(index_dtype),
+                index.n_key2)
+        return KnowledgeGraph(kg={'heads': self.head_idx,
+                                  'tails': self.tail_idx,
+                                  'relations': self.relations},
+                              ent2ix=self.ent2ix, rel2ix=self.rel2ix,
+                              index_dtype=index_dtype, **indexes)
+
+    def save(self, directory):
+        """Write the knowledge graph in `directory` as raw `.npy` arrays (the
+        facts, the vocabularies and the filter indexes) along with a small
+        `meta.json` file, so that it can be loaded by
+        :meth:`torchkge.data_structures.KnowledgeGraph.load` without
+        unpickling Python objects. Files are first written in a temporary
+        directory which then replaces `directory`, so that a partially
+        written graph is never loaded. The replacement is not atomic though:
+        the previous graph is moved aside before the new one is renamed, and
+        a process loading the graph in between finds no graph in
+        `directory` (:meth:`torchkge.data_structures.KnowledgeGraph.load`
+        then raises an error and can be called again).
+
+        Parameters
+        ----------
+        directory: str
+            Path to the directory. It should not exist or hold a knowledge
+            graph previously saved (which is replaced).
+
+        """
+        directory = abspath(directory)
+        if exists(directory) and listdir(directory) and \
+                not exists(join(directory, 'meta.json')):
+            raise WrongArgumentsError('{} is not empty and does not hold a '
+                                      'saved knowledge '
+                                      'graph.'.format(directory))
+        arrays = {'heads': self.head_idx, 'tails': self.tail_idx,
+                  'relations': self.relations}
+        for which in ['heads', 'tails', 'rels']:
+            index = getattr(self, 'index_of_' + which)
+            for attr in ['keys', 'offsets', 'values']:
+                arrays['index_of_{}_{}'.format(which, attr)] = \
+                    getattr(index, attr)
+
+        makedirs(dirname(directory), exist_ok=True)
+        tmp_path = mkdtemp(prefix='.' + basename(directory) + '-',
+                           dir=dirname(directory))
+        old_path = tmp_path + '-old'
+        try:
+            labels = {which: save_vocabulary(join(tmp_path, which), vocab)
+                      for which, vocab in [('ent', self.ent2ix),
+                                           ('rel', self.rel2ix)]}
+            for name, array in arrays.items():
+                np.save(join(tmp_path, name + '.npy'), array.cpu().numpy())
+            with open(join(tmp_path, 'meta.json'), 'w') as f:
+                json.dump({'version': 1, 'n_facts': self.n_facts,
+                           'labels': labels,
+                           'n_keys2': [self.index_of_heads.n_key2,
+                                       self.index_of_tails.n_key2,
+                                       self.index_of_rels.n_key2]}, f)
+            # the previous graph is only deleted once the new one replaced it,
+            # so that it is kept (in `old_path`) if the process stops between
+            # the two renames
+            if exists(directory):
+                rename(directory, old_path)
+            rename(tmp_path, directory)
+            rmtree(old_path, ignore_errors=True)
+        finally:
+            if exists(tmp_path):
+                rmtree(tmp_path, ignore_errors=True)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """Load a knowledge graph written by
+        :meth:`torchkge.data_structures.KnowledgeGraph.save`.
+
+        Parameters
+        ----------
+        directory: str
+            Path to the directory.
+        mmap: bool, optional (default=True)
+            If True, the arrays are memory-mapped (copy-on-write) instead of
+            being read: loading only costs the building of the vocabulary
+            dictionaries, and processes opening the same graph share its
+            pages through the page cache of the OS.
+
+        Returns
+        -------
+        kg: torchkge.data_structures.KnowledgeGraph
+
+        """
+        try:
+            with open(join(directory, 'meta.json')) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            raise WrongArgumentsError('{} does not hold a saved knowledge '
+                                      'graph.'.format(directory))
+        if meta.get('version') != 1:
+            raise WrongArgumentsError('The knowledge graph in {} was saved by '
+                                      'an unsupported version of '
+                                      'TorchKGE.'.format(directory))
+
+        def load(name):
+            return from_numpy(np.load(join(directory, name + '.npy'),
+                                      mmap_mode='c' if mmap else None))
+
+        indexes = {}
+        for which, n_key2 in zip(['heads', 'tails', 'rels'], meta['n_keys2']):
+            indexes['index_of_' + which] = FilterIndex.from_csr(
+                *[load('index_of_{}_{}'.format(which, attr))
+                  for attr in ['keys', 'offsets', 'values']],
+                n_key2=n_key2)
+        heads = load('heads')
+        return cls(kg={'heads': heads, 'tails': load('tails'),
+                       'relations': load('relations')},
+                   ent2ix=load_vocabulary(join(directory, 'ent'),
+                                          meta['labels']['ent']),
+                   rel2ix=load_vocabulary(join(directory, 'rel'),
+                                          meta['labels']['rel']),
+                   index_dtype=heads.dtype, **indexes)
+
     def __len__(self):
         return self.n_facts
 
@@ -143,21 +531,56 @@ class KnowledgeGraph(Dataset):
                 self.tail_idx[item].item(),
                 self.relations[item].item())
 
+    def __setstate__(self, state):
+        # knowledge graphs pickled by previous versions only hold dictionaries
+        for which in ['heads', 'tails', 'rels']:
+            if 'dict_of_' + which in state:
+                state['_dict_of_' + which] = state.pop('dict_of_' + which)
+        state.setdefault('index_dtype', int64)
+        self.__dict__.update(state)
+        if 'index_of_heads' not in state:
+            self.index_of_heads = FilterIndex.from_dict(self._dict_of_heads,
+                                                        self.n_rel)
+            self.index_of_tails = FilterIndex.from_dict(self._dict_of_tails,
+                                                        self.n_rel)
+            self.index_of_rels = FilterIndex.from_dict(self._dict_of_rels,
+                                                       self.n_ent)
+
+    @property
+    def dict_of_heads(self):
+        if self._dict_of_heads is None:
+            self._dict_of_heads = self.index_of_heads.to_dict()
+        return self._dict_of_heads
+
+    @property
+    def dict_of_tails(self):
+        if self._dict_of_tails is None:
+            self._dict_of_tails = self.index_of_tails.to_dict()
+        return self._dict_of_tails
+
+    @property
+    def dict_of_rels(self):
+        if self._dict_of_rels is None:
+            self._dict_of_rels = self.index_of_rels.to_dict()
+        return self._dict_of_rels
+
     def sanity_check(self):
-        assert (type(self.dict_of_heads) == defaultdict) & \
-               (type(self.dict_of_tails) == defaultdict) & \
-               (type(self.dict_of_rels) == defaultdict)
+        assert (type(self.index_of_heads) == FilterIndex) & \
+               (type(self.index_of_tails) == FilterIndex) & \
+               (type(self.index_of_rels) == FilterIndex)
         assert (type(self.ent2ix) == dict) & (type(self.rel2ix) == dict)
         assert (len(self.ent2ix) == self.n_ent) & \
                (len(self.rel2ix) == self.n_rel)
         assert (type(self.head_idx) == Tensor) & \
                (type(self.tail_idx) == Tensor) & \
                (type(self.relations) == Tensor)
-        assert (self.head_idx.dtype == int64) & \
-               (self.tail_idx.dtype == int64) & (self.relations.dtype == int64)
+        assert (self.head_idx.dtype == self.index_dtype) & \
+               (self.tail_idx.dtype == self.index_dtype) & \
+               (self.relations.dtype == self.index_dtype)
         assert (len(self.head_idx) == len(self.tail_idx) == len(self.relations))
 
-    def split_kg(self, share=0.8, sizes=None, validation=False):
+    def split_kg(self, share=0.8, sizes=None, validation=False,
+                 generator=None):
         """Split the knowledge graph into train and test. If `sizes` is
         provided then it is used to split the samples as explained below. If
         only `share` is provided, the split is done at random but it assures
@@ -181,6 +604,9 @@ class KnowledgeGraph(Dataset):
         validation: bool
             Indicate if a validation set should be produced along with train
             and test sets.
+        generator: torch.Generator, optional
+            Random generator used to split the facts when `sizes` is not
+            given. It gives reproducible splits.
 
         Returns
         -------
@@ -218,14 +644,12 @@ class KnowledgeGraph(Dataset):
             # return training, validation and a testing graphs
 
             if (sizes is None) and validation:
-                mask_tr, mask_val, mask_te = self.get_mask(share,
-                                                           validation=True)
+                mask_tr, mask_val, mask_te = self.get_mask(
+                    share, validation=True, generator=generator)
             else:
-                mask_tr = cat([tensor([1 for _ in range(sizes[0])]),
-                               tensor([0 for _ in range(sizes[1] + sizes[2])])]).bool()
-                mask_val = cat([tensor([0 for _ in range(sizes[0])]),
-                                tensor([1 for _ in range(sizes[1])]),
-                                tensor([0 for _ in range(sizes[2])])]).bool()
+                idx = arange(self.n_facts)
+                mask_tr = idx < sizes[0]
+                mask_val = (idx >= sizes[0]) & (idx < sizes[0] + sizes[1])
                 mask_te = ~(mask_tr | mask_val)
 
             return (KnowledgeGraph(
@@ -233,65 +657,76 @@ class KnowledgeGraph(Dataset):
                             'tails': self.tail_idx[mask_tr],
                             'relations': self.relations[mask_tr]},
                         ent2ix=self.ent2ix, rel2ix=self.rel2ix,
-                        dict_of_heads=self.dict_of_heads,
-                        dict_of_tails=self.dict_of_tails,
-                        dict_of_rels=self.dict_of_rels),
+                        index_of_heads=self.index_of_heads,
+                        index_of_tails=self.index_of_tails,
+                        index_of_rels=self.index_of_rels,
+                        index_dtype=self.index_dtype),
                     KnowledgeGraph(
                         kg={'heads': self.head_idx[mask_val],
                             'tails': self.tail_idx[mask_val],
                             'relations': self.relations[mask_val]},
                         ent2ix=self.ent2ix, rel2ix=self.rel2ix,
-                        dict_of_heads=self.dict_of_heads,
-                        dict_of_tails=self.dict_of_tails,
-                        dict_of_rels=self.dict_of_rels),
+                        index_of_heads=self.index_of_heads,
+                        index_of_tails=self.index_of_tails,
+                        index_of_rels=self.index_of_rels,
+                        index_dtype=self.index_dtype),
                     KnowledgeGraph(
                         kg={'heads': self.head_idx[mask_te],
                             'tails': self.tail_idx[mask_te],
                             'relations': self.relations[mask_te]},
                         ent2ix=self.ent2ix, rel2ix=self.rel2ix,
-                        dict_of_heads=self.dict_of_heads,
-                        dict_of_tails=self.dict_of_tails,
-                        dict_of_rels=self.dict_of_rels))
+                        index_of_heads=self.index_of_heads,
+                        index_of_tails=self.index_of_tails,
+                        index_of_rels=self.index_of_rels,
+                        index_dtype=self.index_dtype))
         else:
             # return training and testing graphs
 
             assert (((sizes is not None) and len(sizes) == 2) or
                     ((sizes is None) and not validation))
             if sizes is None:
-                mask_tr, mask_te = self.get_mask(share, validation=False)
+                mask_tr, mask_te = self.get_mask(share, validation=False,
+                                                 generator=generator)
             else:
-                mask_tr = cat([tensor([1 for _ in range(sizes[0])]),
-                               tensor([0 for _ in range(sizes[1])])]).bool()
+                mask_tr = arange(self.n_facts) < sizes[0]
                 mask_te = ~mask_tr
             return (KnowledgeGraph(
                         kg={'heads': self.head_idx[mask_tr],
                             'tails': self.tail_idx[mask_tr],
                             'relations': self.relations[mask_tr]},
                         ent2ix=self.ent2ix, rel2ix=self.rel2ix,
-                        dict_of_heads=self.dict_of_heads,
-                        dict_of_tails=self.dict_of_tails,
-                        dict_of_rels=self.dict_of_rels),
+                        index_of_heads=self.index_of_heads,
+                        index_of_tails=self.index_of_tails,
+                        index_of_rels=self.index_of_rels,
+                        index_dtype=self.index_dtype),
                     KnowledgeGraph(
                         kg={'heads': self.head_idx[mask_te],
                             'tails': self.tail_idx[mask_te],
                             'relations': self.relations[mask_te]},
                         ent2ix=self.ent2ix, rel2ix=self.rel2ix,
-                        dict_of_heads=self.dict_of_heads,
-                        dict_of_tails=self.dict_of_tails,
-                        dict_of_rels=self.dict_of_rels))
+                        index_of_heads=self.index_of_heads,
+                        index_of_tails=self.index_of_tails,
+                        index_of_rels=self.index_of_rels,
+                        index_dtype=self.index_dtype))
 
-    def get_mask(self, share, validation=False):
+    def get_mask(self, share, validation=False, generator=None):
         """Returns masks to split knowledge graph into train, test and
         optionally validation sets. The mask is first created by dividing
         samples between subsets based on relation equilibrium. Then if any
-        entity is not present in the training subset it is manually added by
-        assigning a share of the sample involving the missing entity either
-        as head or tail.
+        entity is not present in the training subset, all the facts
+        involving it are moved to the training subset.
+
+        Facts are sorted by relation and by a random key at once, so that
+        the facts of each relation are shuffled together and their rank in
+        the group of their relation decides their subset.
 
         Parameters
         ----------
         share: float
         validation: bool
+        generator: torch.Generator, optional
+            Random generator used to shuffle the facts. It gives
+            reproducible splits.
 
         Returns
         -------
@@ -299,52 +734,34 @@ class KnowledgeGraph(Dataset):
         mask_val: torch.Tensor, shape: (n), dtype: torch.bool (optional)
         mask_te: torch.Tensor, shape: (n), dtype: torch.bool
         """
+        # facts grouped by relation, in random order inside each group
+        # (indices are cast as tensors of compact types cannot index others)
+        order = randperm(self.n_facts, generator=generator)
+        order = order[self.relations[order].argsort(stable=True)]
+        relations = self.relations[order].long()
 
-        uniques_r, counts_r = self.relations.unique(return_counts=True)
-        uniques_e, _ = cat((self.head_idx,
-                            self.tail_idx)).unique(return_counts=True)
+        counts = bincount(relations, minlength=self.n_rel)
+        starts = counts.cumsum(dim=0) - counts
+        ranks = arange(self.n_facts) - starts[relations]
+
+        sizes = self.get_group_sizes(counts, share, validation)
 
         mask = zeros_like(self.relations).bool()
+        mask[order] = ranks < sizes[0][relations]
         if validation:
             mask_val = zeros_like(self.relations).bool()
+            mask_val[order] = (ranks >= sizes[0][relations]) & \
+                              (ranks < (sizes[0] + sizes[1])[relations])
 
-        # splitting relations among subsets
-        for i, r in enumerate(uniques_r):
-            rand = randperm(counts_r[i].item())
-
-            # list of indices k such that relations[k] == r
-            sub_mask = eq(self.relations, r).nonzero(as_tuple=False)[:, 0]
-
-            assert len(sub_mask) == counts_r[i].item()
-
-            if validation:
-                train_size, val_size, test_size = self.get_sizes(counts_r[i].item(),
-                                                                 share=share,
-                                                                 validation=True)
-                mask[sub_mask[rand[:train_size]]] = True
-                mask_val[sub_mask[rand[train_size:train_size + val_size]]] = True
-
-            else:
-                train_size, test_size = self.get_sizes(counts_r[i].item(),
-                                                       share=share,
-                                                       validation=False)
-                mask[sub_mask[rand[:train_size]]] = True
-
-        # adding missing entities to the train set
-        u = cat((self.head_idx[mask], self.tail_idx[mask])).unique()
-        if len(u) < self.n_ent:
-            missing_entities = tensor(list(set(uniques_e.tolist()) -
-                                           set(u.tolist())), dtype=long)
-            for e in missing_entities:
-                sub_mask = ((self.head_idx == e) |
-                            (self.tail_idx == e)).nonzero(as_tuple=False)[:, 0]
-                rand = randperm(len(sub_mask))
-                sizes = self.get_sizes(mask.shape[0],
-                                       share=share,
-                                       validation=validation)
-                mask[sub_mask[rand[:sizes[0]]]] = True
-                if validation:
-                    mask_val[sub_mask[rand[:sizes[0]]]] = False
+        # adding facts of entities missing from the train set
+        covered = zeros(self.n_ent, dtype=bool)
+        heads, tails = self.head_idx.long(), self.tail_idx.long()
+        covered[heads[mask]] = True
+        covered[tails[mask]] = True
+        missing = ~(covered[heads] & covered[tails])
+        mask[missing] = True
+        if validation:
+            mask_val[missing] = False
 
         if validation:
             assert not (mask & mask_val).any().item()
@@ -352,6 +769,27 @@ class KnowledgeGraph(Dataset):
         else:
             return mask, ~mask
 
+    @staticmethod
+    def get_group_sizes(counts, share, validation=False):
+        """Vectorized version of `get_sizes`: with `counts[i]` samples in
+        group `i`, returns how many of them should go to train, (validation)
+        and test.
+
+        Returns
+        -------
+        sizes: tuple of torch.Tensor, dtype: torch.long, shape: (n_groups)
+
+        """
+        n_train = minimum((counts.double() * share).long().clamp(min=1),
+                          counts)
+        if not validation:
+            return n_train, counts - n_train
+
+        n_train[(counts > 2) & (counts - n_train == 1)] -= 1
+        n_val = (counts - n_train) // 2
+        n_val[counts == 2] = 1
+        return n_train, n_val, counts - n_train - n_val
+
     @staticmethod
     def get_sizes(count, share, validation=False):
         """With `count` samples, returns how many should go to train and test
@@ -384,22 +822,24 @@ class KnowledgeGraph(Dataset):
                 return n_train, n_val, count - n_train - n_val
 
     def evaluate_dicts(self):
-        """Evaluates dicts of possible alternatives to an entity in a fact
-        that still gives a true fact in the entire knowledge graph.
+        """Evaluates indexes of possible alternatives to an entity in a fact
+        that still gives a true fact in the entire knowledge graph. The
+        corresponding dictionaries are only built when accessed.
 
         """
-        for i in range(self.n_facts):
-            self.dict_of_heads[(self.tail_idx[i].item(),
-                                self.relations[i].item())].add(self.head_idx[i].item())
-            self.dict_of_tails[(self.head_idx[i].item(),
-                                self.relations[i].item())].add(self.tail_idx[i].item())
-            self.dict_of_rels[(self.head_idx[i].item(),
-                               self.tail_idx[i].item())].add(self.relations[i].item())
+        self.index_of_heads = FilterIndex(self.tail_idx, self.relations,
+                                          self.head_idx, self.n_rel)
+        self.index_of_tails = FilterIndex(self.head_idx, self.relations,
+                                          self.tail_idx, self.n_rel)
+        self.index_of_rels = FilterIndex(self.head_idx, self.tail_idx,
+                                         self.relations, self.n_ent)
 
     def get_df(self):
         """
         Returns a Pandas DataFrame with columns ['from', 'to', 'rel'].
         """
+        from pandas import DataFrame
+
         ix2ent = {v: k for k, v in self.ent2ix.items()}
         ix2rel = {v: k for k, v in self.rel2ix.items()}
 
@@ -432,3 +872,182 @@ class SmallKG(Dataset):
 
     def __getitem__(self, item):
         return self.head_idx[item].item(), self.tail_idx[item].item(), self.relations[item].item()
+
+
+class FilterIndex(object):
+    """Compact index of the values (entities or relations) completing a pair
+    of keys into a true fact. It replaces dictionaries of sets such as
+    `KnowledgeGraph.dict_of_heads` for large graphs: pairs (key1, key2) are
+    packed into a single integer `key1 * n_key2 + key2` and the index is
+    stored in compressed sparse row (CSR) format.
+
+    Parameters
+    ----------
+    key1: torch.Tensor, dtype: torch.long, shape: (n_facts)
+        First key of each fact (e.g. tail indices for an index of heads).
+    key2: torch.Tensor, dtype: torch.long, shape: (n_facts)
+        Second key of each fact (e.g. relation indices for an index of heads).
+    values: torch.Tensor, dtype: torch.long, shape: (n_facts)
+        Value of each fact (e.g. head indices for an index of heads). The
+        index keeps their integer type.
+    n_key2: int
+        Number of possible values of `key2`.
+
+    Attributes
+    ----------
+    n_key2: int
+        Number of possible values of `key2`.
+    keys: torch.Tensor, dtype: torch.long, shape: (n_keys)
+        Sorted distinct packed keys.
+    offsets: torch.Tensor, dtype: torch.long, shape: (n_keys + 1)
+        Values associated to `keys[i]` are `values[offsets[i]:offsets[i+1]]`.
+    values: torch.Tensor, dtype: torch.long, shape: (n_values)
+        Distinct values associated to each key, sorted by key then by value.
+
+    """
+    def __init__(self, key1, key2, values, n_key2):
+        self.n_key2 = n_key2
+
+        packed = key1.long().cpu() * n_key2 + key2.long().cpu()
+        values = values.cpu()
+
+        # sort by packed keys and then by values
+        values, order = values.sort(stable=True)
+        packed, order = packed[order].sort(stable=True)
+        values = values[order]
+
+        # remove duplicated facts
+        if len(packed) > 1:
+            keep = ones(len(packed), dtype=bool)
+            keep[1:] = (packed[1:] != packed[:-1]) | \
+                (values[1:] != values[:-1])
+            packed, values = packed[keep], values[keep]
+
+        self.keys, counts = packed.unique_consecutive(return_counts=True)
+        self.offsets = zeros(len(self.keys) + 1, dtype=long)
+        self.offsets[1:] = counts.cumsum(dim=0)
+        self.values = values
+
+    @classmethod
+    def from_dict(cls, dictionary, n_key2):
+        """Build an index from a dictionary with keys (int, int) and values
+        sets of ints, such as the ones formerly stored in
+        `KnowledgeGraph.dict_of_heads`.
+
+        """
+        key1, key2, values = [], [], []
+        for (k1, k2), v in dictionary.items():
+            key1.extend([k1] * len(v))
+            key2.extend([k2] * len(v))
+            values.extend(v)
+        return cls(tensor(key1, dtype=long), tensor(key2, dtype=long),
+                   tensor(values, dtype=long), n_key2)
+
+    @classmethod
+    def from_csr(cls, keys, offsets, values, n_key2):
+        """Build an index from its attributes `keys`, `offsets` and `values`
+        (e.g. stored on disk) without sorting them again.
+
+        """
+        index = cls.__new__(cls)
+        index.n_key2 = n_key2
+        index.keys, index.offsets, index.values = keys, offsets, values
+        return index
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __iter__(self):
+        for k in self.keys.tolist():
+            yield k // self.n_key2, k % self.n_key2
+
+    def __contains__(self, key):
+        return self.find(key[0], key[1]) is not None
+
+    def __getitem__(self, key):
+        values = self.get(key[0], key[1])
+        if values is None:
+            raise KeyError(key)
+        return set(values.tolist())
+
+    def find(self, key1, key2):
+        """Returns the position of the pair (key1, key2) in `keys` or None if
+        the pair is not indexed.
+
+        """
+        packed = int(key1) * self.n_key2 + int(key2)
+        pos = searchsorted(self.keys, tensor([packed])).item()
+        if pos < len(self.keys) and self.keys[pos].item() == packed:
+            return pos
+        return None
+
+    def get(self, key1, key2):
+        """Returns the values associated to the pair (key1, key2).
+
+        Returns
+        -------
+        values: torch.Tensor, dtype: torch.long, shape: (n_values) or None
+            Sorted values such that (key1, key2, value) is a true fact. None
+            is returned if the pair is not indexed.
+
+        """
+        pos = self.find(key1, key2)
+        if pos is None:
+            return None
+        return self.values[self.offsets[pos]:self.offsets[pos + 1]]
+
+    def lookup(self, key1, key2):
+        """Batched version of `get`: finds the values associated to each
+        pair (key1[i], key2[i]) of the batch at once.
+
+        Parameters
+        ----------
+        key1: torch.Tensor, dtype: torch.long, shape: (b_size)
+        key2: torch.Tensor, dtype: torch.long, shape: (b_size)
+
+        Returns
+        -------
+        rows: torch.Tensor, dtype: torch.long, shape: (n_found)
+            Index in the batch of the pair each value is associated to.
+        values: torch.Tensor, dtype: torch.long, shape: (n_found)
+            Values such that (key1[rows[j]], key2[rows[j]], values[j]) is a
+            true fact.
+
+        """
+        packed = key1.long().cpu() * self.n_key2 + key2.long().cpu()
+        if len(self.keys) == 0 or len(packed) == 0:
+            return zeros(0, dtype=long), zeros(0, dtype=long)
+
+        pos = searchsorted(self.keys, packed).clamp(max=len(self.keys) - 1)
+        found = (self.keys[pos] == packed)
+        starts = self.offsets[pos]
+        counts = (self.offsets[pos + 1] - starts) * found
+
+        rows = arange(len(packed)).repeat_interleave(counts)
+        # position of each value in its group, shifted to the group's start
+        shifts = starts - (counts.cumsum(dim=0) - counts)
+        # values are used as indices, which tensors of compact types cannot be
+        return rows, self.values[arange(len(rows)) + shifts[rows]].long()
+
+    def to_dict(self):
+        """Returns the index as a dictionary of sets with keys (key1, key2).
+
+        """
+        dictionary = defaultdict(set)
+        counts = (self.offsets[1:] - self.offsets[:-1]).tolist()
+        values = self.values.tolist()
+        start = 0
+        for k, c in zip(self.keys.tolist(), counts):
+            dictionary[(k // self.n_key2, k % self.n_key2)] = \
+                set(values[start:start + c])
+            start += c
+        return dictionary
+
+
+def get_label_type(*columns):
+    """Return the type of the labels of the given pandas columns: their
+    common numerical dtype, or `str` if they do not share one."""
+    types = {column.dtype for column in columns}
+    if len(types) > 1 or types.pop().kind not in 'biuf':
+        return str
+    return columns[0].dtype
@@ -4,13 +4,41 @@ Copyright TorchKGE developers
 @author: Armand Boschin <aboschin@enst.fr>
 """
 
-from torch import empty, zeros, cat
+from torch import arange, bincount, empty, long, zeros, cat, no_grad
 from tqdm.autonotebook import tqdm
 
 from .data_structures import SmallKG
 from .exceptions import NotYetEvaluatedError
 from .sampling import PositionalNegativeSampler
-from .utils import DataLoader, get_rank, filter_scores
+from .utils import DataLoader, get_rank, filter_scores, get_true_targets_batch
+from .utils.data import get_n_batches
+from .utils.profiling import stage
+
+
+def get_relation_batches(relations, b_size):
+    """Split the indices of facts in batches of at most `b_size` facts
+    sharing the same relation. This is used to evaluate models projecting
+    entities in relation-specific spaces, so that the projections cached for
+    a relation are used by consecutive batches.
+
+    Parameters
+    ----------
+    relations: torch.Tensor, shape: (n_facts), dtype: torch.long
+        Relations of the facts.
+    b_size: int
+        Maximum size of the batches.
+
+    Returns
+    -------
+    batches: list of torch.Tensor
+        Indices of the facts of each batch.
+
+    """
+    relations = relations.long()
+    order = relations.argsort(stable=True)
+    counts = bincount(relations).tolist()
+    return [batch for group in order.split(counts) if len(group) > 0
+            for batch in group.split(b_size)]
 
 
 class RelationPredictionEvaluator(object):
@@ -66,7 +94,7 @@ class RelationPredictionEvaluator(object):
 
         self.evaluated = False
 
-    def evaluate(self, b_size, verbose=True):
+    def evaluate(self, b_size, verbose=True, timer=None):
         """
 
         Parameters
@@ -76,6 +104,9 @@ class RelationPredictionEvaluator(object):
         verbose: bool
             Indicates whether a progress bar should be displayed during
             evaluation.
+        timer: torchkge.utils.profiling.StageTimer, optional (default=None)
+            If given, the time spent in scoring, filtering and ranking is
+            recorded batch after batch.
 
         """
         use_cuda = next(self.model.parameters()).is_cuda
@@ -87,26 +118,53 @@ class RelationPredictionEvaluator(object):
         else:
             dataloader = DataLoader(self.kg, batch_size=b_size)
 
+        if timer is not None:
+            timer.start()
         for i, batch in tqdm(enumerate(dataloader), total=len(dataloader),
                              unit='batch', disable=(not verbose),
                              desc='Relation prediction evaluation'):
-            h_idx, t_idx, r_idx = batch[0], batch[1], batch[2]
-            h_emb, t_emb, r_emb, candidates = self.model.inference_prepare_candidates(h_idx, t_idx, r_idx, entities=False)
-
-            scores = self.model.inference_scoring_function(h_emb, t_emb, candidates)
-            filt_scores = filter_scores(scores, self.kg.dict_of_rels, h_idx, t_idx, r_idx)
+            h_idx, t_idx, r_idx = \
+                batch[0].long(), batch[1].long(), batch[2].long()
+            with stage(timer, 'scoring'):
+                if hasattr(self.model, 'score_all_relations'):
+                    scores = self.model.score_all_relations(h_idx, t_idx)
+                else:
+                    h_emb, t_emb, r_emb, candidates = \
+                        self.model.inference_prepare_candidates(
+                            h_idx, t_idx, r_idx, entities=False)
+                    scores = self.model.inference_scoring_function(
+                        h_emb, t_emb, candidates)
+            with stage(timer, 'filter_scores'):
+                filt_scores = filter_scores(scores, self.kg.index_of_rels,
+                                            h_idx, t_idx, r_idx)
 
             if not self.directed:
-                scores_bis = self.model.inference_scoring_function(t_emb, h_emb, candidates)
-                filt_scores_bis = filter_scores(scores_bis, self.kg.dict_of_rels, h_idx, t_idx, r_idx)
+                with stage(timer, 'scoring'):
+                    if hasattr(self.model, 'score_all_relations'):
+                        scores_bis = self.model.score_all_relations(t_idx,
+                                                                    h_idx)
+                    else:
+                        scores_bis = self.model.inference_scoring_function(
+                            t_emb, h_emb, candidates)
+                with stage(timer, 'filter_scores'):
+                    filt_scores_bis = filter_scores(scores_bis,
+                                                    self.kg.index_of_rels,
+                                                    h_idx, t_idx, r_idx)
 
                 scores = cat((scores, scores_bis), dim=1)
                 filt_scores = cat((filt_scores, filt_scores_bis), dim=1)
 
-            self.rank_true_rels[i * b_size: (i + 1) * b_size] = get_rank(scores, r_idx).detach()
-            self.filt_rank_true_rels[i * b_size: (i + 1) * b_size] = get_rank(filt_scores, r_idx).detach()
+            with stage(timer, 'get_rank'):
+                self.rank_true_rels[i * b_size: (i + 1) * b_size] = \
+                    get_rank(scores, r_idx).detach()
+                self.filt_rank_true_rels[i * b_size: (i + 1) * b_size] = \
+                    get_rank(filt_scores, r_idx).detach()
+            if timer is not None:
+                timer.end_batch(len(h_idx))
 
         self.evaluated = True
+        if timer is not None:
+            timer.stop()
 
         if use_cuda:
             self.rank_true_rels = self.rank_true_rels.cpu()
@@ -260,7 +318,7 @@ class LinkPredictionEvaluator(object):
 
         self.evaluated = False
 
-    def evaluate(self, b_size, verbose=True):
+    def evaluate(self, b_size, verbose=True, block_size=None, timer=None):
         """
 
         Parameters
@@ -270,36 +328,109 @@ class LinkPredictionEvaluator(object):
         verbose: bool
             Indicates whether a progress bar should be displayed during
             evaluation.
+        block_size: int, optional (default=None)
+            Number of candidate entities scored at once for each fact of the
+            batch. Only the number of candidates scoring at least as well as
+            the true entity is kept from one block to the next, so that the
+            memory used is proportional to `b_size * block_size` instead of
+            `b_size * n_ent`. If None, all entities are scored at once.
+        timer: torchkge.utils.profiling.StageTimer, optional (default=None)
+            If given, the time spent in scoring, filtering and ranking is
+            recorded batch after batch.
 
         """
         use_cuda = next(self.model.parameters()).is_cuda
 
         if use_cuda:
-            dataloader = DataLoader(self.kg, batch_size=b_size, use_cuda='batch')
             self.rank_true_heads = self.rank_true_heads.cuda()
             self.rank_true_tails = self.rank_true_tails.cuda()
             self.filt_rank_true_heads = self.filt_rank_true_heads.cuda()
             self.filt_rank_true_tails = self.filt_rank_true_tails.cuda()
-        else:
-            dataloader = DataLoader(self.kg, batch_size=b_size)
 
-        for i, batch in tqdm(enumerate(dataloader), total=len(dataloader),
-                             unit='batch', disable=(not verbose),
-                             desc='Link prediction evaluation'):
-            h_idx, t_idx, r_idx = batch[0], batch[1], batch[2]
-            h_emb, t_emb, r_emb, candidates = self.model.inference_prepare_candidates(h_idx, t_idx, r_idx, entities=True)
-
-            scores = self.model.inference_scoring_function(h_emb, candidates, r_emb)
-            filt_scores = filter_scores(scores, self.kg.dict_of_tails, h_idx, r_idx, t_idx)
-            self.rank_true_tails[i * b_size: (i + 1) * b_size] = get_rank(scores, t_idx).detach()
-            self.filt_rank_true_tails[i * b_size: (i + 1) * b_size] = get_rank(filt_scores, t_idx).detach()
-
-            scores = self.model.inference_scoring_function(candidates, t_emb, r_emb)
-            filt_scores = filter_scores(scores, self.kg.dict_of_heads, t_idx, r_idx, h_idx)
-            self.rank_true_heads[i * b_size: (i + 1) * b_size] = get_rank(scores, h_idx).detach()
-            self.filt_rank_true_heads[i * b_size: (i + 1) * b_size] = get_rank(filt_scores, h_idx).detach()
+        if hasattr(self.model, 'projection_cache'):
+            # facts sharing a relation are evaluated together to reuse cached
+            # projections
+            batches = get_relation_batches(self.kg.relations, b_size)
+        else:
+            batches = [slice(i * b_size, (i + 1) * b_size)
+                       for i in range(get_n_batches(len(self.kg), b_size))]
+
+        if timer is not None:
+            timer.start()
+        for batch in tqdm(batches, unit='batch', disable=(not verbose),
+                          desc='Link prediction evaluation'):
+            # indices can be stored in a compact type (see
+            # KnowledgeGraph.index_dtype)
+            h_idx = self.kg.head_idx[batch].long()
+            t_idx = self.kg.tail_idx[batch].long()
+            r_idx = self.kg.relations[batch].long()
+            if use_cuda:
+                h_idx, t_idx, r_idx = h_idx.cuda(), t_idx.cuda(), r_idx.cuda()
+
+            with no_grad(), stage(timer, 'scoring'):
+                h_emb, t_emb, r_emb, candidates = \
+                    self.model.inference_prepare_candidates(h_idx, t_idx,
+                                                            r_idx,
+                                                            entities=True)
+
+            with no_grad():
+                if hasattr(self.model, 'score_all_tails'):
+                    def scoring(start, end):
+                        return self.model.score_all_tails(h_idx, r_idx,
+                                                          start, end)
+                else:
+                    def scoring(start, end):
+                        c = self.model.inference_slice_candidates(candidates,
+                                                                  start, end)
+                        return self.model.inference_scoring_function(h_emb, c,
+                                                                     r_emb)
+
+                def true_scoring():
+                    c = self.model.inference_gather_candidates(candidates,
+                                                               t_idx)
+                    return self.model.inference_scoring_function(h_emb, c,
+                                                                 r_emb)
+
+                with stage(timer, 'filter_scores'):
+                    true_targets = get_true_targets_batch(
+                        self.kg.index_of_tails, h_idx, r_idx, t_idx)
+                ranks, filt_ranks = self.get_ranks(scoring, true_scoring,
+                                                   t_idx, true_targets,
+                                                   block_size, timer)
+                self.rank_true_tails[batch] = ranks
+                self.filt_rank_true_tails[batch] = filt_ranks
+
+                if hasattr(self.model, 'score_all_heads'):
+                    def scoring(start, end):
+                        return self.model.score_all_heads(t_idx, r_idx,
+                                                          start, end)
+                else:
+                    def scoring(start, end):
+                        c = self.model.inference_slice_candidates(candidates,
+                                                                  start, end)
+                        return self.model.inference_scoring_function(c, t_emb,
+                                                                     r_emb)
+
+                def true_scoring():
+                    c = self.model.inference_gather_candidates(candidates,
+                                                               h_idx)
+                    return self.model.inference_scoring_function(c, t_emb,
+                                                                 r_emb)
+
+                with stage(timer, 'filter_scores'):
+                    true_targets = get_true_targets_batch(
+                        self.kg.index_of_heads, t_idx, r_idx, h_idx)
+                ranks, filt_ranks = self.get_ranks(scoring, true_scoring,
+                                                   h_idx, true_targets,
+                                                   block_size, timer)
+                self.rank_true_heads[batch] = ranks
+                self.filt_rank_true_heads[batch] = filt_ranks
+            if timer is not None:
+                timer.end_batch(len(h_idx))
 
         self.evaluated = True
+        if timer is not None:
+            timer.stop()
 
         if use_cuda:
             self.rank_true_heads = self.rank_true_heads.cpu()
@@ -307,6 +438,82 @@ class LinkPredictionEvaluator(object):
             self.filt_rank_true_heads = self.filt_rank_true_heads.cpu()
             self.filt_rank_true_tails = self.filt_rank_true_tails.cpu()
 
+    def get_ranks(self, scoring, true_scoring, true_idx, true_targets,
+                  block_size=None, timer=None):
+        """Compute the raw and filtered ranks of the true candidates by
+        scoring the candidates block by block. For each fact of the batch,
+        only the running count of candidates scoring at least as well as the
+        true one is kept.
+
+        Parameters
+        ----------
+        scoring: function
+            Function taking the indices `start` and `end` of a block of
+            candidates and returning their scores for each fact of the batch,
+            with shape (b_size, end - start).
+        true_scoring: function
+            Function returning the scores of the true candidates with shape
+            (b_size, 1). It is only called when there are several blocks.
+        true_idx: torch.Tensor, shape: (b_size), dtype: torch.long
+            Index of the true candidate of each fact.
+        true_targets: tuple of torch.Tensor
+            Pairs (i, c) such that candidate c should be filtered out for fact
+            i, as returned by `torchkge.utils.get_true_targets_batch`.
+        block_size: int, optional (default=None)
+            Number of candidates scored at once. If None, all candidates are
+            scored at once.
+        timer: torchkge.utils.profiling.StageTimer, optional (default=None)
+            If given, the time spent in scoring, filtering and ranking is
+            recorded.
+
+        Returns
+        -------
+        ranks: torch.Tensor, shape: (b_size), dtype: torch.long
+        filt_ranks: torch.Tensor, shape: (b_size), dtype: torch.long
+
+        """
+        b_size = true_idx.shape[0]
+        n_cand = self.model.n_ent
+        if block_size is None or block_size >= n_cand:
+            block_size = n_cand
+            true_scores = None
+        else:
+            # with several blocks, scores of true candidates are needed first
+            with stage(timer, 'scoring'):
+                true_scores = true_scoring().view(b_size, 1)
+
+        device = true_idx.device
+        rows = arange(b_size, device=device)
+        filt_rows = true_targets[0].to(device)
+        filt_cols = true_targets[1].to(device)
+
+        ranks = zeros(b_size, dtype=long, device=device)
+        filt_ranks = zeros(b_size, dtype=long, device=device)
+
+        for start in range(0, n_cand, block_size):
+            end = min(start + block_size, n_cand)
+            with stage(timer, 'scoring'):
+                scores = scoring(start, end)
+
+            with stage(timer, 'get_rank'):
+                if true_scores is None:
+                    true_scores = scores.gather(1, true_idx.view(-1, 1))
+                    better = (scores >= true_scores)
+                else:
+                    better = (scores >= true_scores)
+                    # the true candidate is always counted, as in the
+                    # one-block case
+                    mask = (true_idx >= start) & (true_idx < end)
+                    better[rows[mask], true_idx[mask] - start] = True
+                ranks += better.sum(dim=1)
+
+            with stage(timer, 'filter_scores'):
+                mask = (filt_cols >= start) & (filt_cols < end)
+                better[filt_rows[mask], filt_cols[mask] - start] = False
+                filt_ranks += better.sum(dim=1)
+
+        return ranks, filt_ranks
+
     def mean_rank(self):
         """
 
@@ -505,7 +712,8 @@ class TripletClassificationEvaluator(object):
             dataloader = DataLoader(small_kg, batch_size=batch_size)
 
         for i, batch in enumerate(dataloader):
-            h_idx, t_idx, r_idx = batch[0], batch[1], batch[2]
+            h_idx, t_idx, r_idx = \
+                batch[0].long(), batch[1].long(), batch[2].long()
             scores.append(self.model.scoring_function(h_idx, t_idx, r_idx))
 
         return cat(scores, dim=0)
@@ -522,7 +730,7 @@ class TripletClassificationEvaluator(object):
         b_size: int
             Batch size.
         """
-        r_idx = self.kg_val.relations
+        r_idx = self.kg_val.relations.long()
 
         neg_heads, neg_tails = self.sampler.corrupt_kg(b_size, self.is_cuda,
                                                        which='main')
@@ -559,7 +767,7 @@ class TripletClassificationEvaluator(object):
         if not self.evaluated:
             self.evaluate(b_size)
 
-        r_idx = self.kg_test.relations
+        r_idx = self.kg_test.relations.long()
 
         neg_heads, neg_tails = self.sampler.corrupt_kg(b_size,
                                                        self.is_cuda,
@@ -6,6 +6,7 @@ Copyright TorchKGE developers
 from torch import empty, tensor
 from tqdm.autonotebook import tqdm
 
+from .evaluation import get_relation_batches
 from .exceptions import WrongArgumentsError
 from .utils import filter_scores
 from .utils.data import get_n_batches
@@ -138,9 +139,15 @@ class RelationInference(object):
                              unit='batch', disable=(not verbose),
                              desc='Inference'):
             ents1, ents2 = batch[0], batch[1]
-            h_emb, t_emb, _, candidates = self.model.inference_prepare_candidates(ents1, ents2, tensor([]).long(),
-                                                                                  entities=False)
-            scores = self.model.inference_scoring_function(h_emb, t_emb, candidates)
+            if hasattr(self.model, 'score_all_relations'):
+                scores = self.model.score_all_relations(ents1, ents2)
+            else:
+                h_emb, t_emb, _, candidates = \
+                    self.model.inference_prepare_candidates(ents1, ents2,
+                                                            tensor([]).long(),
+                                                            entities=False)
+                scores = self.model.inference_scoring_function(h_emb, t_emb,
+                                                               candidates)
 
             if self.dictionary is not None:
                 scores = filter_scores(scores, self.dictionary, ents1, ents2, None)
@@ -148,7 +155,7 @@ class RelationInference(object):
             scores, indices = scores.sort(descending=True)
 
             self.predictions[i * b_size: (i + 1) * b_size] = indices[:, :self.topk]
-            self.scores[i * b_size, (i + 1) * b_size] = scores[:, :self.topk]
+            self.scores[i * b_size: (i + 1) * b_size] = scores[:, :self.topk]
 
         if use_cuda:
             self.predictions = self.predictions.cpu()
@@ -217,16 +224,30 @@ class EntityInference(object):
         use_cuda = next(self.model.parameters()).is_cuda
 
         if use_cuda:
-            dataloader = DataLoader_(self.known_entities, self.known_relations, batch_size=b_size, use_cuda='batch')
             self.predictions = self.predictions.cuda()
-        else:
-            dataloader = DataLoader_(self.known_entities, self.known_relations, batch_size=b_size)
 
-        for i, batch in tqdm(enumerate(dataloader), total=len(dataloader),
-                             unit='batch', disable=(not verbose),
-                             desc='Inference'):
-            known_ents, known_rels = batch[0], batch[1]
-            if self.missing == 'heads':
+        if hasattr(self.model, 'projection_cache'):
+            # facts sharing a relation are scored together to reuse cached
+            # projections
+            batches = get_relation_batches(self.known_relations, b_size)
+        else:
+            batches = [slice(i * b_size, (i + 1) * b_size)
+                       for i in range(get_n_batches(len(self.known_entities),
+                                                    b_size))]
+
+        for batch in tqdm(batches, unit='batch', disable=(not verbose),
+                          desc='Inference'):
+            known_ents = self.known_entities[batch]
+            known_rels = self.known_relations[batch]
+            if use_cuda:
+                known_ents, known_rels = known_ents.cuda(), known_rels.cuda()
+            if self.missing == 'heads' and \
+                    hasattr(self.model, 'score_all_heads'):
+                scores = self.model.score_all_heads(known_ents, known_rels)
+            elif self.missing == 'tails' and \
+                    hasattr(self.model, 'score_all_tails'):
+                scores = self.model.score_all_tails(known_ents, known_rels)
+            elif self.missing == 'heads':
                 _, t_emb, rel_emb, candidates = self.model.inference_prepare_candidates(tensor([]).long(), known_ents,
                                                                                         known_rels,
                                                                                         entities=True)
@@ -242,8 +263,8 @@ class EntityInference(object):
 
             scores, indices = scores.sort(descending=True)
 
-            self.predictions[i * b_size: (i+1)*b_size] = indices[:, :self.top_k]
-            self.scores[i*b_size, (i+1)*b_size] = scores[:, :self.top_k]
+            self.predictions[batch] = indices[:, :self.top_k]
+            self.scores[batch] = scores[:, :self.top_k]
 
         if use_cuda:
             self.predictions = self.predictions.cpu()
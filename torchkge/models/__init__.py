@@ -1,15 +1,38 @@
-from .interfaces import Model, TranslationModel, BilinearModel
+from importlib import import_module
 
-from .translation import TransEModel
-from .translation import TransHModel
-from .translation import TransRModel
-from .translation import TransDModel
-from .translation import TorusEModel
+# models are imported from their module the first time they are accessed
+# (PEP 562) so that importing one family of models does not import the others
+_LAZY = {
+    'Model': 'interfaces',
+    'TranslationModel': 'interfaces',
+    'BilinearModel': 'interfaces',
 
-from .bilinear import RESCALModel
-from .bilinear import DistMultModel
-from .bilinear import HolEModel
-from .bilinear import ComplExModel
-from .bilinear import AnalogyModel
+    'TransEModel': 'translation',
+    'TransHModel': 'translation',
+    'TransRModel': 'translation',
+    'TransDModel': 'translation',
+    'TorusEModel': 'translation',
 
-from .deep import ConvKBModel
+    'RESCALModel': 'bilinear',
+    'DistMultModel': 'bilinear',
+    'HolEModel': 'bilinear',
+    'ComplExModel': 'bilinear',
+    'AnalogyModel': 'bilinear',
+
+    'ConvKBModel': 'deep',
+}
+
+__all__ = list(_LAZY)
+
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError('module {!r} has no attribute {!r}'.format(
+            __name__, name))
+    value = getattr(import_module('.' + _LAZY[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
@@ -4,7 +4,8 @@ Copyright TorchKGE developers
 @author: Armand Boschin <aboschin@enst.fr>
 """
 
-from torch import matmul, cat
+from torch import cat, einsum, matmul
+from torch.fft import irfft, rfft
 from torch.nn.functional import normalize
 
 from ..models.interfaces import BilinearModel
@@ -35,6 +36,10 @@ class RESCALModel(BilinearModel):
         Number of entities in the current data set.
     n_relations: int
         Number of relations in the current data set.
+    sparse: bool (opt, default = False)
+        If True, the embeddings produce sparse gradients, which makes the
+        model trainable with sparse optimizers (e.g. `torch.optim.SparseAdam`
+        or `torch.optim.Adagrad`).
 
     Attributes
     ----------
@@ -47,12 +52,13 @@ class RESCALModel(BilinearModel):
 
     """
 
-    def __init__(self, emb_dim, n_entities, n_relations):
+    def __init__(self, emb_dim, n_entities, n_relations, sparse=False):
         super().__init__(emb_dim, n_entities, n_relations)
 
         # initialize embedding objects
-        self.ent_emb = init_embedding(self.n_ent, self.emb_dim)
-        self.rel_mat = init_embedding(self.n_rel, self.emb_dim * self.emb_dim)
+        self.ent_emb = init_embedding(self.n_ent, self.emb_dim, sparse)
+        self.rel_mat = init_embedding(self.n_rel, self.emb_dim * self.emb_dim,
+                                      sparse)
 
         # normalize the embeddings
         self.normalize_parameters()
@@ -70,14 +76,27 @@ class RESCALModel(BilinearModel):
         hr = matmul(h.view(-1, 1, self.emb_dim), r)
         return (hr.view(-1, self.emb_dim) * t).sum(dim=1)
 
-    def normalize_parameters(self):
+    def normalize_parameters(self, ent_idx=None):
         """Normalize the entity embeddings, as explained in original paper.
         This methods should be called at the end of each training epoch and at
         the end of training as well.
 
+        Parameters
+        ----------
+        ent_idx: torch.Tensor, dtype: torch.long (opt, default = None)
+            Indices of the entities to normalize, e.g. the ones marked dirty
+            since the last normalization (see
+            :meth:`torchkge.models.interfaces.Model.get_dirty_entities`). By
+            default, all entities are normalized.
+
         """
-        self.ent_emb.weight.data = normalize(self.ent_emb.weight.data,
-                                             p=2, dim=1)
+        ent_idx = self.clean_entities(ent_idx)
+        if ent_idx is None:
+            self.ent_emb.weight.data = normalize(self.ent_emb.weight.data,
+                                                 p=2, dim=1)
+        else:
+            self.ent_emb.weight.data[ent_idx] = normalize(
+                self.ent_emb.weight.data[ent_idx], p=2, dim=1)
 
     def get_embeddings(self):
         """Return the embeddings of entities and matrices of relations.
@@ -142,6 +161,38 @@ class RESCALModel(BilinearModel):
 
         return h_emb, t_emb, r_mat, candidates
 
+    def score_all_tails(self, h_idx, r_idx, start=0, end=None):
+        """Compute the scores of all candidate tails with one matrix product.
+        See torchkge.models.interfaces.BilinearModel for more details on the
+        API.
+
+        """
+        hr = matmul(self.ent_emb(h_idx).view(-1, 1, self.emb_dim),
+                    self.rel_mat(r_idx).view(-1, self.emb_dim, self.emb_dim))
+        return matmul(hr.view(-1, self.emb_dim),
+                      self.ent_emb.weight.data[start:end].t())
+
+    def score_all_heads(self, t_idx, r_idx, start=0, end=None):
+        """Compute the scores of all candidate heads with one matrix product.
+        See torchkge.models.interfaces.BilinearModel for more details on the
+        API.
+
+        """
+        rt = matmul(self.rel_mat(r_idx).view(-1, self.emb_dim, self.emb_dim),
+                    self.ent_emb(t_idx).view(-1, self.emb_dim, 1))
+        return matmul(rt.view(-1, self.emb_dim),
+                      self.ent_emb.weight.data[start:end].t())
+
+    def score_all_relations(self, h_idx, t_idx):
+        """Compute the scores of all candidate relations without expanding the
+        relation matrices. See torchkge.models.interfaces.BilinearModel for
+        more details on the API.
+
+        """
+        rel_mat = self.rel_mat.weight.data.view(-1, self.emb_dim, self.emb_dim)
+        return einsum('bi,rij,bj->br', self.ent_emb(h_idx), rel_mat,
+                      self.ent_emb(t_idx))
+
 
 class DistMultModel(BilinearModel):
     """Implementation of DistMult model detailed in 2014 paper by Yang et al..
@@ -165,6 +216,10 @@ class DistMultModel(BilinearModel):
         Number of entities in the current data set.
     n_relations: int
         Number of relations in the current data set.
+    sparse: bool (opt, default = False)
+        If True, the embeddings produce sparse gradients, which makes the
+        model trainable with sparse optimizers (e.g. `torch.optim.SparseAdam`
+        or `torch.optim.Adagrad`).
 
     Attributes
     ----------
@@ -177,11 +232,11 @@ class DistMultModel(BilinearModel):
 
     """
 
-    def __init__(self, emb_dim, n_entities, n_relations):
+    def __init__(self, emb_dim, n_entities, n_relations, sparse=False):
         super().__init__(emb_dim, n_entities, n_relations)
 
-        self.ent_emb = init_embedding(self.n_ent, self.emb_dim)
-        self.rel_emb = init_embedding(self.n_rel, self.emb_dim)
+        self.ent_emb = init_embedding(self.n_ent, self.emb_dim, sparse)
+        self.rel_emb = init_embedding(self.n_rel, self.emb_dim, sparse)
 
         self.normalize_parameters()
 
@@ -198,14 +253,27 @@ class DistMultModel(BilinearModel):
 
         return (h * r * t).sum(dim=1)
 
-    def normalize_parameters(self):
+    def normalize_parameters(self, ent_idx=None):
         """Normalize the entity embeddings, as explained in original paper.
         This methods should be called at the end of each training epoch and at
         the end of training as well.
 
+        Parameters
+        ----------
+        ent_idx: torch.Tensor, dtype: torch.long (opt, default = None)
+            Indices of the entities to normalize, e.g. the ones marked dirty
+            since the last normalization (see
+            :meth:`torchkge.models.interfaces.Model.get_dirty_entities`). By
+            default, all entities are normalized.
+
         """
-        self.ent_emb.weight.data = normalize(self.ent_emb.weight.data, p=2,
-                                             dim=1)
+        ent_idx = self.clean_entities(ent_idx)
+        if ent_idx is None:
+            self.ent_emb.weight.data = normalize(self.ent_emb.weight.data,
+                                                 p=2, dim=1)
+        else:
+            self.ent_emb.weight.data[ent_idx] = normalize(
+                self.ent_emb.weight.data[ent_idx], p=2, dim=1)
 
     def get_embeddings(self):
         """Return the embeddings of entities and relations.
@@ -266,6 +334,33 @@ class DistMultModel(BilinearModel):
 
         return h, t, r, candidates
 
+    def score_all_tails(self, h_idx, r_idx, start=0, end=None):
+        """Compute the scores of all candidate tails with one matrix product.
+        See torchkge.models.interfaces.BilinearModel for more details on the
+        API.
+
+        """
+        hr = self.ent_emb(h_idx) * self.rel_emb(r_idx)
+        return matmul(hr, self.ent_emb.weight.data[start:end].t())
+
+    def score_all_heads(self, t_idx, r_idx, start=0, end=None):
+        """Compute the scores of all candidate heads with one matrix product.
+        See torchkge.models.interfaces.BilinearModel for more details on the
+        API.
+
+        """
+        rt = self.rel_emb(r_idx) * self.ent_emb(t_idx)
+        return matmul(rt, self.ent_emb.weight.data[start:end].t())
+
+    def score_all_relations(self, h_idx, t_idx):
+        """Compute the scores of all candidate relations with one matrix
+        product. See torchkge.models.interfaces.BilinearModel for more details
+        on the API.
+
+        """
+        ht = self.ent_emb(h_idx) * self.ent_emb(t_idx)
+        return matmul(ht, self.rel_emb.weight.data.t())
+
 
 class HolEModel(BilinearModel):
     """Implementation of HolE model detailed in 2015 paper by Nickel et al..
@@ -288,6 +383,10 @@ class HolEModel(BilinearModel):
         Number of entities in the current data set.
     n_relations: int
         Number of relations in the current data set.
+    sparse: bool (opt, default = False)
+        If True, the embeddings produce sparse gradients, which makes the
+        model trainable with sparse optimizers (e.g. `torch.optim.SparseAdam`
+        or `torch.optim.Adagrad`).
 
     Attributes
     ----------
@@ -300,11 +399,11 @@ class HolEModel(BilinearModel):
 
     """
 
-    def __init__(self, emb_dim, n_entities, n_relations):
+    def __init__(self, emb_dim, n_entities, n_relations, sparse=False):
         super().__init__(emb_dim, n_entities, n_relations)
 
-        self.ent_emb = init_embedding(self.n_ent, self.emb_dim)
-        self.rel_emb = init_embedding(self.n_rel, self.emb_dim)
+        self.ent_emb = init_embedding(self.n_ent, self.emb_dim, sparse)
+        self.rel_emb = init_embedding(self.n_rel, self.emb_dim, sparse)
 
         self.normalize_parameters()
 
@@ -313,14 +412,14 @@ class HolEModel(BilinearModel):
         :math:`h^T \\cdot M_r \\cdot t` where :math:`M_r` is the rolling matrix
         built from the relation embedding `r`. See referenced paper for more
         details on the score. See torchkge.models.interfaces.Models for more
-        details on the API.
+        details on the API. The product :math:`h^T \\cdot M_r` is the circular
+        convolution of `h` and `r`, which is computed with FFTs.
 
         """
         h = normalize(self.ent_emb(h_idx), p=2, dim=1)
         t = normalize(self.ent_emb(t_idx), p=2, dim=1)
-        r = self.get_rolling_matrix(self.rel_emb(r_idx))
-        hr = matmul(h.view(-1, 1, self.emb_dim), r)
-        return (hr.view(-1, self.emb_dim) * t).sum(dim=1)
+        r = self.rel_emb(r_idx)
+        return (self.circular_convolution(h, r) * t).sum(dim=1)
 
     @staticmethod
     def get_rolling_matrix(x):
@@ -339,14 +438,67 @@ class HolEModel(BilinearModel):
         x = x.view(b_size, 1, dim)
         return cat([x.roll(i, dims=2) for i in range(dim)], dim=1)
 
-    def normalize_parameters(self):
+    @staticmethod
+    def circular_convolution(a, b):
+        """Compute the circular convolution of the rows of `a` and `b` with
+        FFTs, in :math:`O(d \\log d)`. The result is equal to
+        `matmul(a.view(-1, 1, dim), get_rolling_matrix(b))` which is in
+        :math:`O(d^2)`.
+
+        Parameters
+        ----------
+        a: torch.Tensor, shape: (..., dim)
+        b: torch.Tensor, shape: (..., dim)
+
+        Returns
+        -------
+        conv: torch.Tensor, shape: (..., dim)
+            Tensor such that conv[j] = sum_i a[i] * b[j - i mod(dim)]
+        """
+        dim = a.shape[-1]
+        return irfft(rfft(a, dim=-1) * rfft(b, dim=-1), n=dim, dim=-1)
+
+    @staticmethod
+    def circular_correlation(a, b):
+        """Compute the circular correlation of the rows of `a` and `b` with
+        FFTs, in :math:`O(d \\log d)`. The result is equal to
+        `matmul(get_rolling_matrix(a), b.view(-1, dim, 1))` which is in
+        :math:`O(d^2)`.
+
+        Parameters
+        ----------
+        a: torch.Tensor, shape: (..., dim)
+        b: torch.Tensor, shape: (..., dim)
+
+        Returns
+        -------
+        corr: torch.Tensor, shape: (..., dim)
+            Tensor such that corr[i] = sum_j a[j - i mod(dim)] * b[j]
+        """
+        dim = a.shape[-1]
+        return irfft(rfft(a, dim=-1).conj() * rfft(b, dim=-1), n=dim, dim=-1)
+
+    def normalize_parameters(self, ent_idx=None):
         """Normalize the entity embeddings, as explained in original paper.
         This methods should be called at the end of each training epoch and at
         the end of training as well.
 
+        Parameters
+        ----------
+        ent_idx: torch.Tensor, dtype: torch.long (opt, default = None)
+            Indices of the entities to normalize, e.g. the ones marked dirty
+            since the last normalization (see
+            :meth:`torchkge.models.interfaces.Model.get_dirty_entities`). By
+            default, all entities are normalized.
+
         """
-        self.ent_emb.weight.data = normalize(self.ent_emb.weight.data, p=2,
-                                             dim=1)
+        ent_idx = self.clean_entities(ent_idx)
+        if ent_idx is None:
+            self.ent_emb.weight.data = normalize(self.ent_emb.weight.data,
+                                                 p=2, dim=1)
+        else:
+            self.ent_emb.weight.data[ent_idx] = normalize(
+                self.ent_emb.weight.data[ent_idx], p=2, dim=1)
 
     def get_embeddings(self):
         """Return the embeddings of entities and relations.
@@ -365,28 +517,28 @@ class HolEModel(BilinearModel):
     def inference_scoring_function(self, h, t, r):
         """Link prediction evaluation helper function. See
         torchkge.models.interfaces.Models for more details on the API.
+        Relations are given by their embeddings and not by their rolling
+        matrices, products with the latter being computed with FFTs.
 
         """
         b_size = h.shape[0]
 
         if len(t.shape) == 3:
-            assert (len(h.shape) == 2) & (len(r.shape) == 3)
+            assert (len(h.shape) == 2) & (len(r.shape) == 2)
             # this is the tail completion case in link prediction
-            h = h.view(b_size, 1, self.emb_dim)
-            hr = matmul(h, r).view(b_size, self.emb_dim, 1)
-            return (hr * t.transpose(1, 2)).sum(dim=1)
+            hr = self.circular_convolution(h, r).view(b_size, 1, self.emb_dim)
+            return (hr * t).sum(dim=2)
         elif len(h.shape) == 3:
-            assert (len(t.shape) == 2) & (len(r.shape) == 3)
+            assert (len(t.shape) == 2) & (len(r.shape) == 2)
             # this is the head completion case in link prediction
-            t = t.view(b_size, self.emb_dim, 1)
-            return (h.transpose(1, 2) * matmul(r, t)).sum(dim=1)
-        elif len(r.shape) == 4:
+            rt = self.circular_correlation(r, t).view(b_size, 1, self.emb_dim)
+            return (h * rt).sum(dim=2)
+        elif len(r.shape) == 3:
             assert (len(h.shape) == 2) & (len(t.shape) == 2)
             # this is the relation completion case in link prediction
-            h = h.view(b_size, 1, 1, self.emb_dim)
-            t = t.view(b_size, 1, self.emb_dim)
-            hr = matmul(h, r).view(b_size, self.n_rel, self.emb_dim)
-            return (hr * t).sum(dim=2)
+            # h^T M_c t = c^T corr(h, t)
+            ht = self.circular_correlation(h, t).view(b_size, 1, self.emb_dim)
+            return (r * ht).sum(dim=2)
 
     def inference_prepare_candidates(self, h_idx, t_idx, r_idx, entities=True):
         """Link prediction evaluation helper function. Get entities embeddings
@@ -398,17 +550,48 @@ class HolEModel(BilinearModel):
         b_size = h_idx.shape[0]
         h_emb = self.ent_emb(h_idx)
         t_emb = self.ent_emb(t_idx)
-        r_mat = self.get_rolling_matrix(self.rel_emb(r_idx))
+        r_emb = self.rel_emb(r_idx)
 
         if entities:
-            candidates = self.ent_emb.weight.data.view(1, self.n_ent, self.emb_dim)
+            candidates = self.ent_emb.weight.data.view(1, self.n_ent,
+                                                       self.emb_dim)
             candidates = candidates.expand(b_size, self.n_ent, self.emb_dim)
         else:
-            r_mat = self.get_rolling_matrix(self.rel_emb.weight.data)  # TODO: do not recompute for each batch
-            candidates = r_mat.view(1, self.n_rel, self.emb_dim, self.emb_dim)
-            candidates = candidates.expand(b_size, self.n_rel, self.emb_dim, self.emb_dim)
+            candidates = self.rel_emb.weight.data.view(1, self.n_rel,
+                                                       self.emb_dim)
+            candidates = candidates.expand(b_size, self.n_rel, self.emb_dim)
 
-        return h_emb, t_emb, r_mat, candidates
+        return h_emb, t_emb, r_emb, candidates
+
+    def score_all_tails(self, h_idx, r_idx, start=0, end=None):
+        """Compute the scores of all candidate tails with one matrix product.
+        See torchkge.models.interfaces.BilinearModel for more details on the
+        API.
+
+        """
+        hr = self.circular_convolution(self.ent_emb(h_idx),
+                                       self.rel_emb(r_idx))
+        return matmul(hr, self.ent_emb.weight.data[start:end].t())
+
+    def score_all_heads(self, t_idx, r_idx, start=0, end=None):
+        """Compute the scores of all candidate heads with one matrix product.
+        See torchkge.models.interfaces.BilinearModel for more details on the
+        API.
+
+        """
+        rt = self.circular_correlation(self.rel_emb(r_idx),
+                                       self.ent_emb(t_idx))
+        return matmul(rt, self.ent_emb.weight.data[start:end].t())
+
+    def score_all_relations(self, h_idx, t_idx):
+        """Compute the scores of all candidate relations with one matrix
+        product. See torchkge.models.interfaces.BilinearModel for more details
+        on the API.
+
+        """
+        ht = self.circular_correlation(self.ent_emb(h_idx),
+                                       self.ent_emb(t_idx))
+        return matmul(ht, self.rel_emb.weight.data.t())
 
 
 class ComplExModel(BilinearModel):
@@ -433,6 +616,10 @@ class ComplExModel(BilinearModel):
         Number of entities in the current data set.
     n_relations: int
         Number of relations in the current data set.
+    sparse: bool (opt, default = False)
+        If True, the embeddings produce sparse gradients, which makes the
+        model trainable with sparse optimizers (e.g. `torch.optim.SparseAdam`
+        or `torch.optim.Adagrad`).
 
     Attributes
     ----------
@@ -450,12 +637,12 @@ class ComplExModel(BilinearModel):
         Xavier uniform distribution.
     """
 
-    def __init__(self, emb_dim, n_entities, n_relations):
+    def __init__(self, emb_dim, n_entities, n_relations, sparse=False):
         super().__init__(emb_dim, n_entities, n_relations)
-        self.re_ent_emb = init_embedding(self.n_ent, self.emb_dim)
-        self.im_ent_emb = init_embedding(self.n_ent, self.emb_dim)
-        self.re_rel_emb = init_embedding(self.n_rel, self.emb_dim)
-        self.im_rel_emb = init_embedding(self.n_rel, self.emb_dim)
+        self.re_ent_emb = init_embedding(self.n_ent, self.emb_dim, sparse)
+        self.im_ent_emb = init_embedding(self.n_ent, self.emb_dim, sparse)
+        self.re_rel_emb = init_embedding(self.n_rel, self.emb_dim, sparse)
+        self.im_rel_emb = init_embedding(self.n_rel, self.emb_dim, sparse)
 
     def scoring_function(self, h_idx, t_idx, r_idx):
         """Compute the real part of the Hermitian product
@@ -472,7 +659,7 @@ class ComplExModel(BilinearModel):
         return (re_h * (re_r * re_t + im_r * im_t) + im_h * (
                     re_r * im_t - im_r * re_t)).sum(dim=1)
 
-    def normalize_parameters(self):
+    def normalize_parameters(self, ent_idx=None):
         """According to original paper, the embeddings should not be
         normalized.
 
@@ -555,6 +742,49 @@ class ComplExModel(BilinearModel):
 
         return (re_h, im_h), (re_t, im_t), (re_r, im_r), (re_candidates, im_candidates)
 
+    def score_all_tails(self, h_idx, r_idx, start=0, end=None):
+        """Compute the scores of all candidate tails with matrix products. See
+        torchkge.models.interfaces.BilinearModel for more details on the API.
+
+        """
+        re_h, im_h = self.re_ent_emb(h_idx), self.im_ent_emb(h_idx)
+        re_r, im_r = self.re_rel_emb(r_idx), self.im_rel_emb(r_idx)
+
+        re_c = self.re_ent_emb.weight.data[start:end]
+        im_c = self.im_ent_emb.weight.data[start:end]
+
+        scores = matmul(re_h * re_r - im_h * im_r, re_c.t())
+        return scores.addmm_(re_h * im_r + im_h * re_r, im_c.t())
+
+    def score_all_heads(self, t_idx, r_idx, start=0, end=None):
+        """Compute the scores of all candidate heads with matrix products. See
+        torchkge.models.interfaces.BilinearModel for more details on the API.
+
+        """
+        re_t, im_t = self.re_ent_emb(t_idx), self.im_ent_emb(t_idx)
+        re_r, im_r = self.re_rel_emb(r_idx), self.im_rel_emb(r_idx)
+
+        re_c = self.re_ent_emb.weight.data[start:end]
+        im_c = self.im_ent_emb.weight.data[start:end]
+
+        scores = matmul(re_r * re_t + im_r * im_t, re_c.t())
+        return scores.addmm_(re_r * im_t - im_r * re_t, im_c.t())
+
+    def score_all_relations(self, h_idx, t_idx):
+        """Compute the scores of all candidate relations with matrix products.
+        See torchkge.models.interfaces.BilinearModel for more details on the
+        API.
+
+        """
+        re_h, im_h = self.re_ent_emb(h_idx), self.im_ent_emb(h_idx)
+        re_t, im_t = self.re_ent_emb(t_idx), self.im_ent_emb(t_idx)
+
+        re_c = self.re_rel_emb.weight.data
+        im_c = self.im_rel_emb.weight.data
+
+        scores = matmul(re_h * re_t + im_h * im_t, re_c.t())
+        return scores.addmm_(re_h * im_t - im_h * re_t, im_c.t())
+
 
 class AnalogyModel(BilinearModel):
     """Implementation of ANALOGY model detailed in 2017 paper by Liu et al..
@@ -582,6 +812,10 @@ class AnalogyModel(BilinearModel):
     scalar_share: float
         Share of the diagonal elements of the relation-specific matrices to be
         scalars. By default it is set to half according to the original paper.
+    sparse: bool (opt, default = False)
+        If True, the embeddings produce sparse gradients, which makes the
+        model trainable with sparse optimizers (e.g. `torch.optim.SparseAdam`
+        or `torch.optim.Adagrad`).
 
     Attributes
     ----------
@@ -617,19 +851,20 @@ class AnalogyModel(BilinearModel):
         diagonal matrices can be seen as complex matrices.
     """
 
-    def __init__(self, emb_dim, n_entities, n_relations, scalar_share=0.5):
+    def __init__(self, emb_dim, n_entities, n_relations, scalar_share=0.5,
+                 sparse=False):
         super().__init__(emb_dim, n_entities, n_relations)
 
         self.scalar_dim = int(self.emb_dim * scalar_share)
         self.complex_dim = int((self.emb_dim - self.scalar_dim))
 
-        self.sc_ent_emb = init_embedding(self.n_ent, self.scalar_dim)
-        self.re_ent_emb = init_embedding(self.n_ent, self.complex_dim)
-        self.im_ent_emb = init_embedding(self.n_ent, self.complex_dim)
+        self.sc_ent_emb = init_embedding(self.n_ent, self.scalar_dim, sparse)
+        self.re_ent_emb = init_embedding(self.n_ent, self.complex_dim, sparse)
+        self.im_ent_emb = init_embedding(self.n_ent, self.complex_dim, sparse)
 
-        self.sc_rel_emb = init_embedding(self.n_rel, self.scalar_dim)
-        self.re_rel_emb = init_embedding(self.n_rel, self.complex_dim)
-        self.im_rel_emb = init_embedding(self.n_rel, self.complex_dim)
+        self.sc_rel_emb = init_embedding(self.n_rel, self.scalar_dim, sparse)
+        self.re_rel_emb = init_embedding(self.n_rel, self.complex_dim, sparse)
+        self.im_rel_emb = init_embedding(self.n_rel, self.complex_dim, sparse)
 
     def scoring_function(self, h_idx, t_idx, r_idx):
         """Compute the scoring function for the triplets given as argument:
@@ -649,7 +884,7 @@ class AnalogyModel(BilinearModel):
         return ((sc_h * sc_r * sc_t).sum(dim=1) +
                 (re_h * (re_r * re_t + im_r * im_t) + im_h * (re_r * im_t - im_r * re_t)).sum(dim=1))
 
-    def normalize_parameters(self):
+    def normalize_parameters(self, ent_idx=None):
         """According to original paper, the embeddings should not be
         normalized.
         """
@@ -761,3 +996,67 @@ class AnalogyModel(BilinearModel):
                (sc_t, re_t, im_t), \
                (sc_r, re_r, im_r), \
                (sc_candidates, re_candidates, im_candidates)
+
+    def score_all_tails(self, h_idx, r_idx, start=0, end=None):
+        """Compute the scores of all candidate tails with matrix products. See
+        torchkge.models.interfaces.BilinearModel for more details on the API.
+
+        """
+        sc_h = self.sc_ent_emb(h_idx)
+        re_h = self.re_ent_emb(h_idx)
+        im_h = self.im_ent_emb(h_idx)
+
+        sc_r = self.sc_rel_emb(r_idx)
+        re_r = self.re_rel_emb(r_idx)
+        im_r = self.im_rel_emb(r_idx)
+
+        sc_c = self.sc_ent_emb.weight.data[start:end]
+        re_c = self.re_ent_emb.weight.data[start:end]
+        im_c = self.im_ent_emb.weight.data[start:end]
+
+        scores = matmul(sc_h * sc_r, sc_c.t())
+        scores.addmm_(re_h * re_r - im_h * im_r, re_c.t())
+        return scores.addmm_(re_h * im_r + im_h * re_r, im_c.t())
+
+    def score_all_heads(self, t_idx, r_idx, start=0, end=None):
+        """Compute the scores of all candidate heads with matrix products. See
+        torchkge.models.interfaces.BilinearModel for more details on the API.
+
+        """
+        sc_t = self.sc_ent_emb(t_idx)
+        re_t = self.re_ent_emb(t_idx)
+        im_t = self.im_ent_emb(t_idx)
+
+        sc_r = self.sc_rel_emb(r_idx)
+        re_r = self.re_rel_emb(r_idx)
+        im_r = self.im_rel_emb(r_idx)
+
+        sc_c = self.sc_ent_emb.weight.data[start:end]
+        re_c = self.re_ent_emb.weight.data[start:end]
+        im_c = self.im_ent_emb.weight.data[start:end]
+
+        scores = matmul(sc_r * sc_t, sc_c.t())
+        scores.addmm_(re_r * re_t + im_r * im_t, re_c.t())
+        return scores.addmm_(re_r * im_t - im_r * re_t, im_c.t())
+
+    def score_all_relations(self, h_idx, t_idx):
+        """Compute the scores of all candidate relations with matrix products.
+        See torchkge.models.interfaces.BilinearModel for more details on the
+        API.
+
+        """
+        sc_h = self.sc_ent_emb(h_idx)
+        re_h = self.re_ent_emb(h_idx)
+        im_h = self.im_ent_emb(h_idx)
+
+        sc_t = self.sc_ent_emb(t_idx)
+        re_t = self.re_ent_emb(t_idx)
+        im_t = self.im_ent_emb(t_idx)
+
+        sc_c = self.sc_rel_emb.weight.data
+        re_c = self.re_rel_emb.weight.data
+        im_c = self.im_rel_emb.weight.data
+
+        scores = matmul(sc_h * sc_t, sc_c.t())
+        scores.addmm_(re_h * re_t + im_h * im_t, re_c.t())
+        return scores.addmm_(re_h * im_t - im_h * re_t, im_c.t())
@@ -36,6 +36,10 @@ class ConvKBModel(Model):
         Number of entities in the current data set.
     n_relations: int
         Number of relations in the current data set.
+    sparse: bool (opt, default = False)
+        If True, the embeddings produce sparse gradients, which makes the
+        model trainable with sparse optimizers (e.g. `torch.optim.SparseAdam`
+        or `torch.optim.Adagrad`).
 
     Attributes
     ----------
@@ -48,12 +52,13 @@ class ConvKBModel(Model):
 
     """
 
-    def __init__(self, emb_dim, n_filters, n_entities, n_relations):
+    def __init__(self, emb_dim, n_filters, n_entities, n_relations,
+                 sparse=False):
         super().__init__(n_entities, n_relations)
         self.emb_dim = emb_dim
 
-        self.ent_emb = init_embedding(self.n_ent, self.emb_dim)
-        self.rel_emb = init_embedding(self.n_rel, self.emb_dim)
+        self.ent_emb = init_embedding(self.n_ent, self.emb_dim, sparse)
+        self.rel_emb = init_embedding(self.n_rel, self.emb_dim, sparse)
 
         self.convlayer = nn.Sequential(nn.Conv1d(3, n_filters, 1, stride=1),
                                        nn.ReLU())
@@ -76,7 +81,7 @@ class ConvKBModel(Model):
 
         return self.output(self.convlayer(concat).reshape(b_size, -1))[:, 1]
 
-    def normalize_parameters(self):
+    def normalize_parameters(self, ent_idx=None):
         """Normalize the entity embeddings, as explained in original paper.
         This methods should be called at the end of each training epoch and at
         the end of training as well.
@@ -106,15 +111,20 @@ class ConvKBModel(Model):
         b_size = h.shape[0]
 
         if (len(h.shape) == 2) & (len(t.shape) == 4) & (len(r.shape) == 2):
-            concat = cat((h.view(b_size, 1, 1, self.emb_dim).expand(b_size, self.n_ent, 1, self.emb_dim),
-                          r.view(b_size, 1, 1, self.emb_dim).expand(b_size, self.n_ent, 1, self.emb_dim),
+            n_cand = t.shape[1]
+            shape = (b_size, n_cand, 1, self.emb_dim)
+            concat = cat((h.view(b_size, 1, 1, self.emb_dim).expand(shape),
+                          r.view(b_size, 1, 1, self.emb_dim).expand(shape),
                           t), dim=2)
             concat = concat.reshape(-1, 3, self.emb_dim)
 
         elif (len(h.shape) == 4) & (len(t.shape) == 2) & (len(r.shape) == 2):
+            n_cand = h.shape[1]
+            shape = (b_size, n_cand, 1, self.emb_dim)
             concat = cat((h,
-                          r.view(b_size, 1, 1, self.emb_dim).expand(b_size, self.n_ent, 1, self.emb_dim),
-                          t.view(b_size, 1, 1, self.emb_dim).expand(b_size, self.n_ent, 1, self.emb_dim)), dim=2)
+                          r.view(b_size, 1, 1, self.emb_dim).expand(shape),
+                          t.view(b_size, 1, 1, self.emb_dim).expand(shape)),
+                         dim=2)
             concat = concat.reshape(-1, 3, self.emb_dim)
 
         else:
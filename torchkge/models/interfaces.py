@@ -4,10 +4,13 @@ Copyright TorchKGE developers
 @author: Armand Boschin <aboschin@enst.fr>
 """
 
+from torch import arange, empty, is_grad_enabled, ones, stack, zeros_like
 from torch.nn import Module
 
 from ..utils.dissimilarities import l1_dissimilarity, l2_dissimilarity, \
-    l1_torus_dissimilarity, l2_torus_dissimilarity, el2_torus_dissimilarity
+    l1_torus_dissimilarity, l2_torus_dissimilarity, el2_torus_dissimilarity, \
+    l1_pairwise_dissimilarity, l2_pairwise_dissimilarity, \
+    blocked_pairwise_dissimilarity
 
 
 class Model(Module):
@@ -29,12 +32,24 @@ class Model(Module):
         Number of entities to be embedded.
     n_rel: int
         Number of relations to be embedded.
+    dirty_entities: torch.Tensor, dtype: torch.bool, shape: (n_ent)
+        Mask of the entities whose parameters may have changed since they
+        were last normalized. Entities used in the `forward` method with
+        gradients enabled are marked dirty and, if the optimizer only updates
+        those, they can be given to `normalize_parameters` (see
+        `get_dirty_entities`).
 
     """
     def __init__(self, n_entities, n_relations):
         super().__init__()
         self.n_ent = n_entities
         self.n_rel = n_relations
+        self.register_buffer('dirty_entities', ones(n_entities).bool(),
+                             persistent=False)
+
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        super()._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+        self.mark_dirty()
 
     def forward(self, heads, tails, relations, negative_heads, negative_tails, negative_relations=None):
         """
@@ -47,37 +62,58 @@ class Model(Module):
             Integer keys of the current batch's tails.
         relations: torch.Tensor, dtype: torch.long, shape: (batch_size)
             Integer keys of the current batch's relations.
-        negative_heads: torch.Tensor, dtype: torch.long, shape: (batch_size)
-            Integer keys of the current batch's negatively sampled heads.
-        negative_tails: torch.Tensor, dtype: torch.long, shape: (batch_size)
-            Integer keys of the current batch's negatively sampled tails.ze)
-        negative_relations: torch.Tensor, dtype: torch.long, shape: (batch_size)
+        negative_heads: torch.Tensor, dtype: torch.long,
+        shape: (n_neg * batch_size)
+            Integer keys of the current batch's negatively sampled heads. If
+            several negative facts are sampled from each fact, the `j`-th
+            negative of the `i`-th fact is at index `j * batch_size + i`, as
+            returned by the `corrupt_batch` methods of the negative samplers.
+        negative_tails: torch.Tensor, dtype: torch.long,
+        shape: (n_neg * batch_size)
+            Integer keys of the current batch's negatively sampled tails.
+        negative_relations: torch.Tensor, dtype: torch.long,
+        shape: (batch_size) or (n_neg * batch_size)
             Integer keys of the current batch's negatively sampled relations.
 
         Returns
         -------
         positive_triplets: torch.Tensor, dtype: torch.float, shape: (b_size)
             Scoring function evaluated on true triples.
-        negative_triplets: torch.Tensor, dtype: torch.float, shape: (b_size)
-            Scoring function evaluated on negatively sampled triples.
+        negative_triplets: torch.Tensor, dtype: torch.float,
+        shape: (b_size) or (b_size, n_neg)
+            Scoring function evaluated on negatively sampled triples. If
+            several negative facts are sampled from each fact, row `i`
+            contains the scores of the negatives of the `i`-th true fact.
 
         """
+        # indices can be stored in a compact type (see
+        # KnowledgeGraph.index_dtype)
+        heads, tails, relations = heads.long(), tails.long(), relations.long()
+        negative_heads = negative_heads.long()
+        negative_tails = negative_tails.long()
+        if negative_relations is not None:
+            negative_relations = negative_relations.long()
+
         pos = self.scoring_function(heads, tails, relations)
 
+        # several negative samples can be sampled from each fact
+        n_neg = negative_heads.shape[0] // heads.shape[0]
+
         if negative_relations is None:
             negative_relations = relations
+        if negative_relations.shape[0] < negative_heads.shape[0]:
+            negative_relations = negative_relations.repeat(n_neg)
 
-        if negative_heads.shape[0] > negative_relations.shape[0]:
-            # in that case, several negative samples are sampled from each fact
-            n_neg = int(negative_heads.shape[0] / negative_relations.shape[0])
-            pos = pos.repeat(n_neg)
-            neg = self.scoring_function(negative_heads,
-                                        negative_tails,
-                                        negative_relations.repeat(n_neg))
-        else:
-            neg = self.scoring_function(negative_heads,
-                                        negative_tails,
-                                        negative_relations)
+        neg = self.scoring_function(negative_heads,
+                                    negative_tails,
+                                    negative_relations)
+        if n_neg > 1:
+            neg = neg.view(n_neg, -1).t()
+
+        if is_grad_enabled():
+            # these are the only rows updated by a sparse or plain SGD step
+            for idx in [heads, tails, negative_heads, negative_tails]:
+                self.mark_dirty(idx)
 
         return pos, neg
 
@@ -101,13 +137,79 @@ class Model(Module):
         """
         raise NotImplementedError
 
-    def normalize_parameters(self):
+    def normalize_parameters(self, ent_idx=None):
         """Normalize some parameters. This methods should be end at the end of
         each training epoch and at the end of training as well.
 
+        Parameters
+        ----------
+        ent_idx: torch.Tensor, dtype: torch.long (opt, default = None)
+            Indices of the entities whose parameters should be normalized.
+            If None, all entities are normalized. Parameters of relations are
+            always normalized entirely.
+
         """
         raise NotImplementedError
 
+    def mark_dirty(self, ent_idx=None):
+        """Record that the parameters of some entities changed and should be
+        normalized again. This should be called if parameters are modified
+        outside of the `forward` method, e.g. by an optimizer also updating
+        the rows which were not used in the batch (momentum, weight decay).
+
+        Parameters
+        ----------
+        ent_idx: torch.Tensor, dtype: torch.long (opt, default = None)
+            Indices of the modified entities. If None, all entities are
+            marked dirty.
+
+        """
+        if ent_idx is None:
+            self.dirty_entities.fill_(True)
+        else:
+            self.dirty_entities[ent_idx.long()] = True
+
+    def get_dirty_entities(self):
+        """Return the entities marked dirty since they were last normalized.
+        When the optimizer only updates the embeddings used in the batches
+        (see :func:`torchkge.utils.training.updates_used_rows_only`), giving
+        them to `normalize_parameters` saves normalizing all entities.
+
+        Returns
+        -------
+        ent_idx: torch.Tensor, dtype: torch.long
+            Indices of the dirty entities or None if all of them are dirty.
+
+        """
+        if self.dirty_entities.all():
+            return None
+        return self.dirty_entities.nonzero().flatten()
+
+    def clean_entities(self, ent_idx=None):
+        """Return the entities whose parameters should be normalized and mark
+        them as clean. This is called by `normalize_parameters`.
+
+        Parameters
+        ----------
+        ent_idx: torch.Tensor, dtype: torch.long (opt, default = None)
+            Indices of the entities to normalize. If None, all entities are.
+
+        Returns
+        -------
+        ent_idx: torch.Tensor, dtype: torch.long
+            Indices of the entities to normalize or None if all of them
+            should be.
+
+        """
+        if ent_idx is not None:
+            # indices can be stored in a compact type (see
+            # KnowledgeGraph.index_dtype)
+            ent_idx = ent_idx.long()
+            self.dirty_entities[ent_idx] = False
+            return ent_idx
+        self.dirty_entities.fill_(False)
+        return None
+
     def get_embeddings(self):
         """Return the tensors representing entities and relations in current
         model.
@@ -173,6 +275,54 @@ class Model(Module):
         """
         raise NotImplementedError
 
+    def inference_slice_candidates(self, candidates, start, end):
+        """Link prediction evaluation helper function. Restrict the
+        candidates returned by `inference_prepare_candidates` to the ones of
+        indices between `start` (included) and `end` (excluded). This is used
+        to score the candidates block by block.
+
+        Parameters
+        ----------
+        candidates: torch.Tensor or tuple of torch.Tensor, shape: (b_size,
+            n_candidates, ...)
+            Candidates as returned by `inference_prepare_candidates`.
+        start: int
+        end: int
+
+        Returns
+        -------
+        candidates: torch.Tensor or tuple of torch.Tensor, shape: (b_size,
+            end - start, ...)
+
+        """
+        if isinstance(candidates, tuple):
+            return tuple(c[:, start:end] for c in candidates)
+        return candidates[:, start:end]
+
+    def inference_gather_candidates(self, candidates, idx):
+        """Link prediction evaluation helper function. For each sample `i`
+        of the batch, keep only the candidate of index `idx[i]` among the
+        candidates returned by `inference_prepare_candidates`.
+
+        Parameters
+        ----------
+        candidates: torch.Tensor or tuple of torch.Tensor, shape: (b_size,
+            n_candidates, ...)
+            Candidates as returned by `inference_prepare_candidates`.
+        idx: torch.Tensor, shape: (b_size), dtype: torch.long
+
+        Returns
+        -------
+        candidates: torch.Tensor or tuple of torch.Tensor, shape: (b_size, 1,
+            ...)
+
+        """
+        if isinstance(candidates, tuple):
+            return tuple(self.inference_gather_candidates(c, idx)
+                         for c in candidates)
+        rows = arange(idx.shape[0], device=candidates.device)
+        return candidates[rows, idx.to(candidates.device)].unsqueeze(1)
+
 
 class TranslationModel(Model):
     """Model interface to be used by any other class implementing a
@@ -194,6 +344,8 @@ class TranslationModel(Model):
     ----------
     dissimilarity: function
         Dissimilarity function.
+    dissimilarity_type: str
+        One of 'L1', 'L2', 'torus_L1', 'torus_L2' and 'torus_eL2'.
 
     """
     def __init__(self, n_entities, n_relations, dissimilarity_type):
@@ -201,6 +353,7 @@ class TranslationModel(Model):
 
         assert dissimilarity_type in ['L1', 'L2', 'torus_L1', 'torus_L2',
                                       'torus_eL2']
+        self.dissimilarity_type = dissimilarity_type
 
         if dissimilarity_type == 'L1':
             self.dissimilarity = l1_dissimilarity
@@ -213,13 +366,162 @@ class TranslationModel(Model):
         else:
             self.dissimilarity = el2_torus_dissimilarity
 
+    def pairwise_dissimilarity(self, a, b):
+        """Compute the dissimilarities between all rows of `a` and all rows
+        of `b`. This is used to score all candidates at once without building
+        the (b_size, n_cand, emb_dim) tensor of differences: L2 relies on
+        one matrix product, L1 on `torch.cdist` and torus dissimilarities
+        process the candidates by blocks.
+
+        Parameters
+        ----------
+        a: torch.Tensor, shape: (b_size, emb_dim), dtype: torch.float
+        b: torch.Tensor, shape: (n_cand, emb_dim), dtype: torch.float
+
+        Returns
+        -------
+        dissimilarities: torch.Tensor, shape: (b_size, n_cand),
+        dtype: torch.float
+
+        """
+        if self.dissimilarity_type == 'L1':
+            return l1_pairwise_dissimilarity(a, b)
+        elif self.dissimilarity_type == 'L2':
+            return l2_pairwise_dissimilarity(a, b)
+        else:
+            return blocked_pairwise_dissimilarity(self.dissimilarity, a, b)
+
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        # projections of entities used to be stored as a parameter
+        state_dict.pop(prefix + 'projected_entities', None)
+        if hasattr(self, 'projection_cache'):
+            self.evaluated_projections = False
+        super()._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
+    def get_projected_entities(self, r):
+        """Return the projections of all entities in the space of relation
+        `r`. This is only available for models projecting entities in
+        relation-specific spaces, which implement a `project_entities` method
+        and have a `projection_cache` attribute
+        (:class:`torchkge.utils.modeling.ProjectionCache`). Cached projections
+        are dropped if the model was trained since they were computed.
+
+        Parameters
+        ----------
+        r: int
+            Index of the relation.
+
+        Returns
+        -------
+        proj: torch.Tensor, shape: (n_ent, rel_emb_dim), dtype: torch.float
+            Projections of all entities.
+
+        """
+        if not self.evaluated_projections:
+            self.projection_cache.clear()
+            self.evaluated_projections = True
+        return self.projection_cache[r]
+
+    def get_projected_candidates(self, r_idx):
+        """Return the projections of all entities for each relation of the
+        batch. If all facts share the same relation, the result is a view of
+        the cached projections so that no copy is done. Otherwise the
+        projections are copied for each fact, so callers should group facts
+        by relation (see `torchkge.evaluation.get_relation_batches`) or score
+        candidates with `score_all_projected`.
+
+        Parameters
+        ----------
+        r_idx: torch.Tensor, shape: (b_size), dtype: torch.long
+            List of relations indices.
+
+        Returns
+        -------
+        candidates: torch.Tensor, shape: (b_size, n_ent, rel_emb_dim),
+        dtype: torch.float
+
+        """
+        relations, inverse = r_idx.unique(return_inverse=True)
+        if len(relations) == 1:
+            proj = self.get_projected_entities(relations[0])
+            return proj.view(1, *proj.shape).expand(r_idx.shape[0],
+                                                    *proj.shape)
+        return stack([self.get_projected_entities(r)
+                      for r in relations])[inverse]
+
+    def fill_projection_cache(self, verbose=True):
+        """Empty the projection cache and project all entities for as many
+        relations as the cache can hold. See `get_projected_entities`.
+
+        """
+        from tqdm.autonotebook import tqdm
+
+        cache = self.projection_cache
+        cache.clear()
+        self.evaluated_projections = True
+
+        for r in tqdm(range(self.n_rel), unit='relations',
+                      disable=(not verbose), desc='Projecting entities'):
+            cache[r]
+            n_cached = len(cache)
+            # stop when the projections of one more relation would not fit
+            if n_cached == 0 or \
+                    cache.size * (n_cached + 1) > cache.max_size * n_cached:
+                break
+
+    def score_all_projected(self, ent_idx, r_idx, start=0, end=None,
+                            heads=False):
+        """Compute the scores of all candidate tails (or heads) for models
+        projecting entities in relation-specific spaces. Facts are grouped by
+        relation so that the projections of each relation are fetched once
+        from the cache, and the candidates are scored with
+        `pairwise_dissimilarity`.
+
+        Parameters
+        ----------
+        ent_idx: torch.Tensor, shape: (b_size), dtype: torch.long
+            List of the indices of known heads (or tails if `heads` is True).
+        r_idx: torch.Tensor, shape: (b_size), dtype: torch.long
+            List of relations indices.
+        start: int, optional (default=0)
+            Index of the first candidate entity to score.
+        end: int, optional (default=None)
+            Index after the last candidate entity to score. If None, all
+            entities starting from `start` are scored.
+        heads: bool, optional (default=False)
+            Indicates whether the candidates are heads or tails.
+
+        Returns
+        -------
+        scores: torch.Tensor, shape: (b_size, end - start), dtype: torch.float
+
+        """
+        if end is None:
+            end = self.n_ent
+        r = self.rel_emb(r_idx)
+        scores = empty(size=(r_idx.shape[0], end - start), device=r.device)
+
+        relations, inverse = r_idx.unique(return_inverse=True)
+        for i, rel in enumerate(relations):
+            rows = (inverse == i).nonzero().view(-1)
+            proj = self.get_projected_entities(rel)
+            if heads:
+                # d(c + r, t) = d(t - r, c) for all dissimilarities
+                queries = proj[ent_idx[rows]] - r[rows]
+            else:
+                queries = proj[ent_idx[rows]] + r[rows]
+            scores[rows] = - self.pairwise_dissimilarity(queries,
+                                                         proj[start:end])
+
+        return scores
+
     def scoring_function(self, h_idx, t_idx, r_idx):
         """See torchkge.models.interfaces.Models.
 
         """
         raise NotImplementedError
 
-    def normalize_parameters(self):
+    def normalize_parameters(self, ent_idx=None):
         """See torchkge.models.interfaces.Models.
 
         """
@@ -278,6 +580,9 @@ class BilinearModel(Model):
     the interface :class:`torchkge.models.interfaces.Model`. It is only
     required to implement the methods `scoring_function`,
     `normalize_parameters`, `inference_prepare_candidates` and `inference_scoring_function`.
+    Implementing `score_all_tails`, `score_all_heads` and
+    `score_all_relations` with matrix products makes evaluation and inference
+    faster.
 
     Parameters
     ----------
@@ -299,13 +604,92 @@ class BilinearModel(Model):
         super().__init__(n_entities, n_relations)
         self.emb_dim = emb_dim
 
+    def score_all_tails(self, h_idx, r_idx, start=0, end=None):
+        """Compute the scores of (h, r, c) for any candidate entity c. This
+        is used in place of `inference_prepare_candidates` and
+        `inference_scoring_function` for link prediction and inference. This
+        generic version relies on these two methods. Models can overwrite it
+        with a matrix-multiply version which does not build the
+        (b_size, n_ent, emb_dim) candidates tensor.
+
+        Parameters
+        ----------
+        h_idx: torch.Tensor, shape: (b_size), dtype: torch.long
+            List of heads indices.
+        r_idx: torch.Tensor, shape: (b_size), dtype: torch.long
+            List of relations indices.
+        start: int, optional (default=0)
+            Index of the first candidate entity to score.
+        end: int, optional (default=None)
+            Index after the last candidate entity to score. If None, all
+            entities starting from `start` are scored.
+
+        Returns
+        -------
+        scores: torch.Tensor, shape: (b_size, end - start), dtype: torch.float
+            Scores of each candidate for each triple.
+
+        """
+        h, _, r, candidates = self.inference_prepare_candidates(
+            h_idx, zeros_like(h_idx), r_idx, entities=True)
+        candidates = self.inference_slice_candidates(candidates, start, end)
+        return self.inference_scoring_function(h, candidates, r)
+
+    def score_all_heads(self, t_idx, r_idx, start=0, end=None):
+        """Compute the scores of (c, r, t) for any candidate entity c. See
+        `score_all_tails` for more details.
+
+        Parameters
+        ----------
+        t_idx: torch.Tensor, shape: (b_size), dtype: torch.long
+            List of tails indices.
+        r_idx: torch.Tensor, shape: (b_size), dtype: torch.long
+            List of relations indices.
+        start: int, optional (default=0)
+            Index of the first candidate entity to score.
+        end: int, optional (default=None)
+            Index after the last candidate entity to score. If None, all
+            entities starting from `start` are scored.
+
+        Returns
+        -------
+        scores: torch.Tensor, shape: (b_size, end - start), dtype: torch.float
+            Scores of each candidate for each triple.
+
+        """
+        _, t, r, candidates = self.inference_prepare_candidates(
+            zeros_like(t_idx), t_idx, r_idx, entities=True)
+        candidates = self.inference_slice_candidates(candidates, start, end)
+        return self.inference_scoring_function(candidates, t, r)
+
+    def score_all_relations(self, h_idx, t_idx):
+        """Compute the scores of (h, c, t) for any candidate relation c. See
+        `score_all_tails` for more details.
+
+        Parameters
+        ----------
+        h_idx: torch.Tensor, shape: (b_size), dtype: torch.long
+            List of heads indices.
+        t_idx: torch.Tensor, shape: (b_size), dtype: torch.long
+            List of tails indices.
+
+        Returns
+        -------
+        scores: torch.Tensor, shape: (b_size, n_rel), dtype: torch.float
+            Scores of each candidate for each triple.
+
+        """
+        h, t, _, candidates = self.inference_prepare_candidates(
+            h_idx, t_idx, zeros_like(h_idx), entities=False)
+        return self.inference_scoring_function(h, t, candidates)
+
     def scoring_function(self, h_idx, t_idx, r_idx):
         """See torchkge.models.interfaces.Models.
 
         """
         raise NotImplementedError
 
-    def normalize_parameters(self):
+    def normalize_parameters(self, ent_idx=None):
         """See torchkge.models.interfaces.Models.
 
         """
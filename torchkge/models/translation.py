@@ -4,15 +4,11 @@ Copyright TorchKGE developers
 @author: Armand Boschin <aboschin@enst.fr>
 """
 
-from torch import empty, matmul, tensor
-from torch.cuda import empty_cache
-from torch.nn import Parameter
+from torch import arange, einsum, matmul
 from torch.nn.functional import normalize
 
 from ..models.interfaces import TranslationModel
-from ..utils import init_embedding
-
-from tqdm.autonotebook import tqdm
+from ..utils import init_embedding, ProjectionCache
 
 
 class TransEModel(TranslationModel):
@@ -41,6 +37,10 @@ class TransEModel(TranslationModel):
         Number of relations in the current data set.
     dissimilarity_type: str
         Either 'L1' or 'L2'.
+    sparse: bool (opt, default = False)
+        If True, the embeddings produce sparse gradients, which makes the
+        model trainable with sparse optimizers (e.g. `torch.optim.SparseAdam`
+        or `torch.optim.Adagrad`).
 
     Attributes
     ----------
@@ -55,16 +55,18 @@ class TransEModel(TranslationModel):
 
     """
 
-    def __init__(self, emb_dim, n_entities, n_relations, dissimilarity_type='L2'):
+    def __init__(self, emb_dim, n_entities, n_relations,
+                 dissimilarity_type='L2', sparse=False):
 
         super().__init__(n_entities, n_relations, dissimilarity_type)
 
         self.emb_dim = emb_dim
-        self.ent_emb = init_embedding(self.n_ent, self.emb_dim)
-        self.rel_emb = init_embedding(self.n_rel, self.emb_dim)
+        self.ent_emb = init_embedding(self.n_ent, self.emb_dim, sparse)
+        self.rel_emb = init_embedding(self.n_rel, self.emb_dim, sparse)
 
         self.normalize_parameters()
-        self.rel_emb.weight.data = normalize(self.rel_emb.weight.data, p=2, dim=1)
+        self.rel_emb.weight.data = normalize(self.rel_emb.weight.data,
+                                             p=2, dim=1)
 
     def scoring_function(self, h_idx, t_idx, r_idx):
         """Compute the scoring function for the triplets given as argument:
@@ -80,14 +82,27 @@ class TransEModel(TranslationModel):
 
         return - self.dissimilarity(h + r, t)
 
-    def normalize_parameters(self):
+    def normalize_parameters(self, ent_idx=None):
         """Normalize the entity embeddings, as explained in original paper.
         This method should be called at the end of each training epoch and at
         the end of training as well.
 
+        Parameters
+        ----------
+        ent_idx: torch.Tensor, dtype: torch.long (opt, default = None)
+            Indices of the entities to normalize, e.g. the ones marked dirty
+            since the last normalization (see
+            :meth:`torchkge.models.interfaces.Model.get_dirty_entities`). By
+            default, all entities are normalized.
+
         """
-        self.ent_emb.weight.data = normalize(self.ent_emb.weight.data,
-                                             p=2, dim=1)
+        ent_idx = self.clean_entities(ent_idx)
+        if ent_idx is None:
+            self.ent_emb.weight.data = normalize(self.ent_emb.weight.data,
+                                                 p=2, dim=1)
+        else:
+            self.ent_emb.weight.data[ent_idx] = normalize(
+                self.ent_emb.weight.data[ent_idx], p=2, dim=1)
 
     def get_embeddings(self):
         """Return the embeddings of entities and relations.
@@ -124,6 +139,34 @@ class TransEModel(TranslationModel):
 
         return h, t, r, candidates
 
+    def score_all_tails(self, h_idx, r_idx, start=0, end=None):
+        """Compute the scores of all candidate tails without building the
+        (b_size, n_ent, emb_dim) candidates tensor. See
+        torchkge.models.interfaces.BilinearModel for more details on the API.
+
+        """
+        hr = self.ent_emb(h_idx) + self.rel_emb(r_idx)
+        return - self.pairwise_dissimilarity(
+            hr, self.ent_emb.weight.data[start:end])
+
+    def score_all_heads(self, t_idx, r_idx, start=0, end=None):
+        """Compute the scores of all candidate heads. As dissimilarities
+        only depend on the absolute difference of their arguments,
+        :math:`d(c + r, t) = d(t - r, c)`.
+
+        """
+        tr = self.ent_emb(t_idx) - self.rel_emb(r_idx)
+        return - self.pairwise_dissimilarity(
+            tr, self.ent_emb.weight.data[start:end])
+
+    def score_all_relations(self, h_idx, t_idx):
+        """Compute the scores of all candidate relations, using
+        :math:`d(h + c, t) = d(t - h, c)`.
+
+        """
+        th = self.ent_emb(t_idx) - self.ent_emb(h_idx)
+        return - self.pairwise_dissimilarity(th, self.rel_emb.weight.data)
+
 
 class TransHModel(TranslationModel):
     """Implementation of TransH model detailed in 2014 paper by Wang et al..
@@ -146,6 +189,13 @@ class TransHModel(TranslationModel):
         Number of entities in the current data set.
     n_relations: int
         Number of relations in the current data set.
+    cache_size: int, optional (default=2**30)
+        Maximum size in bytes of the cache of projected entities used at
+        inference time.
+    sparse: bool (opt, default = False)
+        If True, the embeddings produce sparse gradients, which makes the
+        model trainable with sparse optimizers (e.g. `torch.optim.SparseAdam`
+        or `torch.optim.Adagrad`).
 
     Attributes
     ----------
@@ -162,23 +212,29 @@ class TransHModel(TranslationModel):
         relation-specific hyperplanes entities are projected on. See paper for
         more details. Initialized with Xavier uniform distribution and then
         normalized.
+    projection_cache: torchkge.utils.modeling.ProjectionCache
+        Least recently used cache of the projections of all entities in the
+        relation-specific spaces, used at inference time.
+    evaluated_projections: bool
+        Indicates whether the projections of `projection_cache` are up to
+        date. It is set to False every time the scoring function is called in
+        train mode.
 
     """
 
-    def __init__(self, emb_dim, n_entities, n_relations):
+    def __init__(self, emb_dim, n_entities, n_relations, cache_size=2**30,
+                 sparse=False):
         super().__init__(n_entities, n_relations, dissimilarity_type='L2')
         self.emb_dim = emb_dim
-        self.ent_emb = init_embedding(self.n_ent, self.emb_dim)
-        self.rel_emb = init_embedding(self.n_rel, self.emb_dim)
-        self.norm_vect = init_embedding(self.n_rel, self.emb_dim)
+        self.ent_emb = init_embedding(self.n_ent, self.emb_dim, sparse)
+        self.rel_emb = init_embedding(self.n_rel, self.emb_dim, sparse)
+        self.norm_vect = init_embedding(self.n_rel, self.emb_dim, sparse)
 
         self.normalize_parameters()
 
         self.evaluated_projections = False
-        self.projected_entities = Parameter(empty(size=(self.n_rel,
-                                                        self.n_ent,
-                                                        self.emb_dim)),
-                                            requires_grad=False)
+        self.projection_cache = ProjectionCache(self.project_entities,
+                                                cache_size)
 
     def scoring_function(self, h_idx, t_idx, r_idx):
         """Compute the scoring function for the triplets given as argument:
@@ -201,14 +257,27 @@ class TransHModel(TranslationModel):
     def project(ent, norm_vect):
         return ent - (ent * norm_vect).sum(dim=1).view(-1, 1) * norm_vect
 
-    def normalize_parameters(self):
+    def normalize_parameters(self, ent_idx=None):
         """Normalize the entity embeddings and relations normal vectors, as
         explained in original paper. This methods should be called at the end
         of each training epoch and at the end of training as well.
 
+        Parameters
+        ----------
+        ent_idx: torch.Tensor, dtype: torch.long (opt, default = None)
+            Indices of the entities to normalize, e.g. the ones marked dirty
+            since the last normalization (see
+            :meth:`torchkge.models.interfaces.Model.get_dirty_entities`). By
+            default, all entities are normalized.
+
         """
-        self.ent_emb.weight.data = normalize(self.ent_emb.weight.data,
-                                             p=2, dim=1)
+        ent_idx = self.clean_entities(ent_idx)
+        if ent_idx is None:
+            self.ent_emb.weight.data = normalize(self.ent_emb.weight.data,
+                                                 p=2, dim=1)
+        else:
+            self.ent_emb.weight.data[ent_idx] = normalize(
+                self.ent_emb.weight.data[ent_idx], p=2, dim=1)
         self.norm_vect.weight.data = normalize(self.norm_vect.weight.data,
                                                p=2, dim=1)
         self.rel_emb.weight.data = self.project(self.rel_emb.weight.data,
@@ -234,54 +303,78 @@ class TransHModel(TranslationModel):
     def inference_prepare_candidates(self, h_idx, t_idx, r_idx, entities=True):
         """Link prediction evaluation helper function. Get entities embeddings
         and relations embeddings. The output will be fed to the
-        `inference_scoring_function` method. See torchkge.models.interfaces.Models for
-        more details on the API.
+        `inference_scoring_function` method. See
+        torchkge.models.interfaces.Models for more details on the API.
+        Projections of candidate entities are read from `projection_cache` and
+        they are not copied if all facts of the batch share the same relation.
 
         """
         b_size = h_idx.shape[0]
 
-        if not self.evaluated_projections:
-            self.evaluate_projections()
-
         r = self.rel_emb(r_idx)
 
         if entities:
-            proj_h = self.projected_entities[r_idx, h_idx]  # shape: (b_size, emb_dim)
-            proj_t = self.projected_entities[r_idx, t_idx]  # shape: (b_size, emb_dim)
-            candidates = self.projected_entities[r_idx]  # shape: (b_size, self.n_rel, self.emb_dim)
+            # shape: (b_size, n_ent, emb_dim)
+            candidates = self.get_projected_candidates(r_idx)
+            rows = arange(b_size, device=h_idx.device)
+            proj_h = candidates[rows, h_idx]  # shape: (b_size, emb_dim)
+            proj_t = candidates[rows, t_idx]  # shape: (b_size, emb_dim)
         else:
-            proj_h = self.projected_entities[:, h_idx].transpose(0, 1)  # shape: (b_size, n_rel, emb_dim)
-            proj_t = self.projected_entities[:, t_idx].transpose(0, 1)  # shape: (b_size, n_rel, emb_dim)
+            # shape: (b_size, n_rel, emb_dim)
+            proj_h = self.project_on_all_relations(h_idx)
+            proj_t = self.project_on_all_relations(t_idx)
             candidates = self.rel_emb.weight.data.view(1, self.n_rel, self.emb_dim)
             candidates = candidates.expand(b_size, self.n_rel, self.emb_dim)
 
         return proj_h, proj_t, r, candidates
 
-    def evaluate_projections(self):
-        """Link prediction evaluation helper function. Project all entities
-        according to each relation. Calling this method at the beginning of
-        link prediction makes the process faster by computing projections only
-        once.
+    def score_all_tails(self, h_idx, r_idx, start=0, end=None):
+        """Compute the scores of all candidate tails with the projections of
+        `projection_cache`. See
+        torchkge.models.interfaces.TranslationModel.score_all_projected.
 
         """
-        if self.evaluated_projections:
-            return
+        return self.score_all_projected(h_idx, r_idx, start, end)
+
+    def score_all_heads(self, t_idx, r_idx, start=0, end=None):
+        """Compute the scores of all candidate heads with the projections of
+        `projection_cache`. See
+        torchkge.models.interfaces.TranslationModel.score_all_projected.
 
-        for i in tqdm(range(self.n_ent), unit='entities', desc='Projecting entities'):
+        """
+        return self.score_all_projected(t_idx, r_idx, start, end, heads=True)
 
-            norm_vect = self.norm_vect.weight.data.view(self.n_rel, self.emb_dim)
-            mask = tensor([i], device=norm_vect.device).long()
+    def evaluate_projections(self, verbose=True):
+        """Link prediction evaluation helper function. Empty the projection
+        cache and fill it with the projections of all entities for as many
+        relations as it can hold. Calling this method is optional as
+        projections are otherwise computed the first time they are needed.
 
-            if norm_vect.is_cuda:
-                empty_cache()
+        Parameters
+        ----------
+        verbose: bool, optional (default=True)
+            Indicates whether a progress bar should be displayed.
 
-            ent = self.ent_emb(mask)
-            norm_components = (ent.view(1, -1) * norm_vect).sum(dim=1)
-            self.projected_entities[:, i, :] = (ent.view(1, -1) - norm_components.view(-1, 1) * norm_vect)
+        """
+        self.fill_projection_cache(verbose)
 
-            del norm_components
+    def project_entities(self, r):
+        """Project all entities on the hyperplane of relation `r`.
 
-        self.evaluated_projections = True
+        """
+        norm_vect = self.norm_vect.weight.data[r].view(1, self.emb_dim)
+        return self.project(self.ent_emb.weight.data, norm_vect)
+
+    def project_on_all_relations(self, ent_idx):
+        """Project the given entities on the hyperplanes of all relations.
+        The result has shape (len(ent_idx), n_rel, emb_dim).
+
+        """
+        ent = self.ent_emb.weight.data[ent_idx]
+        norm_vect = self.norm_vect.weight.data
+        norm_components = matmul(ent, norm_vect.t())  # shape: (b_size, n_rel)
+        return ent.unsqueeze(1) - \
+            norm_components.unsqueeze(2) * norm_vect.unsqueeze(0)
 
 
 class TransRModel(TranslationModel):
@@ -307,6 +400,13 @@ class TransRModel(TranslationModel):
         Number of entities in the current data set.
     n_relations: int
         Number of relations in the current data set.
+    cache_size: int, optional (default=2**30)
+        Maximum size in bytes of the cache of projected entities used at
+        inference time.
+    sparse: bool (opt, default = False)
+        If True, the embeddings produce sparse gradients, which makes the
+        model trainable with sparse optimizers (e.g. `torch.optim.SparseAdam`
+        or `torch.optim.Adagrad`).
 
     Attributes
     ----------
@@ -322,32 +422,33 @@ class TransRModel(TranslationModel):
         distribution and then normalized.
     proj_mat: `torch.nn.Embedding`, shape: (n_rel, rel_emb_dim x ent_emb_dim)
         Relation-specific projection matrices. See paper for more details.
-    projected_entities: `torch.nn.Parameter`, \
-        shape: (n_rel, n_ent, rel_emb_dim)
-        Contains the projection of each entity in each relation-specific
-        sub-space.
+    projection_cache: torchkge.utils.modeling.ProjectionCache
+        Least recently used cache of the projections of all entities in the
+        relation-specific spaces, used at inference time.
     evaluated_projections: bool
-        Indicates whether `projected_entities` has been computed. This should
-        be set to true every time a backward pass is done in train mode.
+        Indicates whether the projections of `projection_cache` are up to
+        date. It is set to False every time the scoring function is called in
+        train mode.
     """
 
-    def __init__(self, ent_emb_dim, rel_emb_dim, n_entities, n_relations):
+    def __init__(self, ent_emb_dim, rel_emb_dim, n_entities, n_relations,
+                 cache_size=2**30, sparse=False):
 
         super().__init__(n_entities, n_relations, 'L2')
         self.ent_emb_dim = ent_emb_dim
         self.rel_emb_dim = rel_emb_dim
 
-        self.ent_emb = init_embedding(self.n_ent, self.ent_emb_dim)
-        self.rel_emb = init_embedding(self.n_rel, self.rel_emb_dim)
+        self.ent_emb = init_embedding(self.n_ent, self.ent_emb_dim, sparse)
+        self.rel_emb = init_embedding(self.n_rel, self.rel_emb_dim, sparse)
         self.proj_mat = init_embedding(self.n_rel,
-                                       self.rel_emb_dim * self.ent_emb_dim)
+                                       self.rel_emb_dim * self.ent_emb_dim,
+                                       sparse)
 
         self.normalize_parameters()
 
         self.evaluated_projections = False
-        self.projected_entities = Parameter(empty(size=(self.n_rel, self.n_ent,
-                                                        self.rel_emb_dim)),
-                                            requires_grad=False)
+        self.projection_cache = ProjectionCache(self.project_entities,
+                                                cache_size)
 
     def scoring_function(self, h_idx, t_idx, r_idx):
         """Compute the scoring function for the triplets given as argument:
@@ -372,14 +473,27 @@ class TransRModel(TranslationModel):
         proj_e = matmul(proj_mat, ent.view(-1, self.ent_emb_dim, 1))
         return proj_e.view(-1, self.rel_emb_dim)
 
-    def normalize_parameters(self):
+    def normalize_parameters(self, ent_idx=None):
         """Normalize the entity and relation embeddings, as explained in
         original paper. This methods should be called at the end of each
         training epoch and at the end of training as well.
 
+        Parameters
+        ----------
+        ent_idx: torch.Tensor, dtype: torch.long (opt, default = None)
+            Indices of the entities to normalize, e.g. the ones marked dirty
+            since the last normalization (see
+            :meth:`torchkge.models.interfaces.Model.get_dirty_entities`). By
+            default, all entities are normalized.
+
         """
-        self.ent_emb.weight.data = normalize(self.ent_emb.weight.data,
-                                             p=2, dim=1)
+        ent_idx = self.clean_entities(ent_idx)
+        if ent_idx is None:
+            self.ent_emb.weight.data = normalize(self.ent_emb.weight.data,
+                                                 p=2, dim=1)
+        else:
+            self.ent_emb.weight.data[ent_idx] = normalize(
+                self.ent_emb.weight.data[ent_idx], p=2, dim=1)
         self.rel_emb.weight.data = normalize(self.rel_emb.weight.data,
                                              p=2, dim=1)
 
@@ -406,56 +520,78 @@ class TransRModel(TranslationModel):
     def inference_prepare_candidates(self, h_idx, t_idx, r_idx, entities=True):
         """Link prediction evaluation helper function. Get entities embeddings
         and relations embeddings. The output will be fed to the
-        `inference_scoring_function` method. See torchkge.models.interfaces.Models for
-        more details on the API.
+        `inference_scoring_function` method. See
+        torchkge.models.interfaces.Models for more details on the API.
+        Projections of candidate entities are read from `projection_cache` and
+        they are not copied if all facts of the batch share the same relation.
 
         """
         b_size = h_idx.shape[0]
 
-        if not self.evaluated_projections:
-            self.evaluate_projectionss()
-
-        r = self.rel_emb(r_idx)  # shape = (b_size, self.rel_emb_dim)
+        r = self.rel_emb(r_idx)
 
         if entities:
-            proj_h = self.projected_entities[r_idx, h_idx]  # shape: (b_size, rel_emb_dim)
-            proj_t = self.projected_entities[r_idx, t_idx]  # shape: (b_size, rel_emb_dim)
-            candidates = self.projected_entities[r_idx]  # shape: (b_size, n_rel, emb_dim)
+            # shape: (b_size, n_ent, rel_emb_dim)
+            candidates = self.get_projected_candidates(r_idx)
+            rows = arange(b_size, device=h_idx.device)
+            proj_h = candidates[rows, h_idx]  # shape: (b_size, rel_emb_dim)
+            proj_t = candidates[rows, t_idx]  # shape: (b_size, rel_emb_dim)
         else:
-            proj_h = self.projected_entities[:, h_idx].transpose(0, 1)  # shape: (b_size, n_rel, rel_emb_dim)
-            proj_t = self.projected_entities[:, t_idx].transpose(0, 1)  # shape: (b_size, n_rel, rel_emb_dim)
+            # shape: (b_size, n_rel, rel_emb_dim)
+            proj_h = self.project_on_all_relations(h_idx)
+            proj_t = self.project_on_all_relations(t_idx)
             candidates = self.rel_emb.weight.data.view(1, self.n_rel, self.rel_emb_dim)
             candidates = candidates.expand(b_size, self.n_rel, self.rel_emb_dim)
 
         return proj_h, proj_t, r, candidates
 
-    def evaluate_projectionss(self):
-        """Link prediction evaluation helper function. Project all entities
-        according to each relation. Calling this method at the beginning of
-        link prediction makes the process faster by computing projections only
-        once.
+    def score_all_tails(self, h_idx, r_idx, start=0, end=None):
+        """Compute the scores of all candidate tails with the projections of
+        `projection_cache`. See
+        torchkge.models.interfaces.TranslationModel.score_all_projected.
 
         """
-        if self.evaluated_projections:
-            return
+        return self.score_all_projected(h_idx, r_idx, start, end)
 
-        for i in tqdm(range(self.n_ent), unit='entities', desc='Projecting entities'):
-            projection_matrices = self.proj_mat.weight.data
-            projection_matrices = projection_matrices.view(self.n_rel, self.rel_emb_dim, self.ent_emb_dim)
+    def score_all_heads(self, t_idx, r_idx, start=0, end=None):
+        """Compute the scores of all candidate heads with the projections of
+        `projection_cache`. See
+        torchkge.models.interfaces.TranslationModel.score_all_projected.
 
-            mask = tensor([i], device=projection_matrices.device).long()
+        """
+        return self.score_all_projected(t_idx, r_idx, start, end, heads=True)
 
-            if projection_matrices.is_cuda:
-                empty_cache()
+    def evaluate_projectionss(self, verbose=True):
+        """Link prediction evaluation helper function. Empty the projection
+        cache and fill it with the projections of all entities for as many
+        relations as it can hold. Calling this method is optional as
+        projections are otherwise computed the first time they are needed.
 
-            ent = self.ent_emb(mask)
-            proj_ent = matmul(projection_matrices, ent.view(self.ent_emb_dim))
-            proj_ent = proj_ent.view(self.n_rel, self.rel_emb_dim, 1)
-            self.projected_entities[:, i, :] = proj_ent.view(self.n_rel, self.rel_emb_dim)
+        Parameters
+        ----------
+        verbose: bool, optional (default=True)
+            Indicates whether a progress bar should be displayed.
 
-            del proj_ent
+        """
+        self.fill_projection_cache(verbose)
 
-        self.evaluated_projections = True
+    def project_entities(self, r):
+        """Project all entities in the space of relation `r`.
+
+        """
+        proj_mat = self.proj_mat.weight.data[r].view(self.rel_emb_dim,
+                                                     self.ent_emb_dim)
+        return matmul(self.ent_emb.weight.data, proj_mat.t())
+
+    def project_on_all_relations(self, ent_idx):
+        """Project the given entities in the spaces of all relations. The
+        result has shape (len(ent_idx), n_rel, rel_emb_dim).
+
+        """
+        projection_matrices = self.proj_mat.weight.data.view(
+            self.n_rel, self.rel_emb_dim, self.ent_emb_dim)
+        return einsum('rkd,bd->brk', projection_matrices,
+                      self.ent_emb.weight.data[ent_idx])
 
 
 class TransDModel(TranslationModel):
@@ -484,6 +620,13 @@ class TransDModel(TranslationModel):
         Number of entities in the current data set.
     n_relations: int
         Number of relations in the current data set.
+    cache_size: int, optional (default=2**30)
+        Maximum size in bytes of the cache of projected entities used at
+        inference time.
+    sparse: bool (opt, default = False)
+        If True, the embeddings produce sparse gradients, which makes the
+        model trainable with sparse optimizers (e.g. `torch.optim.SparseAdam`
+        or `torch.optim.Adagrad`).
 
     Attributes
     ----------
@@ -505,35 +648,36 @@ class TransDModel(TranslationModel):
         Relation-specific vector used to build projection matrices. See paper
         for more details. Initialized with Xavier uniform distribution and then
         normalized.
-    projected_entities: `torch.nn.Parameter`, \
-        shape: (n_rel, n_ent, rel_emb_dim)
-        Contains the projection of each entity in each relation-specific
-        sub-space.
+    projection_cache: torchkge.utils.modeling.ProjectionCache
+        Least recently used cache of the projections of all entities in the
+        relation-specific spaces, used at inference time.
     evaluated_projections: bool
-        Indicates whether `projected_entities` has been computed. This should
-        be set to true every time a backward pass is done in train mode.
+        Indicates whether the projections of `projection_cache` are up to
+        date. It is set to False every time the scoring function is called in
+        train mode.
 
     """
 
-    def __init__(self, ent_emb_dim, rel_emb_dim, n_entities, n_relations):
+    def __init__(self, ent_emb_dim, rel_emb_dim, n_entities, n_relations,
+                 cache_size=2**30, sparse=False):
 
         super().__init__(n_entities, n_relations, 'L2')
 
         self.ent_emb_dim = ent_emb_dim
         self.rel_emb_dim = rel_emb_dim
 
-        self.ent_emb = init_embedding(self.n_ent, self.ent_emb_dim)
-        self.rel_emb = init_embedding(self.n_rel, self.rel_emb_dim)
-        self.ent_proj_vect = init_embedding(self.n_ent, self.ent_emb_dim)
-        self.rel_proj_vect = init_embedding(self.n_rel, self.rel_emb_dim)
+        self.ent_emb = init_embedding(self.n_ent, self.ent_emb_dim, sparse)
+        self.rel_emb = init_embedding(self.n_rel, self.rel_emb_dim, sparse)
+        self.ent_proj_vect = init_embedding(self.n_ent, self.ent_emb_dim,
+                                            sparse)
+        self.rel_proj_vect = init_embedding(self.n_rel, self.rel_emb_dim,
+                                            sparse)
 
         self.normalize_parameters()
 
         self.evaluated_projections = False
-        self.projected_entities = Parameter(empty(size=(self.n_rel,
-                                                        self.n_ent,
-                                                        self.rel_emb_dim)),
-                                            requires_grad=False)
+        self.projection_cache = ProjectionCache(self.project_entities,
+                                                cache_size)
 
     def scoring_function(self, h_idx, t_idx, r_idx):
         """Compute the scoring function for the triplets given as argument:
@@ -567,16 +711,35 @@ class TransDModel(TranslationModel):
         proj_e = (r_proj_vect * scalar_product.view(b_size, 1))
         return proj_e + ent[:, :self.rel_emb_dim]
 
-    def normalize_parameters(self):
+    def normalize_parameters(self, ent_idx=None):
         """Normalize the entity embeddings and relations normal vectors, as
         explained in original paper. This methods should be called at the end
         of each training epoch and at the end of training as well.
 
+        Parameters
+        ----------
+        ent_idx: torch.Tensor, dtype: torch.long (opt, default = None)
+            Indices of the entities to normalize, e.g. the ones marked dirty
+            since the last normalization (see
+            :meth:`torchkge.models.interfaces.Model.get_dirty_entities`). By
+            default, all entities are normalized.
+
         """
-        self.ent_emb.weight.data = normalize(self.ent_emb.weight.data, p=2, dim=1)
-        self.rel_emb.weight.data = normalize(self.rel_emb.weight.data, p=2, dim=1)
-        self.ent_proj_vect.weight.data = normalize(self.ent_proj_vect.weight.data, p=2, dim=1)
-        self.rel_proj_vect.weight.data = normalize(self.rel_proj_vect.weight.data, p=2, dim=1)
+        ent_idx = self.clean_entities(ent_idx)
+        if ent_idx is None:
+            self.ent_emb.weight.data = normalize(self.ent_emb.weight.data,
+                                                 p=2, dim=1)
+            self.ent_proj_vect.weight.data = normalize(
+                self.ent_proj_vect.weight.data, p=2, dim=1)
+        else:
+            self.ent_emb.weight.data[ent_idx] = normalize(
+                self.ent_emb.weight.data[ent_idx], p=2, dim=1)
+            self.ent_proj_vect.weight.data[ent_idx] = normalize(
+                self.ent_proj_vect.weight.data[ent_idx], p=2, dim=1)
+        self.rel_emb.weight.data = normalize(self.rel_emb.weight.data,
+                                             p=2, dim=1)
+        self.rel_proj_vect.weight.data = normalize(
+            self.rel_proj_vect.weight.data, p=2, dim=1)
 
     def get_embeddings(self):
         """Return the embeddings of entities and relations along with their
@@ -603,53 +766,80 @@ class TransDModel(TranslationModel):
     def inference_prepare_candidates(self, h_idx, t_idx, r_idx, entities=True):
         """Link prediction evaluation helper function. Get entities embeddings
         and relations embeddings. The output will be fed to the
-        `inference_scoring_function` method. See torchkge.models.interfaces.Models for
-        more details on the API.
+        `inference_scoring_function` method. See
+        torchkge.models.interfaces.Models for more details on the API.
+        Projections of candidate entities are read from `projection_cache` and
+        they are not copied if all facts of the batch share the same relation.
 
         """
         b_size = h_idx.shape[0]
 
-        if not self.evaluated_projections:
-            self.evaluate_projectionss()
-
         r = self.rel_emb(r_idx)
 
         if entities:
-            proj_h = self.projected_entities[r_idx, h_idx]  # shape: (b_size, emb_dim)
-            proj_t = self.projected_entities[r_idx, t_idx]  # shape: (b_size, emb_dim)
-            candidates = self.projected_entities[r_idx]  # shape: (b_size, self.n_rel, self.emb_dim)
+            # shape: (b_size, n_ent, rel_emb_dim)
+            candidates = self.get_projected_candidates(r_idx)
+            rows = arange(b_size, device=h_idx.device)
+            proj_h = candidates[rows, h_idx]  # shape: (b_size, rel_emb_dim)
+            proj_t = candidates[rows, t_idx]  # shape: (b_size, rel_emb_dim)
         else:
-            proj_h = self.projected_entities[:, h_idx].transpose(0, 1)  # shape: (b_size, n_rel, rel_emb_dim)
-            proj_t = self.projected_entities[:, t_idx].transpose(0, 1)  # shape: (b_size, n_rel, rel_emb_dim)
+            # shape: (b_size, n_rel, rel_emb_dim)
+            proj_h = self.project_on_all_relations(h_idx)
+            proj_t = self.project_on_all_relations(t_idx)
             candidates = self.rel_emb.weight.data.view(1, self.n_rel, self.rel_emb_dim)
             candidates = candidates.expand(b_size, self.n_rel, self.rel_emb_dim)
 
         return proj_h, proj_t, r, candidates
 
-    def evaluate_projectionss(self):
-        """Link prediction evaluation helper function. Project all entities
-        according to each relation. Calling this method at the beginning of
-        link prediction makes the process faster by computing projections only
-        once.
+    def score_all_tails(self, h_idx, r_idx, start=0, end=None):
+        """Compute the scores of all candidate tails with the projections of
+        `projection_cache`. See
+        torchkge.models.interfaces.TranslationModel.score_all_projected.
 
         """
-        if self.evaluated_projections:
-            return
+        return self.score_all_projected(h_idx, r_idx, start, end)
 
-        for i in tqdm(range(self.n_ent), unit='entities', desc='Projecting entities'):
+    def score_all_heads(self, t_idx, r_idx, start=0, end=None):
+        """Compute the scores of all candidate heads with the projections of
+        `projection_cache`. See
+        torchkge.models.interfaces.TranslationModel.score_all_projected.
 
-            rel_proj_vects = self.rel_proj_vect.weight.data
-            ent = self.ent_emb.weight[i]
-            ent_proj_vect = self.ent_proj_vect.weight[i]
+        """
+        return self.score_all_projected(t_idx, r_idx, start, end, heads=True)
+
+    def evaluate_projectionss(self, verbose=True):
+        """Link prediction evaluation helper function. Empty the projection
+        cache and fill it with the projections of all entities for as many
+        relations as it can hold. Calling this method is optional as
+        projections are otherwise computed the first time they are needed.
+
+        Parameters
+        ----------
+        verbose: bool, optional (default=True)
+            Indicates whether a progress bar should be displayed.
+
+        """
+        self.fill_projection_cache(verbose)
 
-            sc_prod = (ent_proj_vect * ent).sum(dim=0)
-            proj_e = sc_prod * rel_proj_vects + ent[:self.rel_emb_dim].view(1, -1)
+    def project_entities(self, r):
+        """Project all entities in the space of relation `r`.
 
-            self.projected_entities[:, i, :] = proj_e
+        """
+        return self.project(self.ent_emb.weight.data,
+                            self.ent_proj_vect.weight.data,
+                            self.rel_proj_vect.weight.data[r].view(
+                                1, self.rel_emb_dim))
 
-            del proj_e
+    def project_on_all_relations(self, ent_idx):
+        """Project the given entities in the spaces of all relations. The
+        result has shape (len(ent_idx), n_rel, rel_emb_dim).
 
-        self.evaluated_projections = True
+        """
+        ent = self.ent_emb.weight.data[ent_idx]
+        sc_prod = (self.ent_proj_vect.weight.data[ent_idx] * ent).sum(dim=1)
+        rel_proj_vect = self.rel_proj_vect.weight.data.unsqueeze(0)
+        return sc_prod.view(-1, 1, 1) * rel_proj_vect + \
+            ent[:, :self.rel_emb_dim].unsqueeze(1)
 
 
 class TorusEModel(TranslationModel):
@@ -676,6 +866,10 @@ class TorusEModel(TranslationModel):
         Number of relations in the current data set.
     dissimilarity_type: str
         One of 'torus_L1', 'torus_L2', 'torus_eL2'.
+    sparse: bool (opt, default = False)
+        If True, the embeddings produce sparse gradients, which makes the
+        model trainable with sparse optimizers (e.g. `torch.optim.SparseAdam`
+        or `torch.optim.Adagrad`).
 
     Attributes
     ----------
@@ -690,14 +884,15 @@ class TorusEModel(TranslationModel):
 
     """
 
-    def __init__(self, emb_dim, n_entities, n_relations, dissimilarity_type):
+    def __init__(self, emb_dim, n_entities, n_relations, dissimilarity_type,
+                 sparse=False):
 
         assert dissimilarity_type in ['L1', 'torus_L1', 'torus_L2', 'torus_eL2']
         super().__init__(n_entities, n_relations, dissimilarity_type)
 
         self.emb_dim = emb_dim
-        self.ent_emb = init_embedding(self.n_ent, self.emb_dim)
-        self.rel_emb = init_embedding(self.n_rel, self.emb_dim)
+        self.ent_emb = init_embedding(self.n_ent, self.emb_dim, sparse)
+        self.rel_emb = init_embedding(self.n_rel, self.emb_dim, sparse)
 
         self.normalized = False
         self.normalize_parameters()
@@ -720,10 +915,24 @@ class TorusEModel(TranslationModel):
 
         return - self.dissimilarity(h + r, t)
 
-    def normalize_parameters(self):
+    def normalize_parameters(self, ent_idx=None):
         """Project embeddings on torus.
+
+        Parameters
+        ----------
+        ent_idx: torch.Tensor, dtype: torch.long (opt, default = None)
+            Indices of the entities to normalize, e.g. the ones marked dirty
+            since the last normalization (see
+            :meth:`torchkge.models.interfaces.Model.get_dirty_entities`). By
+            default, all entities are normalized.
+
         """
-        self.ent_emb.weight.data.frac_()
+        ent_idx = self.clean_entities(ent_idx)
+        if ent_idx is None:
+            self.ent_emb.weight.data.frac_()
+        else:
+            self.ent_emb.weight.data[ent_idx] = \
+                self.ent_emb.weight.data[ent_idx].frac()
         self.rel_emb.weight.data.frac_()
         self.normalized = True
 
@@ -762,6 +971,43 @@ class TorusEModel(TranslationModel):
             candidates = candidates.expand(b_size, self.n_ent, self.emb_dim)
         else:
             candidates = self.rel_emb.weight.data.view(1, self.n_rel, self.emb_dim)
-            candidates = candidates.expand(b_size, self.n_rel, self.rel_emb_dim)
+            candidates = candidates.expand(b_size, self.n_rel, self.emb_dim)
 
         return h, t, r, candidates
+
+    def score_all_tails(self, h_idx, r_idx, start=0, end=None):
+        """Compute the scores of all candidate tails without building the
+        (b_size, n_ent, emb_dim) candidates tensor. See
+        torchkge.models.interfaces.BilinearModel for more details on the API.
+
+        """
+        if not self.normalized:
+            self.normalize_parameters()
+
+        hr = self.ent_emb(h_idx) + self.rel_emb(r_idx)
+        return - self.pairwise_dissimilarity(
+            hr, self.ent_emb.weight.data[start:end])
+
+    def score_all_heads(self, t_idx, r_idx, start=0, end=None):
+        """Compute the scores of all candidate heads. As dissimilarities
+        only depend on the absolute difference of their arguments,
+        :math:`d(c + r, t) = d(t - r, c)`.
+
+        """
+        if not self.normalized:
+            self.normalize_parameters()
+
+        tr = self.ent_emb(t_idx) - self.rel_emb(r_idx)
+        return - self.pairwise_dissimilarity(
+            tr, self.ent_emb.weight.data[start:end])
+
+    def score_all_relations(self, h_idx, t_idx):
+        """Compute the scores of all candidate relations, using
+        :math:`d(h + c, t) = d(t - h, c)`.
+
+        """
+        if not self.normalized:
+            self.normalize_parameters()
+
+        th = self.ent_emb(t_idx) - self.ent_emb(h_idx)
+        return - self.pairwise_dissimilarity(th, self.rel_emb.weight.data)
@@ -5,8 +5,10 @@ Copyright TorchKGE developers
 """
 
 from collections import defaultdict
+from warnings import warn
 
-from torch import tensor, bernoulli, randint, ones, rand, cat
+from torch import tensor, bernoulli, bincount, randint, ones, rand, cat, \
+    minimum, where
 
 from torchkge.exceptions import NotYetImplementedError
 from torchkge.utils.data import DataLoader
@@ -27,6 +29,10 @@ class NegativeSampler:
     n_neg: int
         Number of negative sample to create from each fact.
 
+    Negatively sampled entities have the integer type of the batch they are
+    sampled from, which is the `index_dtype` of the knowledge graph when
+    batches come from a :class:`torchkge.utils.data.DataLoader`.
+
     Attributes
     ----------
     kg: torchkge.data_structures.KnowledgeGraph
@@ -73,7 +79,7 @@ class NegativeSampler:
                                      'please consider using a child class '
                                      'where this is implemented.')
 
-    def corrupt_kg(self, batch_size, use_cuda, which='main'):
+    def corrupt_kg(self, batch_size, use_cuda, which='main', n_neg=None):
         """Corrupt an entire knowledge graph using a dataloader and by calling
         `corrupt_batch` method.
 
@@ -91,16 +97,24 @@ class NegativeSampler:
             attribute should have been initialized.
             * 'test': attribute self.kg_test is corrupted. In this case this
             attribute should have been initialized.
+        n_neg: int (opt)
+            Number of negative sample to create from each fact. It overwrites
+            the value set at the construction of the sampler.
 
         Returns
         -------
-        neg_heads: torch.Tensor, dtype: torch.long, shape: (n_facts)
+        neg_heads: torch.Tensor, shape: (n_facts) or (n_facts, n_neg)
             Tensor containing the integer key of negatively sampled heads of
-            the relations in the graph designated by `which`.
-        neg_tails: torch.Tensor, dtype: torch.long, shape: (n_facts)
+            the relations in the graph designated by `which`. If `n_neg` is
+            larger than 1, row `i` contains the negative heads of fact `i`.
+            It has the `index_dtype` of the graph (torch.long by default).
+        neg_tails: torch.Tensor, shape: (n_facts) or (n_facts, n_neg)
             Tensor containing the integer key of negatively sampled tails of
             the relations in the graph designated by `which`.
         """
+        if n_neg is None:
+            n_neg = self.n_neg
+
         assert which in ['main', 'train', 'test', 'val']
         if which == 'val':
             assert self.n_facts_val > 0
@@ -127,15 +141,18 @@ class NegativeSampler:
         for i, batch in enumerate(dataloader):
             heads, tails, rels = batch[0], batch[1], batch[2]
             neg_heads, neg_tails = self.corrupt_batch(heads, tails, rels,
-                                                      n_neg=1)
+                                                      n_neg=n_neg)
+            if n_neg > 1:
+                neg_heads = neg_heads.view(n_neg, -1).t()
+                neg_tails = neg_tails.view(n_neg, -1).t()
 
             corr_heads.append(neg_heads)
             corr_tails.append(neg_tails)
 
         if use_cuda:
-            return cat(corr_heads).long().cpu(), cat(corr_tails).long().cpu()
+            return cat(corr_heads).cpu(), cat(corr_tails).cpu()
         else:
-            return cat(corr_heads).long(), cat(corr_tails).long()
+            return cat(corr_heads), cat(corr_tails)
 
 
 class UniformNegativeSampler(NegativeSampler):
@@ -215,12 +232,12 @@ class UniformNegativeSampler(NegativeSampler):
         n_h_cor = int(mask.sum().item())
         neg_heads[mask == 1] = randint(1, self.n_ent,
                                        (n_h_cor,),
-                                       device=device)
+                                       device=device, dtype=heads.dtype)
         neg_tails[mask == 0] = randint(1, self.n_ent,
                                        (batch_size * n_neg - n_h_cor,),
-                                       device=device)
+                                       device=device, dtype=tails.dtype)
 
-        return neg_heads.long(), neg_tails.long()
+        return neg_heads, neg_tails
 
 
 class BernoulliNegativeSampler(NegativeSampler):
@@ -315,16 +332,17 @@ class BernoulliNegativeSampler(NegativeSampler):
 
         # Randomly choose which samples will have head/tail corrupted
         self.bern_probs = self.bern_probs.to(device)
-        mask = bernoulli(self.bern_probs[relations].repeat(n_neg)).double()
+        mask = bernoulli(self.bern_probs[relations.long()].repeat(n_neg))
+        mask = mask.double()
         n_h_cor = int(mask.sum().item())
         neg_heads[mask == 1] = randint(1, self.n_ent,
                                        (n_h_cor,),
-                                       device=device)
+                                       device=device, dtype=heads.dtype)
         neg_tails[mask == 0] = randint(1, self.n_ent,
                                        (batch_size * n_neg - n_h_cor,),
-                                       device=device)
+                                       device=device, dtype=tails.dtype)
 
-        return neg_heads.long(), neg_tails.long()
+        return neg_heads, neg_tails
 
 
 class PositionalNegativeSampler(BernoulliNegativeSampler):
@@ -358,72 +376,90 @@ class PositionalNegativeSampler(BernoulliNegativeSampler):
         Validation knowledge graph.
     kg_test: torchkge.data_structures.KnowledgeGraph (optional)
         Test knowledge graph.
+    n_neg: int
+        Number of negative sample to create from each fact.
 
     Attributes
     ----------
-    possible_heads: dict
-        keys : relations, values : list of possible heads for each relation.
-    possible_tails: dict
-        keys : relations, values : list of possible tails for each relation.
-    n_poss_heads: list
-        List of number of possible heads for each relation.
-    n_poss_tails: list
-        List of number of possible tails for each relation.
+    poss_heads: torch.Tensor, dtype: torch.long, shape: (n_poss_heads.sum())
+        Possible heads of all relations, stored relation after relation.
+    poss_tails: torch.Tensor, dtype: torch.long, shape: (n_poss_tails.sum())
+        Possible tails of all relations, stored relation after relation.
+    poss_heads_offsets: torch.Tensor, dtype: torch.long, shape: (n_rel)
+        Position in `poss_heads` of the first possible head of each relation.
+    poss_tails_offsets: torch.Tensor, dtype: torch.long, shape: (n_rel)
+        Position in `poss_tails` of the first possible tail of each relation.
+    n_poss_heads: torch.Tensor, dtype: torch.long, shape: (n_rel)
+        Number of possible heads for each relation.
+    n_poss_tails: torch.Tensor, dtype: torch.long, shape: (n_rel)
+        Number of possible tails for each relation.
 
     """
 
-    def __init__(self, kg, kg_val=None, kg_test=None):
-        super().__init__(kg, kg_val, kg_test, 1)
-        self.possible_heads, self.possible_tails, \
-        self.n_poss_heads, self.n_poss_tails = self.find_possibilities()
+    def __init__(self, kg, kg_val=None, kg_test=None, n_neg=1):
+        super().__init__(kg, kg_val, kg_test, n_neg)
+        self.poss_heads, self.poss_heads_offsets, self.n_poss_heads, \
+            self.poss_tails, self.poss_tails_offsets, self.n_poss_tails = \
+            self.find_possibilities()
+
+    @property
+    def possible_heads(self):
+        """Dictionary whose keys are relations and values are the lists of
+        their possible heads.
+
+        """
+        offsets = self.poss_heads_offsets.tolist()
+        counts = self.n_poss_heads.tolist()
+        return {r: self.poss_heads[o: o + n].tolist()
+                for r, (o, n) in enumerate(zip(offsets, counts))}
+
+    @property
+    def possible_tails(self):
+        """Dictionary whose keys are relations and values are the lists of
+        their possible tails.
+
+        """
+        offsets = self.poss_tails_offsets.tolist()
+        counts = self.n_poss_tails.tolist()
+        return {r: self.poss_tails[o: o + n].tolist()
+                for r, (o, n) in enumerate(zip(offsets, counts))}
 
     def find_possibilities(self):
         """For each relation of the knowledge graph (and possibly the
         validation graph but not the test graph) find all the possible heads
         and tails in the sense of Wang et al., e.g. all entities that occupy
-        once this position in another triplet.
+        once this position in another triplet. Possible entities are stored
+        in flat tensors, relation after relation, along with the offset of
+        each relation.
 
         Returns
         -------
-        possible_heads: dict
-            keys : relation index, values : list of possible heads
-        possible tails: dict
-            keys : relation index, values : list of possible tails
+        poss_heads: torch.Tensor, dtype: torch.long
+            Possible heads of all relations.
+        poss_heads_offsets: torch.Tensor, dtype: torch.long,
+        shape: (n_relations)
+            Position of the first possible head of each relation.
         n_poss_heads: torch.Tensor, dtype: torch.long, shape: (n_relations)
             Number of possible heads for each relation.
+        poss_tails: torch.Tensor, dtype: torch.long
+            Possible tails of all relations.
+        poss_tails_offsets: torch.Tensor, dtype: torch.long,
+        shape: (n_relations)
+            Position of the first possible tail of each relation.
         n_poss_tails: torch.Tensor, dtype: torch.long, shape: (n_relations)
             Number of possible tails for each relation.
 
         """
-        possible_heads, possible_tails = get_possible_heads_tails(self.kg)
-
+        heads, tails = self.kg.head_idx, self.kg.tail_idx
+        relations = self.kg.relations
         if self.n_facts_val > 0:
-            possible_heads, \
-                possible_tails = get_possible_heads_tails(self.kg_val,
-                                                          possible_heads,
-                                                          possible_tails)
-
-        n_poss_heads = []
-        n_poss_tails = []
-
-        assert possible_heads.keys() == possible_tails.keys()
-
-        for r in range(self.kg.n_rel):
-            if r in possible_heads.keys():
-                n_poss_heads.append(len(possible_heads[r]))
-                n_poss_tails.append(len(possible_tails[r]))
-                possible_heads[r] = list(possible_heads[r])
-                possible_tails[r] = list(possible_tails[r])
-            else:
-                n_poss_heads.append(0)
-                n_poss_tails.append(0)
-                possible_heads[r] = list()
-                possible_tails[r] = list()
+            heads = cat((heads, self.kg_val.head_idx))
+            tails = cat((tails, self.kg_val.tail_idx))
+            relations = cat((relations, self.kg_val.relations))
 
-        n_poss_heads = tensor(n_poss_heads)
-        n_poss_tails = tensor(n_poss_tails)
-
-        return possible_heads, possible_tails, n_poss_heads, n_poss_tails
+        return get_possible_entities(relations, heads, self.kg.n_rel,
+                                     self.n_ent) + \
+            get_possible_entities(relations, tails, self.kg.n_rel, self.n_ent)
 
     def corrupt_batch(self, heads, tails, relations, n_neg=None):
         """For each true triplet, produce a corrupted one not different from
@@ -442,66 +478,47 @@ class PositionalNegativeSampler(BernoulliNegativeSampler):
             Tensor containing the integer key of relations in the current
             batch. This is optional here and mainly present because of the
             interface with other NegativeSampler objects.
+        n_neg: int (opt)
+            Number of negative sample to create from each fact. It overwrites
+            the value set at the construction of the sampler.
 
         Returns
         -------
-        neg_heads: torch.Tensor, dtype: torch.long, shape: (batch_size)
+        neg_heads: torch.Tensor, dtype: torch.long, shape: (batch_size * n_neg)
             Tensor containing the integer key of negatively sampled heads of
             the relations in the current batch.
-        neg_tails: torch.Tensor, dtype: torch.long, shape: (batch_size)
+        neg_tails: torch.Tensor, dtype: torch.long, shape: (batch_size * n_neg)
             Tensor containing the integer key of negatively sampled tails of
             the relations in the current batch.
         """
+        if n_neg is None:
+            n_neg = self.n_neg
+
         device = heads.device
         assert (device == tails.device)
 
-        batch_size = heads.shape[0]
-        neg_heads, neg_tails = heads.clone(), tails.clone()
+        neg_heads, neg_tails = heads.repeat(n_neg), tails.repeat(n_neg)
+        relations = relations.long().repeat(n_neg)
 
         # Randomly choose which samples will have head/tail corrupted
+        self.bern_probs = self.bern_probs.to(device)
         mask = bernoulli(self.bern_probs[relations]).double()
-        n_heads_corrupted = int(mask.sum().item())
-
-        # Get the number of possible entities for head and tail
-        n_poss_heads = self.n_poss_heads[relations[mask == 1]]
-        n_poss_tails = self.n_poss_tails[relations[mask == 0]]
-
-        assert n_poss_heads.shape[0] == n_heads_corrupted
-        assert n_poss_tails.shape[0] == batch_size - n_heads_corrupted
-
-        # Choose a rank of an entity in the list of possible entities
-        choice_heads = (n_poss_heads.float() *
-                        rand((n_heads_corrupted,))).floor().long()
-        choice_tails = (n_poss_tails.float() *
-                        rand((batch_size - n_heads_corrupted,))).floor().long()
-
-        corr = []
-        rels = relations[mask == 1]
-        for i in range(n_heads_corrupted):
-            r = rels[i].item()
-            choices = self.possible_heads[r]
-            if len(choices) == 0:
-                # in this case the relation r has never been used with any head
-                # choose one entity at random
-                corr.append(randint(low=0, high=self.n_ent, size=(1,)).item())
-            else:
-                corr.append(choices[choice_heads[i].item()])
-        neg_heads[mask == 1] = tensor(corr, device=device).long()
-
-        corr = []
-        rels = relations[mask == 0]
-        for i in range(batch_size - n_heads_corrupted):
-            r = rels[i].item()
-            choices = self.possible_tails[r]
-            if len(choices) == 0:
-                # in this case the relation r has never been used with any tail
-                # choose one entity at random
-                corr.append(randint(low=0, high=self.n_ent, size=(1,)).item())
-            else:
-                corr.append(choices[choice_tails[i].item()])
-        neg_tails[mask == 0] = tensor(corr, device=device).long()
 
-        return neg_heads.long(), neg_tails.long()
+        self.poss_heads = self.poss_heads.to(device)
+        self.poss_heads_offsets = self.poss_heads_offsets.to(device)
+        self.n_poss_heads = self.n_poss_heads.to(device)
+        self.poss_tails = self.poss_tails.to(device)
+        self.poss_tails_offsets = self.poss_tails_offsets.to(device)
+        self.n_poss_tails = self.n_poss_tails.to(device)
+
+        neg_heads[mask == 1] = sample_possible_entities(
+            self.poss_heads, self.poss_heads_offsets, self.n_poss_heads,
+            relations[mask == 1], self.n_ent)
+        neg_tails[mask == 0] = sample_possible_entities(
+            self.poss_tails, self.poss_tails_offsets, self.n_poss_tails,
+            relations[mask == 0], self.n_ent)
+
+        return neg_heads, neg_tails
 
 
 class BernoulliRelationNegativeSampler(NegativeSampler):
@@ -528,35 +545,53 @@ class BernoulliRelationNegativeSampler(NegativeSampler):
         device = heads.device
         assert (device == tails.device)
 
-        batch_size = heads.shape[0]
-        neg_heads = heads.clone().detach()
-        neg_tails = tails.clone().detach()
+        if n_neg is None:
+            n_neg = self.n_neg
+
+        batch_size = heads.shape[0] * n_neg
+        neg_heads = heads.repeat(n_neg)
+        neg_tails = tails.repeat(n_neg)
+        relations = relations.repeat(n_neg)
         neg_rels = relations.clone().detach()
 
         mask1 = bernoulli(self.rel_share * ones(batch_size)).double()  # if 1 then entities are corrupted
 
-        neg_rels[mask1 == 0] = randint(1, self.kg.n_rel, (int(batch_size - (mask1.sum().item())),), device=device)
+        n_r_cor = int(batch_size - (mask1.sum().item()))
+        neg_rels[mask1 == 0] = randint(1, self.kg.n_rel, (n_r_cor,),
+                                       device=device, dtype=neg_rels.dtype)
 
         # Randomly choose which samples will have head/tail corrupted
         mask2 = ones(len(mask1))
         mask2[mask1 == 0] = 0.
 
-        mask2[mask2 == 1] = bernoulli(self.bern_probs[relations[mask1 == 1]])
+        mask2[mask2 == 1] = bernoulli(
+            self.bern_probs[relations[mask1 == 1].long()])
 
         mask2 = mask2.double()
 
         n_h_cor = int(mask2.sum().item())
-        neg_heads[(mask1 == 1) & (mask2 == 1)] = randint(1, self.n_ent, (n_h_cor,), device=device)
-        neg_tails[(mask1 == 1) & (mask2 == 0)] = randint(1, self.n_ent, (int(mask1.sum().item()) - n_h_cor,),
-                                                         device=device)
+        n_t_cor = int(mask1.sum().item()) - n_h_cor
+        neg_heads[(mask1 == 1) & (mask2 == 1)] = randint(1, self.n_ent,
+                                                         (n_h_cor,),
+                                                         device=device,
+                                                         dtype=heads.dtype)
+        neg_tails[(mask1 == 1) & (mask2 == 0)] = randint(1, self.n_ent,
+                                                         (n_t_cor,),
+                                                         device=device,
+                                                         dtype=tails.dtype)
 
-        return neg_heads.long(), neg_tails.long(), neg_rels.long()
+        return neg_heads, neg_tails, neg_rels
 
 
 def get_possible_heads_tails(kg, possible_heads=None, possible_tails=None):
     """Gets for each relation of the knowledge graph the possible heads and
     possible tails.
 
+    .. deprecated:: 0.17.8
+        The samplers now use `get_possible_entities`, which builds the
+        possible entities of all relations as tensors. This function will be
+        removed in a future release.
+
     Parameters
     ----------
     kg: `torchkge.data_structures.KnowledgeGraph`
@@ -573,6 +608,8 @@ def get_possible_heads_tails(kg, possible_heads=None, possible_tails=None):
         relations.
 
     """
+    warn('get_possible_heads_tails is deprecated, use get_possible_entities '
+         'instead.', DeprecationWarning, stacklevel=2)
 
     if possible_heads is None:
         possible_heads = defaultdict(set)
@@ -590,3 +627,74 @@ def get_possible_heads_tails(kg, possible_heads=None, possible_tails=None):
         possible_tails[kg.relations[i].item()].add(kg.tail_idx[i].item())
 
     return dict(possible_heads), dict(possible_tails)
+
+
+def get_possible_entities(relations, entities, n_rel, n_ent):
+    """Gets for each relation the entities appearing at a given position
+    (heads or tails) of its facts. They are stored in one flat tensor,
+    relation after relation, in increasing order.
+
+    Parameters
+    ----------
+    relations: torch.Tensor, dtype: torch.long, shape: (n_facts)
+        Relations of the facts.
+    entities: torch.Tensor, dtype: torch.long, shape: (n_facts)
+        Heads (or tails) of the facts.
+    n_rel: int
+        Number of relations.
+    n_ent: int
+        Number of entities.
+
+    Returns
+    -------
+    possible: torch.Tensor, dtype: same as `entities`
+        Possible entities of all relations.
+    offsets: torch.Tensor, dtype: torch.long, shape: (n_rel)
+        Position in `possible` of the first possible entity of each relation.
+    counts: torch.Tensor, dtype: torch.long, shape: (n_rel)
+        Number of possible entities of each relation.
+
+    """
+    keys = (relations.long() * n_ent + entities.long()).unique()
+    counts = bincount(keys // n_ent, minlength=n_rel)
+    offsets = counts.cumsum(dim=0) - counts
+    return (keys % n_ent).to(entities.dtype), offsets, counts
+
+
+def sample_possible_entities(possible, offsets, counts, relations, n_ent):
+    """Sample uniformly one of the possible entities of each relation, as
+    returned by `get_possible_entities`. An entity is sampled uniformly
+    among all of them for relations with no possible entities.
+
+    Parameters
+    ----------
+    possible: torch.Tensor, dtype: torch.long
+        Possible entities of all relations.
+    offsets: torch.Tensor, dtype: torch.long, shape: (n_rel)
+        Position in `possible` of the first possible entity of each relation.
+    counts: torch.Tensor, dtype: torch.long, shape: (n_rel)
+        Number of possible entities of each relation.
+    relations: torch.Tensor, dtype: torch.long, shape: (batch_size)
+        Relations for which an entity should be sampled.
+    n_ent: int
+        Number of entities.
+
+    Returns
+    -------
+    sampled: torch.Tensor, dtype: same as `possible`, shape: (batch_size)
+
+    """
+    device = relations.device
+    relations = relations.long()
+    uniform = randint(low=0, high=n_ent, size=relations.shape, device=device,
+                      dtype=possible.dtype)
+    if len(possible) == 0:
+        return uniform
+    n = counts[relations]
+    choice = (n.float() * rand(relations.shape, device=device)).floor().long()
+    # rounding errors of float32 can reach n for very large lists
+    choice = minimum(choice, (n - 1).clamp(min=0))
+    sampled = possible[(offsets[relations] + choice).clamp(
+        max=len(possible) - 1)]
+    # relations which were never used at this position get a random entity
+    return where(n > 0, sampled, uniform)
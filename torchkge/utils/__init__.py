@@ -1,18 +1,76 @@
-from .data import DataLoader, get_data_home, clear_data_home, safe_extract
+from importlib import import_module
 
-from .data_redundancy import count_triplets, duplicates
-from .data_redundancy import cartesian_product_relations
+# utilities are imported from their module the first time they are accessed
+# (PEP 562): dataset loaders pull pandas and the archive modules, training
+# and redundancy tools pull tqdm
+_LAZY = {
+    'DataLoader': 'data',
+    'get_data_home': 'data',
+    'clear_data_home': 'data',
+    'safe_extract': 'data',
 
-from .datasets import load_fb15k, load_fb13, load_fb15k237
-from .datasets import load_wn18, load_wn18rr
-from .datasets import load_yago3_10, load_wikidatasets, load_wikidata_vitals
+    'count_triplets': 'data_redundancy',
+    'duplicates': 'data_redundancy',
+    'cartesian_product_relations': 'data_redundancy',
 
-from .dissimilarities import l1_dissimilarity, l2_dissimilarity
-from .dissimilarities import l1_torus_dissimilarity, l2_torus_dissimilarity, \
-    el2_torus_dissimilarity
+    'load_fb15k': 'datasets',
+    'load_fb13': 'datasets',
+    'load_fb15k237': 'datasets',
+    'load_wn18': 'datasets',
+    'load_wn18rr': 'datasets',
+    'load_yago3_10': 'datasets',
+    'load_wikidatasets': 'datasets',
+    'load_wikidata_vitals': 'datasets',
 
-from .losses import MarginLoss, LogisticLoss, BinaryCrossEntropyLoss
-from .modeling import init_embedding, get_true_targets, load_embeddings, filter_scores
-from .operations import get_rank, get_mask, get_bernoulli_probs
-from .pretrained_models import load_pretrained_transe, load_pretrained_rescal, load_pretrained_complex
-from .training import Trainer, TrainDataLoader
+    'l1_dissimilarity': 'dissimilarities',
+    'l2_dissimilarity': 'dissimilarities',
+    'l1_torus_dissimilarity': 'dissimilarities',
+    'l2_torus_dissimilarity': 'dissimilarities',
+    'el2_torus_dissimilarity': 'dissimilarities',
+    'l1_pairwise_dissimilarity': 'dissimilarities',
+    'l2_pairwise_dissimilarity': 'dissimilarities',
+    'blocked_pairwise_dissimilarity': 'dissimilarities',
+
+    'MarginLoss': 'losses',
+    'LogisticLoss': 'losses',
+    'BinaryCrossEntropyLoss': 'losses',
+
+    'init_embedding': 'modeling',
+    'get_true_targets': 'modeling',
+    'get_true_targets_batch': 'modeling',
+    'load_embeddings': 'modeling',
+    'filter_scores': 'modeling',
+    'ProjectionCache': 'modeling',
+
+    'get_rank': 'operations',
+    'get_mask': 'operations',
+    'get_bernoulli_probs': 'operations',
+
+    'StageTimer': 'profiling',
+    'TimingReport': 'profiling',
+
+    'KGGenerator': 'synthetic',
+    'synthetic_kg': 'synthetic',
+
+    'load_pretrained_transe': 'pretrained_models',
+    'load_pretrained_rescal': 'pretrained_models',
+    'load_pretrained_complex': 'pretrained_models',
+
+    'Trainer': 'training',
+    'TrainDataLoader': 'training',
+}
+
+__all__ = list(_LAZY)
+
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError('module {!r} has no attribute {!r}'.format(
+            __name__, name))
+    value = getattr(import_module('.' + _LAZY[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
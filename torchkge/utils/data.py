@@ -6,9 +6,13 @@ Copyright TorchKGE developers
 
 import shutil
 
+import numpy as np
+
 from os import environ, makedirs
 from os.path import exists, expanduser, join, abspath, commonprefix
 
+from ..exceptions import WrongArgumentsError
+
 def is_within_directory(directory, target):
     abs_directory = abspath(directory)
     abs_target = abspath(target)
@@ -60,6 +64,110 @@ def clear_data_home(data_home=None):
     shutil.rmtree(data_home)
 
 
+def read_blocks(paths, block_size=2 ** 26, skiprows=0):
+    """Read files by blocks of lines.
+
+    Parameters
+    ----------
+    paths: list of str
+        Paths of the files to read one after the other.
+    block_size: int
+        Number of bytes read at once. Blocks are cut at the last line break
+        so they can be a bit smaller (or larger for lines longer than
+        `block_size`).
+    skiprows: int
+        Number of lines to skip at the beginning of each file.
+
+    Returns
+    -------
+    blocks: generator of bytes
+        Blocks of complete lines.
+    """
+    for path in paths:
+        with open(path, 'rb') as f:
+            for _ in range(skiprows):
+                f.readline()
+            rest = b''
+            while True:
+                block = f.read(block_size)
+                if not block:
+                    break
+                block = rest + block
+                end = block.rfind(b'\n') + 1
+                rest = block[end:]
+                if end > 0:
+                    yield block[:end]
+            if rest:
+                yield rest
+
+
+def save_vocabulary(prefix, vocabulary):
+    """Write a dictionary mapping labels to integer keys (such as
+    `KnowledgeGraph.ent2ix`) in `.npy` files starting with `prefix`. Keys are
+    stored in `prefix_ix.npy`. Numerical labels are stored in
+    `prefix_labels.npy` and string labels are concatenated in the UTF-8 file
+    `prefix_labels.txt` and delimited by the offsets in
+    `prefix_offsets.npy`, which is much more compact than a numpy array of
+    strings.
+
+    Parameters
+    ----------
+    prefix: str
+        Path and prefix of the names of the files.
+    vocabulary: dict
+        Dictionary with labels either all strings or all numbers.
+
+    Returns
+    -------
+    kind: str
+        Either 'str' or 'array' depending on the way labels were stored. It
+        should be given to `load_vocabulary`.
+    """
+    labels = list(vocabulary.keys())
+    np.save(prefix + '_ix.npy',
+            np.array(list(vocabulary.values()), dtype=np.int64))
+    if all(isinstance(label, str) for label in labels):
+        offsets = np.zeros(len(labels) + 1, dtype=np.int64)
+        np.cumsum([len(label) for label in labels], out=offsets[1:])
+        np.save(prefix + '_offsets.npy', offsets)
+        with open(prefix + '_labels.txt', 'w', encoding='utf-8',
+                  newline='') as f:
+            f.write(''.join(labels))
+        return 'str'
+
+    labels = np.array(labels)
+    if labels.dtype.kind not in 'biuf' or labels.ndim != 1:
+        raise WrongArgumentsError('Labels should either be all strings or '
+                                  'all numbers.')
+    np.save(prefix + '_labels.npy', labels)
+    return 'array'
+
+
+def load_vocabulary(prefix, kind):
+    """Read a dictionary written by `save_vocabulary`.
+
+    Parameters
+    ----------
+    prefix: str
+        Path and prefix of the names of the files.
+    kind: str
+        Value returned by `save_vocabulary`.
+
+    Returns
+    -------
+    vocabulary: dict
+    """
+    ix = np.load(prefix + '_ix.npy').tolist()
+    if kind == 'str':
+        offsets = np.load(prefix + '_offsets.npy').tolist()
+        with open(prefix + '_labels.txt', encoding='utf-8', newline='') as f:
+            text = f.read()
+        labels = [text[i:j] for i, j in zip(offsets[:-1], offsets[1:])]
+    else:
+        labels = np.load(prefix + '_labels.npy').tolist()
+    return dict(zip(labels, ix))
+
+
 def get_n_batches(n, b_size):
     """Returns the number of bachtes. Let n be the number of samples in the data set,
     let batch_size be the number of samples per batch, then the number of batches is given by
@@ -7,22 +7,29 @@ This module's code is freely adapted from Scikit-Learn's
 sklearn.datasets.base.py code.
 """
 
-import pickle
+import json
 import tarfile
 import zipfile
 
-from os import makedirs, remove
-from os.path import exists
+from hashlib import sha1
+from os import makedirs, remove, rename
+from os.path import dirname, exists, join
 from pandas import concat, DataFrame, merge, read_csv
+from shutil import rmtree
+from tempfile import mkdtemp
 from urllib.request import urlretrieve
 
 from torchkge.data_structures import KnowledgeGraph
+from torchkge.exceptions import WrongArgumentsError
 
 from torchkge.utils import get_data_home, safe_extract
 from torchkge.utils.operations import extend_dicts
 
+# version of the format of the binary cache of data sets
+CACHE_VERSION = 2
 
-def load_fb13(data_home=None):
+
+def load_fb13(data_home=None, cache=True):
     """Load FB13 dataset.
 
     Parameters
@@ -31,6 +38,10 @@ def load_fb13(data_home=None):
         Path to the `torchkge_data` directory (containing data folders). If
         files are not present on disk in this directory, they are downloaded
         and then placed in the right place.
+    cache: bool, optional (default=True)
+        If True, the knowledge graph is stored in a binary cache next to the
+        data files the first time it is built and it is loaded from there
+        afterwards (see :func:`torchkge.utils.datasets.load_cached_kg`).
 
     Returns
     -------
@@ -50,19 +61,12 @@ def load_fb13(data_home=None):
             zip_ref.extractall(data_home)
         remove(data_home + '/FB13.zip')
 
-    df1 = read_csv(data_path + '/train2id.txt',
-                   sep='\t', header=None, names=['from', 'rel', 'to'])
-    df2 = read_csv(data_path + '/valid2id.txt',
-                   sep='\t', header=None, names=['from', 'rel', 'to'])
-    df3 = read_csv(data_path + '/test2id.txt',
-                   sep='\t', header=None, names=['from', 'rel', 'to'])
-    df = concat([df1, df2, df3])
-    kg = KnowledgeGraph(df)
-
-    return kg.split_kg(sizes=(len(df1), len(df2), len(df3)))
+    return load_split_kg(data_path,
+                         ['train2id.txt', 'valid2id.txt', 'test2id.txt'],
+                         cache)
 
 
-def load_fb15k(data_home=None):
+def load_fb15k(data_home=None, cache=True):
     """Load FB15k dataset. See `here
     <https://papers.nips.cc/paper/5071-translating-embeddings-for-modeling-multi-relational-data>`__
     for paper by Bordes et al. originally presenting the dataset.
@@ -73,6 +77,10 @@ def load_fb15k(data_home=None):
         Path to the `torchkge_data` directory (containing data folders). If
         files are not present on disk in this directory, they are downloaded
         and then placed in the right place.
+    cache: bool, optional (default=True)
+        If True, the knowledge graph is stored in a binary cache next to the
+        data files the first time it is built and it is loaded from there
+        afterwards (see :func:`torchkge.utils.datasets.load_cached_kg`).
 
     Returns
     -------
@@ -92,19 +100,12 @@ def load_fb15k(data_home=None):
             zip_ref.extractall(data_home)
         remove(data_home + '/FB15k.zip')
 
-    df1 = read_csv(data_path + '/freebase_mtr100_mte100-train.txt',
-                   sep='\t', header=None, names=['from', 'rel', 'to'])
-    df2 = read_csv(data_path + '/freebase_mtr100_mte100-valid.txt',
-                   sep='\t', header=None, names=['from', 'rel', 'to'])
-    df3 = read_csv(data_path + '/freebase_mtr100_mte100-test.txt',
-                   sep='\t', header=None, names=['from', 'rel', 'to'])
-    df = concat([df1, df2, df3])
-    kg = KnowledgeGraph(df)
-
-    return kg.split_kg(sizes=(len(df1), len(df2), len(df3)))
+    return load_split_kg(data_path, ['freebase_mtr100_mte100-train.txt',
+                                     'freebase_mtr100_mte100-valid.txt',
+                                     'freebase_mtr100_mte100-test.txt'], cache)
 
 
-def load_fb15k237(data_home=None):
+def load_fb15k237(data_home=None, cache=True):
     """Load FB15k237 dataset. See `here
     <https://www.aclweb.org/anthology/D15-1174/>`__ for paper by Toutanova et
     al. originally presenting the dataset.
@@ -115,6 +116,10 @@ def load_fb15k237(data_home=None):
         Path to the `torchkge_data` directory (containing data folders). If
         files are not present on disk in this directory, they are downloaded
         and then placed in the right place.
+    cache: bool, optional (default=True)
+        If True, the knowledge graph is stored in a binary cache next to the
+        data files the first time it is built and it is loaded from there
+        afterwards (see :func:`torchkge.utils.datasets.load_cached_kg`).
 
     Returns
     -------
@@ -134,19 +139,11 @@ def load_fb15k237(data_home=None):
             zip_ref.extractall(data_home)
         remove(data_home + '/FB15k237.zip')
 
-    df1 = read_csv(data_path + '/train.txt',
-                   sep='\t', header=None, names=['from', 'rel', 'to'])
-    df2 = read_csv(data_path + '/valid.txt',
-                   sep='\t', header=None, names=['from', 'rel', 'to'])
-    df3 = read_csv(data_path + '/test.txt',
-                   sep='\t', header=None, names=['from', 'rel', 'to'])
-    df = concat([df1, df2, df3])
-    kg = KnowledgeGraph(df)
+    return load_split_kg(data_path, ['train.txt', 'valid.txt', 'test.txt'],
+                         cache)
 
-    return kg.split_kg(sizes=(len(df1), len(df2), len(df3)))
 
-
-def load_wn18(data_home=None):
+def load_wn18(data_home=None, cache=True):
     """Load WN18 dataset.
 
     Parameters
@@ -155,6 +152,10 @@ def load_wn18(data_home=None):
         Path to the `torchkge_data` directory (containing data folders). If
         files are not present on disk in this directory, they are downloaded
         and then placed in the right place.
+    cache: bool, optional (default=True)
+        If True, the knowledge graph is stored in a binary cache next to the
+        data files the first time it is built and it is loaded from there
+        afterwards (see :func:`torchkge.utils.datasets.load_cached_kg`).
 
     Returns
     -------
@@ -174,19 +175,12 @@ def load_wn18(data_home=None):
             zip_ref.extractall(data_home)
         remove(data_home + '/WN18.zip')
 
-    df1 = read_csv(data_path + '/wordnet-mlj12-train.txt',
-                   sep='\t', header=None, names=['from', 'rel', 'to'])
-    df2 = read_csv(data_path + '/wordnet-mlj12-valid.txt',
-                   sep='\t', header=None, names=['from', 'rel', 'to'])
-    df3 = read_csv(data_path + '/wordnet-mlj12-test.txt',
-                   sep='\t', header=None, names=['from', 'rel', 'to'])
-    df = concat([df1, df2, df3])
-    kg = KnowledgeGraph(df)
-
-    return kg.split_kg(sizes=(len(df1), len(df2), len(df3)))
+    return load_split_kg(data_path, ['wordnet-mlj12-train.txt',
+                                     'wordnet-mlj12-valid.txt',
+                                     'wordnet-mlj12-test.txt'], cache)
 
 
-def load_wn18rr(data_home=None):
+def load_wn18rr(data_home=None, cache=True):
     """Load WN18RR dataset. See `here
     <https://arxiv.org/abs/1707.01476>`__ for paper by Dettmers et
     al. originally presenting the dataset.
@@ -197,6 +191,10 @@ def load_wn18rr(data_home=None):
         Path to the `torchkge_data` directory (containing data folders). If
         files are not present on disk in this directory, they are downloaded
         and then placed in the right place.
+    cache: bool, optional (default=True)
+        If True, the knowledge graph is stored in a binary cache next to the
+        data files the first time it is built and it is loaded from there
+        afterwards (see :func:`torchkge.utils.datasets.load_cached_kg`).
 
     Returns
     -------
@@ -216,19 +214,11 @@ def load_wn18rr(data_home=None):
             zip_ref.extractall(data_home)
         remove(data_home + '/WN18RR.zip')
 
-    df1 = read_csv(data_path + '/train.txt',
-                   sep='\t', header=None, names=['from', 'rel', 'to'])
-    df2 = read_csv(data_path + '/valid.txt',
-                   sep='\t', header=None, names=['from', 'rel', 'to'])
-    df3 = read_csv(data_path + '/test.txt',
-                   sep='\t', header=None, names=['from', 'rel', 'to'])
-    df = concat([df1, df2, df3])
-    kg = KnowledgeGraph(df)
-
-    return kg.split_kg(sizes=(len(df1), len(df2), len(df3)))
+    return load_split_kg(data_path, ['train.txt', 'valid.txt', 'test.txt'],
+                         cache)
 
 
-def load_yago3_10(data_home=None):
+def load_yago3_10(data_home=None, cache=True):
     """Load YAGO3-10 dataset. See `here
     <https://arxiv.org/abs/1707.01476>`__ for paper by Dettmers et
     al. originally presenting the dataset.
@@ -239,6 +229,10 @@ def load_yago3_10(data_home=None):
         Path to the `torchkge_data` directory (containing data folders). If
         files are not present on disk in this directory, they are downloaded
         and then placed in the right place.
+    cache: bool, optional (default=True)
+        If True, the knowledge graph is stored in a binary cache next to the
+        data files the first time it is built and it is loaded from there
+        afterwards (see :func:`torchkge.utils.datasets.load_cached_kg`).
 
     Returns
     -------
@@ -258,19 +252,11 @@ def load_yago3_10(data_home=None):
             zip_ref.extractall(data_home)
         remove(data_home + '/YAGO3-10.zip')
 
-    df1 = read_csv(data_path + '/train.txt',
-                   sep='\t', header=None, names=['from', 'rel', 'to'])
-    df2 = read_csv(data_path + '/valid.txt',
-                   sep='\t', header=None, names=['from', 'rel', 'to'])
-    df3 = read_csv(data_path + '/test.txt',
-                   sep='\t', header=None, names=['from', 'rel', 'to'])
-    df = concat([df1, df2, df3])
-    kg = KnowledgeGraph(df)
+    return load_split_kg(data_path, ['train.txt', 'valid.txt', 'test.txt'],
+                         cache)
 
-    return kg.split_kg(sizes=(len(df1), len(df2), len(df3)))
 
-
-def load_wikidatasets(which, limit_=0, data_home=None):
+def load_wikidatasets(which, limit_=0, data_home=None, cache=True):
     """Load WikiDataSets dataset. See `here
     <https://arxiv.org/abs/1906.04536>`__ for paper by Boschin et al.
     originally presenting the dataset.
@@ -288,6 +274,10 @@ def load_wikidatasets(which, limit_=0, data_home=None):
         Path to the `torchkge_data` directory (containing data folders). If
         files are not present on disk in this directory, they are downloaded
         and then placed in the right place.
+    cache: bool, optional (default=True)
+        If True, the knowledge graph is stored in a binary cache next to the
+        data files the first time it is built and it is loaded from there
+        afterwards (see :func:`torchkge.utils.datasets.load_cached_kg`).
 
     Returns
     -------
@@ -310,29 +300,31 @@ def load_wikidatasets(which, limit_=0, data_home=None):
             safe_extract(tf, data_home)
         remove(data_home + '/{}.tar.gz'.format(which))
 
-    df = read_csv(data_path + '/edges.tsv', sep='\t',
-                  names=['from', 'to', 'rel'], skiprows=1)
+    def build():
+        df = read_csv(data_path + '/edges.tsv', sep='\t',
+                      names=['from', 'to', 'rel'], skiprows=1)
 
-    if limit_ > 0:
-        a = df.groupby('from').count()['rel']
-        b = df.groupby('to').count()['rel']
+        if limit_ > 0:
+            a = df.groupby('from').count()['rel']
+            b = df.groupby('to').count()['rel']
 
-        # Filter out nodes with too few facts
-        tmp = merge(right=DataFrame(a).reset_index(),
-                    left=DataFrame(b).reset_index(),
-                    how='outer', right_on='from', left_on='to', ).fillna(0)
+            # Filter out nodes with too few facts
+            tmp = merge(right=DataFrame(a).reset_index(),
+                        left=DataFrame(b).reset_index(),
+                        how='outer', right_on='from', left_on='to', ).fillna(0)
 
-        tmp['rel'] = tmp['rel_x'] + tmp['rel_y']
-        tmp = tmp.drop(['from', 'rel_x', 'rel_y'], axis=1)
+            tmp['rel'] = tmp['rel_x'] + tmp['rel_y']
+            tmp = tmp.drop(['from', 'rel_x', 'rel_y'], axis=1)
 
-        tmp = tmp.loc[tmp['rel'] >= limit_]
-        df_bis = df.loc[df['from'].isin(tmp['to']) | df['to'].isin(tmp['to'])]
+            tmp = tmp.loc[tmp['rel'] >= limit_]
+            df = df.loc[df['from'].isin(tmp['to']) | df['to'].isin(tmp['to'])]
 
-        kg = KnowledgeGraph(df_bis)
-    else:
-        kg = KnowledgeGraph(df)
+        return KnowledgeGraph(df), None
 
-    return kg
+    if not cache:
+        return build()[0]
+    return load_cached_kg(data_path, ['edges.tsv'], build,
+                          params={'limit_': limit_})
 
 
 def load_wikidata_vitals(level=5, data_home=None):
@@ -372,7 +364,8 @@ def load_wikidata_vitals(level=5, data_home=None):
             zip_ref.extractall(data_home)
         remove(data_home + '/wikidatavitals-level{}.zip'.format(level))
 
-    if not exists(data_path+'/kgs.pkl'):
+    kgs_path = data_path + '/kgs'
+    if not exists(kgs_path + '/labels.json'):
         print('Building torchkge.KnowledgeGraph objects from the archive.')
         df = read_csv(data_path + '/edges.tsv', sep='\t',
                       names=['from', 'to', 'rel'], skiprows=1)
@@ -397,20 +390,25 @@ def load_wikidata_vitals(level=5, data_home=None):
         ent2ix, rel2ix = extend_dicts(kg, attributes)
         kg_attr = KnowledgeGraph(attributes, ent2ix=ent2ix, rel2ix=rel2ix)
 
-        kg.relid2label = relid2label
-        kg_attr.relid2label = relid2label
-        kg.entid2label = entid2label
-        kg_attr.entid2label = entid2label
-        kg.entid2pagename = entid2pagename
-        kg_attr.entid2pagename = entid2pagename
+        labels = {'relid2label': relid2label, 'entid2label': entid2label,
+                  'entid2pagename': entid2pagename}
 
-        with open(data_path + '/kgs.pkl', 'wb') as f:
-            pickle.dump((kg, kg_attr), f)
+        kg.save(kgs_path + '/kg')
+        kg_attr.save(kgs_path + '/kg_attr')
+        # written last as it marks the graphs as complete
+        with open(kgs_path + '/labels.json', 'w') as f:
+            json.dump(labels, f)
 
     else:
         print('Loading torchkge.KnowledgeGraph objects from disk.')
-        with open(data_path + '/kgs.pkl', 'rb') as f:
-            kg, kg_attr = pickle.load(f)
+        kg = KnowledgeGraph.load(kgs_path + '/kg')
+        kg_attr = KnowledgeGraph.load(kgs_path + '/kg_attr')
+        with open(kgs_path + '/labels.json') as f:
+            labels = json.load(f)
+
+    for name, mapping in labels.items():
+        setattr(kg, name, mapping)
+        setattr(kg_attr, name, mapping)
 
     return kg, kg_attr
 
@@ -433,3 +431,138 @@ def enrich(df, entities, relations):
 
     df.columns = ['from', 'to', 'rel']
     return df
+
+
+def load_split_kg(data_path, files, cache=True):
+    """Load a knowledge graph split in training, validation and test files
+    of tab-separated facts (head, relation, tail).
+
+    Parameters
+    ----------
+    data_path: str
+        Path to the directory of the data set.
+    files: list of str
+        Names of the training, validation and test files.
+    cache: bool, optional (default=True)
+        Indicates whether the binary cache should be used.
+
+    Returns
+    -------
+    kg_train: torchkge.data_structures.KnowledgeGraph
+    kg_val: torchkge.data_structures.KnowledgeGraph
+    kg_test: torchkge.data_structures.KnowledgeGraph
+
+    """
+    def build():
+        dfs = [read_csv(data_path + '/' + f, sep='\t', header=None,
+                        names=['from', 'rel', 'to'])
+               for f in files]
+        return KnowledgeGraph(concat(dfs)), [len(df) for df in dfs]
+
+    if not cache:
+        kg, sizes = build()
+        return kg.split_kg(sizes=sizes)
+    return load_cached_kg(data_path, files, build)
+
+
+def load_cached_kg(data_path, files, build, params=None):
+    """Load a knowledge graph from the binary cache stored in the `cache`
+    directory of `data_path` or build it and write the cache.
+
+    The cache holds the tensors of facts, the vocabularies and the filter
+    indexes of the graph as `.npy` files, which are memory-mapped when
+    loaded. It is versioned by `torchkge.utils.datasets.CACHE_VERSION` and
+    identified by a fingerprint of the content of the data files and of
+    `params`: it is written again if any of them changes.
+
+    Parameters
+    ----------
+    data_path: str
+        Path to the directory of the data set.
+    files: list of str
+        Names of the data files the graph is built from.
+    build: function
+        Function with no argument returning the knowledge graph and the
+        sizes of its splits (or None if it should not be split).
+    params: dict, optional
+        Parameters of the building of the graph (JSON-serializable).
+
+    Returns
+    -------
+    kg: torchkge.data_structures.KnowledgeGraph
+        Knowledge graph, or tuple of the knowledge graphs resulting from
+        `kg.split_kg(sizes=sizes)` if sizes are given.
+
+    """
+    cache_path = data_path + '/cache'
+    fingerprint = get_fingerprint([data_path + '/' + f for f in files], params)
+
+    loaded = read_cache(cache_path, fingerprint)
+    if loaded is None:
+        kg, sizes = build()
+        write_cache(cache_path, fingerprint, kg, sizes)
+    else:
+        kg, sizes = loaded
+
+    if sizes is None:
+        return kg
+    return kg.split_kg(sizes=sizes)
+
+
+def get_fingerprint(paths, params=None):
+    """Return the SHA-1 digest of the cache version, of `params` and of the
+    content of the files in `paths`."""
+    digest = sha1(json.dumps([CACHE_VERSION, params], sort_keys=True).encode())
+    for path in paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def write_cache(cache_path, fingerprint, kg, sizes):
+    """Write `kg` in the directory `cache_path` with
+    :meth:`torchkge.data_structures.KnowledgeGraph.save`. Files are first
+    written in a temporary directory and the previous cache is moved aside
+    before the new one is renamed to `cache_path`. A process loading the
+    data set at the same time can still find no cache or lose it while
+    reading it, in which case it builds the data set again (see
+    `read_cache`). Nothing is written if the labels of entities or relations
+    are neither all strings nor all numbers.
+
+    """
+    tmp_path = mkdtemp(prefix='.cache-', dir=dirname(cache_path))
+    old_path = tmp_path + '-old'
+    try:
+        kg.save(join(tmp_path, 'kg'))
+        with open(join(tmp_path, 'meta.json'), 'w') as f:
+            json.dump({'version': CACHE_VERSION, 'fingerprint': fingerprint,
+                       'sizes': sizes}, f)
+        if exists(cache_path):
+            rename(cache_path, old_path)
+        rename(tmp_path, cache_path)
+    except (OSError, WrongArgumentsError):
+        # labels cannot be saved or another process wrote the cache in the
+        # meantime
+        pass
+    finally:
+        rmtree(tmp_path, ignore_errors=True)
+        rmtree(old_path, ignore_errors=True)
+
+
+def read_cache(cache_path, fingerprint):
+    """Return the knowledge graph stored in `cache_path` and the sizes of its
+    splits or None if there is no valid cache for `fingerprint`, e.g. if
+    another process replaced it while it was being read."""
+    try:
+        with open(join(cache_path, 'meta.json')) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get('version') != CACHE_VERSION or \
+            meta.get('fingerprint') != fingerprint:
+        return None
+    try:
+        return KnowledgeGraph.load(join(cache_path, 'kg')), meta['sizes']
+    except (OSError, WrongArgumentsError):
+        return None
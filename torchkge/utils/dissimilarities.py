@@ -5,7 +5,7 @@ Copyright TorchKGE developers
 """
 
 from math import pi
-from torch import abs, cos, min
+from torch import abs, addmm, cat, cdist, cos, min
 
 
 def l1_dissimilarity(a, b):
@@ -52,3 +52,45 @@ def el2_torus_dissimilarity(a, b):
     tmp = min(a - b, 1 - (a - b))
     tmp = 2 * (1 - cos(2 * pi * tmp))
     return tmp.sum(dim=-1) / 4
+
+
+def l1_pairwise_dissimilarity(a, b):
+    """Compute dissimilarities between all rows of `a` and all rows of `b`
+    as :math:`||a_i-b_j||_1`. The result has shape (a.shape[0], b.shape[0]).
+
+    """
+    return cdist(a, b, p=1)
+
+
+def l2_pairwise_dissimilarity(a, b, b_sq_norms=None):
+    """Compute dissimilarities between all rows of `a` and all rows of `b`
+    as :math:`||a_i-b_j||_2^2 = ||a_i||_2^2 + ||b_j||_2^2 - 2<a_i, b_j>`,
+    which only requires one matrix product. The result has shape
+    (a.shape[0], b.shape[0]).
+
+    Parameters
+    ----------
+    a: torch.Tensor, shape: (n, dim)
+    b: torch.Tensor, shape: (m, dim)
+    b_sq_norms: torch.Tensor, shape: (m), optional (default=None)
+        Squared L2 norms of the rows of `b`, if they are already known.
+
+    """
+    if b_sq_norms is None:
+        b_sq_norms = (b ** 2).sum(dim=1)
+    sq_norms = (a ** 2).sum(dim=1).view(-1, 1) + b_sq_norms.view(1, -1)
+    return addmm(sq_norms, a, b.t(), alpha=-2).clamp_(min=0)
+
+
+def blocked_pairwise_dissimilarity(dissimilarity, a, b, max_size=2**24):
+    """Compute dissimilarities between all rows of `a` and all rows of `b`
+    with any of the dissimilarity functions of this module. Rows of `b` are
+    processed by blocks so that no more than `max_size` differences are
+    stored at once. The result has shape (a.shape[0], b.shape[0]).
+
+    """
+    n, dim = a.shape
+    block_size = max(1, max_size // max(1, n * dim))
+    a = a.view(n, 1, dim)
+    return cat([dissimilarity(a, b[start: start + block_size].view(1, -1, dim))
+                for start in range(0, b.shape[0], block_size)], dim=1)
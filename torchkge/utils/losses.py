@@ -27,9 +27,12 @@ class MarginLoss(Module):
         positive_triplets: torch.Tensor, dtype: torch.float, shape: (b_size)
             Scores of the true triplets as returned by the `forward` methods of
             the models.
-        negative_triplets: torch.Tensor, dtype: torch.float, shape: (b_size)
+        negative_triplets: torch.Tensor, dtype: torch.float,
+        shape: (b_size) or (b_size, n_neg)
             Scores of the negative triplets as returned by the `forward`
-            methods of the models.
+            methods of the models. When several negative triplets are
+            sampled from each true one, each true triplet is compared to
+            all of its negative ones.
 
         Returns
         -------
@@ -40,6 +43,8 @@ class MarginLoss(Module):
             :math:`f(h,r,t)` is the score of a true fact and
             :math:`f(h',r',t')` is the score of the associated negative fact.
         """
+        positive_triplets = match_negatives(positive_triplets,
+                                            negative_triplets)
         return self.loss(positive_triplets, negative_triplets,
                          target=ones_like(positive_triplets))
 
@@ -62,9 +67,12 @@ class LogisticLoss(Module):
         positive_triplets: torch.Tensor, dtype: torch.float, shape: (b_size)
             Scores of the true triplets as returned by the `forward` methods
             of the models.
-        negative_triplets: torch.Tensor, dtype: torch.float, shape: (b_size)
+        negative_triplets: torch.Tensor, dtype: torch.float,
+        shape: (b_size) or (b_size, n_neg)
             Scores of the negative triplets as returned by the `forward`
-            methods of the models.
+            methods of the models. When several negative triplets are
+            sampled from each true one, each true triplet is compared to
+            all of its negative ones.
         Returns
         -------
         loss: torch.Tensor, shape: (n_facts, dim), dtype: torch.float
@@ -72,6 +80,8 @@ class LogisticLoss(Module):
             where :math:`f(h,r,t)` is the score of the fact and :math:`\\eta`
             is either 1 or -1 if the fact is true or false.
         """
+        positive_triplets = match_negatives(positive_triplets,
+                                            negative_triplets)
         targets = ones_like(positive_triplets)
         return self.loss(positive_triplets, targets) + \
             self.loss(negative_triplets, -targets)
@@ -95,9 +105,12 @@ class BinaryCrossEntropyLoss(Module):
         positive_triplets: torch.Tensor, dtype: torch.float, shape: (b_size)
             Scores of the true triplets as returned by the `forward` methods
             of the models.
-        negative_triplets: torch.Tensor, dtype: torch.float, shape: (b_size)
+        negative_triplets: torch.Tensor, dtype: torch.float,
+        shape: (b_size) or (b_size, n_neg)
             Scores of the negative triplets as returned by the `forward`
-            methods of the models.
+            methods of the models. When several negative triplets are
+            sampled from each true one, each true triplet is compared to
+            all of its negative ones.
         Returns
         -------
         loss: torch.Tensor, shape: (n_facts, dim), dtype: torch.float
@@ -106,7 +119,34 @@ class BinaryCrossEntropyLoss(Module):
             is the score of the fact and :math:`\\eta` is either 1 or
             0 if the fact is true or false.
         """
+        positive_triplets = match_negatives(positive_triplets,
+                                            negative_triplets)
         return self.loss(self.sig(positive_triplets),
                          ones_like(positive_triplets)) + \
             self.loss(self.sig(negative_triplets),
                       zeros_like(negative_triplets))
+
+
+def match_negatives(positive_triplets, negative_triplets):
+    """Broadcast the scores of the true triplets to the shape of the scores
+    of their negative counterparts without copying them.
+
+    Parameters
+    ----------
+    positive_triplets: torch.Tensor, dtype: torch.float, shape: (b_size)
+        Scores of the true triplets.
+    negative_triplets: torch.Tensor, dtype: torch.float,
+    shape: (b_size) or (b_size, n_neg)
+        Scores of the negative triplets.
+
+    Returns
+    -------
+    positive_triplets: torch.Tensor, dtype: torch.float,
+    shape: (b_size) or (b_size, n_neg)
+        View of the scores of the true triplets with the shape of
+        `negative_triplets`.
+
+    """
+    if negative_triplets.dim() > positive_triplets.dim():
+        return positive_triplets.unsqueeze(1).expand_as(negative_triplets)
+    return positive_triplets
@@ -9,25 +9,98 @@ from torch.nn import Embedding
 from torch.nn.init import xavier_uniform_
 
 import pickle
-import tarfile
 
+from collections import OrderedDict
+
+from torchkge.data_structures import FilterIndex
 from torchkge.utils import get_data_home, safe_extract
 
 from os import makedirs, remove
 from os.path import exists
-from urllib.request import urlretrieve
 
 
-def init_embedding(n_vectors, dim):
+def init_embedding(n_vectors, dim, sparse=False):
     """Create a torch.nn.Embedding object with `n_vectors` samples and `dim`
-    dimensions. It is then initialized with Xavier uniform distribution.
+    dimensions. It is then initialized with Xavier uniform distribution. If
+    `sparse` is True, the gradient of its weight is a sparse tensor only
+    holding the rows used in the forward pass.
     """
-    entity_embeddings = Embedding(n_vectors, dim)
+    entity_embeddings = Embedding(n_vectors, dim, sparse=sparse)
     xavier_uniform_(entity_embeddings.weight.data)
 
     return entity_embeddings
 
 
+class ProjectionCache(object):
+    """Least recently used cache of the projections of all entities in
+    relation-specific spaces. It is used by translation models projecting
+    entities (e.g. TransH, TransR and TransD) at inference time, instead of
+    storing the dense (n_rel, n_ent, dim) tensor of all projections.
+
+    Parameters
+    ----------
+    project: function
+        Function taking the index of a relation as argument and returning the
+        tensor of shape (n_ent, dim) of the projections of all entities for
+        this relation.
+    max_size: int
+        Maximum size in bytes of the cached projections. The least recently
+        used projections are dropped once it is reached.
+
+    Attributes
+    ----------
+    project: function
+        Function computing the projections of all entities for a relation.
+    max_size: int
+        Maximum size in bytes of the cached projections.
+    size: int
+        Current size in bytes of the cached projections.
+    hits: int
+        Number of projections found in the cache.
+    misses: int
+        Number of projections that had to be computed.
+
+    """
+    def __init__(self, project, max_size):
+        self.project = project
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.projections = OrderedDict()
+
+    def __len__(self):
+        return len(self.projections)
+
+    def __contains__(self, r):
+        return int(r) in self.projections
+
+    def __getitem__(self, r):
+        r = int(r)
+        if r in self.projections:
+            self.hits += 1
+            self.projections.move_to_end(r)
+            return self.projections[r]
+
+        self.misses += 1
+        proj = self.project(r)
+        n_bytes = proj.element_size() * proj.nelement()
+        if n_bytes <= self.max_size:
+            while self.size + n_bytes > self.max_size:
+                _, dropped = self.projections.popitem(last=False)
+                self.size -= dropped.element_size() * dropped.nelement()
+            self.projections[r] = proj
+            self.size += n_bytes
+        return proj
+
+    def clear(self):
+        """Drop all cached projections.
+
+        """
+        self.projections.clear()
+        self.size = 0
+
+
 def load_embeddings(model, dim, dataset, data_home=None):
 
     if data_home is None:
@@ -36,6 +109,9 @@ def load_embeddings(model, dim, dataset, data_home=None):
     targz_file = data_path + '{}_{}_{}.tar.gz'.format(model, dataset, dim)
     pkl_file = data_path + '{}_{}_{}.pkl'.format(model, dataset, dim)
     if not exists(pkl_file):
+        import tarfile
+        from urllib.request import urlretrieve
+
         if not exists(data_path):
             makedirs(data_path, exist_ok=True)
         urlretrieve("https://graphs.telecom-paris.fr/data/torchkge/models/{}_{}_{}.tar.gz".format(model, dataset, dim),
@@ -57,7 +133,7 @@ def get_true_targets(dictionary, key1, key2, true_idx, i):
 
     Parameters
     ----------
-    dictionary: default dict
+    dictionary: default dict or torchkge.data_structures.FilterIndex
         Dictionary of keys (int, int) and values list of ints giving all
         possible entities for the (entity, relation) pair.
     key1: torch.Tensor, shape: (batch_size), dtype: torch.long
@@ -88,11 +164,73 @@ def get_true_targets(dictionary, key1, key2, true_idx, i):
         return None
 
 
+def get_true_targets_batch(index, key1, key2, true_idx):
+    """Batched version of `get_true_targets`: returns for the whole batch
+    the pairs (i, c) such that `c` is a true target for sample `i`.
+
+    Parameters
+    ----------
+    index: torchkge.data_structures.FilterIndex
+        Index of all the possible targets for each pair of keys.
+    key1: torch.Tensor, shape: (batch_size), dtype: torch.long
+    key2: torch.Tensor, shape: (batch_size), dtype: torch.long
+    true_idx: torch.Tensor, shape: (batch_size), dtype: torch.long
+        Tensor containing the true target for each sample. It is not
+        returned. If None, all true targets are returned.
+
+    Returns
+    -------
+    rows: torch.Tensor, shape: (n_targets), dtype: torch.long
+        Indices in the batch of the samples.
+    targets: torch.Tensor, shape: (n_targets), dtype: torch.long
+        Indices of the true targets.
+
+    """
+    rows, targets = index.lookup(key1, key2)
+    if true_idx is not None:
+        mask = (targets != true_idx.cpu()[rows])
+        rows, targets = rows[mask], targets[mask]
+    return rows, targets
+
+
 def filter_scores(scores, dictionary, key1, key2, true_idx):
-    # filter out the true negative samples by assigning - inf score.
-    b_size = scores.shape[0]
+    """Filter out the true negative samples by assigning - inf score. For
+    each index `i` of the batch, the candidates `c` such that
+    (key1[i], key2[i], c) is a true fact (other than true_idx[i]) are filtered
+    out.
+
+    Parameters
+    ----------
+    scores: torch.Tensor, shape: (batch_size, n_candidates), dtype: torch.float
+        Scores of each candidate for each sample of the batch.
+    dictionary: default dict or torchkge.data_structures.FilterIndex
+        Dictionary of keys (int, int) and values list of ints giving all
+        possible candidates for the pair. If it is an index, the filtering is
+        done for the whole batch at once.
+    key1: torch.Tensor, shape: (batch_size), dtype: torch.long
+    key2: torch.Tensor, shape: (batch_size), dtype: torch.long
+    true_idx: torch.Tensor, shape: (batch_size), dtype: torch.long
+        Tensor containing the true candidate for each sample. It is not
+        filtered out. If None, all true candidates are filtered out.
+
+    Returns
+    -------
+    filt_scores: torch.Tensor, shape: (batch_size, n_candidates),
+    dtype: torch.float
+        Copy of `scores` with filtered candidates set to - inf.
+
+    """
     filt_scores = scores.clone()
 
+    if isinstance(dictionary, FilterIndex):
+        rows, cols = get_true_targets_batch(dictionary, key1, key2, true_idx)
+        filt_scores.index_put_((rows.to(scores.device),
+                                cols.to(scores.device)),
+                               tensor(- float('Inf'), device=scores.device))
+        return filt_scores
+
+    b_size = scores.shape[0]
+
     for i in range(b_size):
         true_targets = get_true_targets(dictionary, key1, key2, true_idx, i)
         if true_targets is None:
@@ -5,8 +5,7 @@ Copyright TorchKGE developers
 """
 
 from collections import defaultdict
-from pandas import DataFrame
-from torch import zeros, cat
+from torch import bincount, zeros, cat
 from numpy import unique
 
 
@@ -125,10 +124,7 @@ def get_tph(t):
     d: dict
         keys: relation indices, values: average number of tail per heads.
     """
-    df = DataFrame(t.numpy(), columns=['from', 'to', 'rel'])
-    df = df.groupby(['from', 'rel']).count().groupby('rel').mean()
-    df.reset_index(inplace=True)
-    return {df.loc[i].values[0]: df.loc[i].values[1] for i in df.index}
+    return get_mean_counts(t[:, 0], t[:, 2])
 
 
 def get_hpt(t):
@@ -143,10 +139,33 @@ def get_hpt(t):
     d: dict
         keys: relation indices, values: average number of head per tails.
     """
-    df = DataFrame(t.numpy(), columns=['from', 'to', 'rel'])
-    df = df.groupby(['rel', 'to']).count().groupby('rel').mean()
-    df.reset_index(inplace=True)
-    return {df.loc[i].values[0]: df.loc[i].values[1] for i in df.index}
+    return get_mean_counts(t[:, 1], t[:, 2])
+
+
+def get_mean_counts(entities, relations):
+    """Get the average number of facts per distinct pair (entity, relation)
+    for each relation.
+
+    Parameters
+    ----------
+    entities: `torch.Tensor`, dtype: `torch.long`, shape: (n_facts)
+    relations: `torch.Tensor`, dtype: `torch.long`, shape: (n_facts)
+
+    Returns
+    -------
+    d: dict
+        keys: relation indices, values: average number of facts per pair.
+    """
+    if len(relations) == 0:
+        return {}
+    # indices can be stored in a compact type (see
+    # KnowledgeGraph.index_dtype) in which the keys of the pairs overflow
+    entities, relations = entities.long(), relations.long()
+    n_rel = int(relations.max()) + 1
+    pairs = (entities * n_rel + relations).unique()
+    n_pairs = bincount(pairs % n_rel, minlength=n_rel).tolist()
+    n_facts = bincount(relations, minlength=n_rel).tolist()
+    return {r: n_facts[r] / n_pairs[r] for r in range(n_rel) if n_pairs[r] > 0}
 
 
 def get_bernoulli_probs(kg):
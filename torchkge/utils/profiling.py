@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright TorchKGE developers
+@author: Armand Boschin <aboschin@enst.fr>
+"""
+import sys
+
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from time import perf_counter
+
+from torch import cuda
+from torch.profiler import ProfilerActivity, profile, record_function
+
+try:
+    from resource import getrusage, RUSAGE_SELF
+except ImportError:
+    getrusage = None
+
+
+class TimingReport(object):
+    """Summary of the timings recorded by a
+    :class:`torchkge.utils.profiling.StageTimer`.
+
+    Attributes
+    ----------
+    stages: collections.OrderedDict
+        Keys are the names of the stages (e.g. 'sampling', 'forward',
+        'backward', 'step', 'normalize', 'scoring', 'filter_scores',
+        'get_rank') and values are their total wall time in seconds.
+    records: list
+        One dictionary per batch, holding the time spent in each stage since
+        the previous batch, the total time `time` of the batch and its
+        number of facts `n_facts`, along with the information given to
+        `StageTimer.end_batch`.
+    total_time: float
+        Wall time in seconds between the start and the end of the run.
+    n_batches: int
+        Number of batches.
+    n_facts: int
+        Number of facts processed.
+    facts_per_sec: float
+        Number of facts processed per second.
+    peak_memory: int
+        Peak resident set size of the process in bytes (None if it is not
+        available on the platform).
+    peak_cuda_memory: int
+        Peak memory allocated by tensors on the current cuda device in bytes
+        (None if cuda is not available).
+
+    """
+    def __init__(self, stages, records, total_time, peak_memory,
+                 peak_cuda_memory):
+        self.stages = stages
+        self.records = records
+        self.total_time = total_time
+        self.n_batches = len(records)
+        self.n_facts = sum(r['n_facts'] for r in records)
+        self.facts_per_sec = \
+            self.n_facts / total_time if total_time > 0 else 0.
+        self.peak_memory = peak_memory
+        self.peak_cuda_memory = peak_cuda_memory
+
+    def to_dict(self):
+        """Return the report (without the records of the batches) as a
+        dictionary, e.g. to be serialized in JSON.
+
+        """
+        return {'stages': dict(self.stages), 'total_time': self.total_time,
+                'n_batches': self.n_batches, 'n_facts': self.n_facts,
+                'facts_per_sec': self.facts_per_sec,
+                'peak_memory': self.peak_memory,
+                'peak_cuda_memory': self.peak_cuda_memory}
+
+
+class StageTimer(object):
+    """Record the wall time of the stages of a training or evaluation run,
+    batch after batch. It can be given to
+    :class:`torchkge.utils.training.Trainer` and to the `evaluate` methods of
+    the evaluators, which call `start`, `stage`, `end_batch` and `stop`.
+
+    Parameters
+    ----------
+    callback: function (opt, default = None)
+        Function called with the record (dictionary) of each batch once it is
+        done, and with the :class:`torchkge.utils.profiling.TimingReport` of
+        the run once it is over.
+    profile: bool (opt, default = False)
+        If True, the run is wrapped in a `torch.profiler.profile` context and
+        each stage is labeled with `torch.profiler.record_function`.
+    trace_path: str (opt, default = None)
+        If `profile` is True, path where the Chrome trace of the run is
+        exported.
+    synchronize: bool (opt, default = False)
+        If True, cuda kernels are waited for at the end of each stage so that
+        its wall time is not attributed to the next one.
+
+    Attributes
+    ----------
+    profiler: torch.profiler.profile
+        Profiler of the last run if `profile` is True.
+
+    """
+    def __init__(self, callback=None, profile=False, trace_path=None,
+                 synchronize=False):
+        self.callback = callback
+        self.profile = profile
+        self.trace_path = trace_path
+        self.synchronize = synchronize and cuda.is_available()
+        self.profiler = None
+        self.reset()
+
+    def reset(self):
+        """Drop the records of the previous run."""
+        self.stages = OrderedDict()
+        self.current = OrderedDict()
+        self.records = []
+        self.start_time = perf_counter()
+        self.last_batch = self.start_time
+        self.end_time = None
+
+    def start(self):
+        """Reset the records and start a run."""
+        self.reset()
+        if cuda.is_available():
+            cuda.reset_peak_memory_stats()
+        if self.profile:
+            activities = [ProfilerActivity.CPU]
+            if cuda.is_available():
+                activities.append(ProfilerActivity.CUDA)
+            self.profiler = profile(activities=activities)
+            self.profiler.__enter__()
+
+    @contextmanager
+    def stage(self, name):
+        """Context manager recording the time spent in a stage."""
+        start = perf_counter()
+        with record_function(name) if self.profile else nullcontext():
+            yield
+            if self.synchronize:
+                cuda.synchronize()
+        duration = perf_counter() - start
+        self.stages[name] = self.stages.get(name, 0.) + duration
+        self.current[name] = self.current.get(name, 0.) + duration
+
+    def end_batch(self, n_facts, **info):
+        """Record the end of a batch of `n_facts` facts. Keyword arguments
+        (e.g. `epoch`) are added to the record of the batch.
+
+        """
+        now = perf_counter()
+        record = OrderedDict(self.current)
+        record['time'] = now - self.last_batch
+        record['n_facts'] = n_facts
+        record.update(info)
+        self.records.append(record)
+        self.current = OrderedDict()
+        self.last_batch = now
+        if self.callback is not None:
+            self.callback(record)
+
+    def stop(self):
+        """End the run, export the profiler trace if needed and return the
+        report of the run.
+
+        """
+        self.end_time = perf_counter()
+        if self.profiler is not None:
+            self.profiler.__exit__(None, None, None)
+            if self.trace_path is not None:
+                self.profiler.export_chrome_trace(self.trace_path)
+        report = self.report()
+        if self.callback is not None:
+            self.callback(report)
+        return report
+
+    def report(self):
+        """Return the :class:`torchkge.utils.profiling.TimingReport` of the
+        current (or last) run.
+
+        """
+        end_time = perf_counter() if self.end_time is None else self.end_time
+        peak_cuda_memory = \
+            cuda.max_memory_allocated() if cuda.is_available() else None
+        return TimingReport(OrderedDict(self.stages), list(self.records),
+                            end_time - self.start_time, get_peak_memory(),
+                            peak_cuda_memory)
+
+
+def stage(timer, name):
+    """Return the context manager recording the time spent in a stage if
+    `timer` is a :class:`torchkge.utils.profiling.StageTimer` and a context
+    manager doing nothing if it is None.
+
+    """
+    if timer is None:
+        return nullcontext()
+    return timer.stage(name)
+
+
+def get_peak_memory():
+    """Return the peak resident set size of the current process in bytes or
+    None if it is not available on the platform.
+
+    """
+    if getrusage is None:
+        return None
+    peak = getrusage(RUSAGE_SELF).ru_maxrss
+    # it is given in kilobytes on Linux and in bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
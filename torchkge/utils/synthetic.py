@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright TorchKGE developers
+@author: Armand Boschin <aboschin@enst.fr>
+"""
+from math import gcd
+
+from torch import Generator, arange, cat, float64, rand, randint, randperm, \
+    searchsorted, tensor
+
+from ..data_structures import KnowledgeGraph
+from ..exceptions import WrongArgumentsError
+
+CARDINALITIES = ['1-1', '1-N', 'N-1', 'N-N']
+
+# multipliers of the SplitMix64 finalizer, as signed 64-bit integers
+MIX = [0x9E3779B97F4A7C15 - 2 ** 64, 0xBF58476D1CE4E5B9 - 2 ** 64]
+
+
+class KGGenerator(object):
+    """Generator of synthetic knowledge graphs with a realistic structure:
+    entity degrees and relation frequencies follow power laws (over randomly
+    ordered keys) and each relation is either
+    1-1, 1-N, N-1 or N-N. Facts are drawn by chunks of tensors, without
+    Python loops over facts, so that graphs of :math:`10^8` facts can be
+    generated.
+
+    * For N-N relations, heads and tails are both drawn from the entity
+      distribution.
+    * For 1-N relations, tails are drawn from the entity distribution and
+      the head of a tail is a pseudo-random function of the tail and the
+      relation, so that each tail has exactly one head for a relation.
+    * N-1 relations are the mirror of 1-N relations.
+    * For 1-1 relations, heads are drawn from the entity distribution and
+      the tail is given by a relation-specific permutation of the entities.
+
+    Parameters
+    ----------
+    n_ent: int
+        Number of entities.
+    n_rel: int
+        Number of relations.
+    ent_exponent: float, optional (default=1.)
+        Exponent :math:`s` of the power law of entities: the :math:`k`-th
+        most frequent entity is drawn with probability roughly proportional
+        to :math:`k^{-s}`. Entities are drawn uniformly if it is 0.
+    rel_exponent: float, optional (default=1.)
+        Exponent of the power law of relations.
+    cardinalities: tuple of floats, optional (default=(.1, .2, .2, .5))
+        Shares of 1-1, 1-N, N-1 and N-N relations.
+    seed: int, optional (default=0)
+        Seed of the random generator.
+
+    Attributes
+    ----------
+    relation_types: torch.Tensor, shape: (n_rel), dtype: torch.long
+        Index in `torchkge.utils.synthetic.CARDINALITIES` of the type of each
+        relation.
+    generator: torch.Generator
+        Random generator, its state goes on from a chunk to the next.
+
+    """
+    def __init__(self, n_ent, n_rel, ent_exponent=1., rel_exponent=1.,
+                 cardinalities=(.1, .2, .2, .5), seed=0):
+        if len(cardinalities) != 4 or min(cardinalities) < 0 or \
+                sum(cardinalities) <= 0:
+            raise WrongArgumentsError('`cardinalities` should hold the four '
+                                      'non-negative shares of 1-1, 1-N, N-1 '
+                                      'and N-N relations.')
+        if n_ent < 2 or n_rel < 1:
+            raise WrongArgumentsError('At least two entities and one relation '
+                                      'are needed.')
+        if n_ent ** 2 * n_rel >= 2 ** 63:
+            raise WrongArgumentsError('Facts of graphs with '
+                                      'n_ent ** 2 * n_rel >= 2 ** 63 cannot '
+                                      'be encoded as 64-bit integers.')
+        self.n_ent = n_ent
+        self.n_rel = n_rel
+        self.generator = Generator().manual_seed(seed)
+
+        self.ent_exponent = ent_exponent
+        self.rel_exponent = rel_exponent
+        self.ent_keys = randperm(n_ent, generator=self.generator)
+        self.rel_keys = randperm(n_rel, generator=self.generator)
+
+        shares = tensor(cardinalities, dtype=float64).cumsum(0)
+        u = rand(n_rel, generator=self.generator, dtype=float64)
+        self.relation_types = searchsorted(shares / shares[-1], u,
+                                           right=True).clamp(max=3)
+
+        # tails of 1-1 relations are given by (a * head + offset[r]) % n_ent,
+        # which is a permutation of the entities as a and n_ent are coprime
+        self.multiplier = int(n_ent * 0.6180339887) | 1
+        while gcd(self.multiplier, n_ent) != 1:
+            self.multiplier += 2
+        self.offsets = randint(n_ent, (n_rel,), generator=self.generator)
+        self.salt = randint(2 ** 62, (1,), generator=self.generator).item()
+
+    def draw_entities(self, u):
+        """Return the entities at quantiles `u` of the entity distribution."""
+        return self.ent_keys[get_ranks(u, self.n_ent, self.ent_exponent)]
+
+    def hash_entities(self, entities, relations):
+        """Return entities drawn from the entity distribution as a
+        deterministic function of `entities` and `relations`."""
+        x = (entities * self.n_rel + relations + self.salt) * MIX[0]
+        x = (x ^ ((x >> 32) & 0xFFFFFFFF)) * MIX[1]
+        u = ((x >> 11) & ((1 << 53) - 1)).double() / 2 ** 53
+        return self.draw_entities(u)
+
+    def sample(self, n):
+        """Draw `n` facts. Self-loops are removed so that less than `n` facts
+        can be returned, and there can be duplicates.
+
+        Returns
+        -------
+        heads: torch.Tensor, shape: (n_facts), dtype: torch.long
+        tails: torch.Tensor, shape: (n_facts), dtype: torch.long
+        relations: torch.Tensor, shape: (n_facts), dtype: torch.long
+
+        """
+        u = rand(n, generator=self.generator, dtype=float64)
+        relations = self.rel_keys[get_ranks(u, self.n_rel, self.rel_exponent)]
+        heads = self.draw_entities(rand(n, generator=self.generator,
+                                        dtype=float64))
+        tails = self.draw_entities(rand(n, generator=self.generator,
+                                        dtype=float64))
+
+        types = self.relation_types[relations]
+        one_one, one_many, many_one = (types == 0), (types == 1), (types == 2)
+        tails[one_one] = (heads[one_one] * self.multiplier +
+                          self.offsets[relations[one_one]]) % self.n_ent
+        heads[one_many] = self.hash_entities(tails[one_many],
+                                             relations[one_many])
+        tails[many_one] = self.hash_entities(heads[many_one],
+                                             relations[many_one])
+
+        mask = heads != tails
+        return heads[mask], tails[mask], relations[mask]
+
+    def chunks(self, n_facts, chunk_size=10 ** 6):
+        """Yield chunks of facts (as returned by `sample`) until `n_facts`
+        facts are yielded. Facts are not deduplicated across chunks.
+
+        Parameters
+        ----------
+        n_facts: int
+            Total number of facts.
+        chunk_size: int, optional (default=10**6)
+            Maximum number of facts in a chunk.
+
+        """
+        remaining = n_facts
+        while remaining > 0:
+            heads, tails, relations = self.sample(min(chunk_size, remaining))
+            remaining -= len(heads)
+            yield heads, tails, relations
+
+    def generate(self, n_facts, chunk_size=10 ** 6, max_rounds=10):
+        """Draw `n_facts` distinct facts in random order. Duplicates are
+        removed and new chunks are drawn until there are `n_facts` facts or
+        `max_rounds` rounds did not bring any new fact (so that less facts
+        are returned if the distributions cannot give that many distinct
+        facts).
+
+        Parameters
+        ----------
+        n_facts: int
+            Number of facts.
+        chunk_size: int, optional (default=10**6)
+            Maximum number of facts drawn at once.
+        max_rounds: int, optional (default=10)
+            Maximum number of consecutive rounds of drawing without new fact.
+
+        Returns
+        -------
+        kg: dict
+            Dictionary with keys ('heads', 'tails', 'relations') and values
+            the corresponding torch long tensors. It can be given to
+            :class:`torchkge.data_structures.KnowledgeGraph` as `kg`.
+
+        """
+        # facts are encoded as single integers to be deduplicated
+        keys = arange(0)
+        n_draws, stale = n_facts, 0
+        while len(keys) < n_facts and stale < max_rounds:
+            n = len(keys)
+            keys = cat([keys] + [(h * self.n_rel + r) * self.n_ent + t
+                                 for h, t, r in self.chunks(n_draws,
+                                                            chunk_size)])
+            keys = keys.unique()
+            stale = stale + 1 if len(keys) == n else 0
+            # the share of new distinct facts in the last draws gives the
+            # number of draws needed to fill the graph
+            n_draws = int(1.1 * (n_facts - len(keys)) * n_draws /
+                          max(len(keys) - n, 1)) + 1
+            n_draws = min(n_draws, 10 * n_facts)
+        keys = keys[randperm(len(keys), generator=self.generator)[:n_facts]]
+
+        return {'heads': keys // (self.n_ent * self.n_rel),
+                'tails': keys % self.n_ent,
+                'relations': (keys // self.n_ent) % self.n_rel}
+
+
+def synthetic_kg(n_ent, n_rel, n_facts, ent_exponent=1., rel_exponent=1.,
+                 cardinalities=(.1, .2, .2, .5), seed=0, chunk_size=10 ** 6):
+    """Generate a synthetic knowledge graph with a
+    :class:`torchkge.utils.synthetic.KGGenerator`. Entities and relations are
+    labeled by their integer keys.
+
+    Parameters
+    ----------
+    n_ent: int
+        Number of entities.
+    n_rel: int
+        Number of relations.
+    n_facts: int
+        Number of distinct facts.
+    ent_exponent: float, optional (default=1.)
+        Exponent of the Zipf distribution of entities.
+    rel_exponent: float, optional (default=1.)
+        Exponent of the Zipf distribution of relations.
+    cardinalities: tuple of floats, optional (default=(.1, .2, .2, .5))
+        Shares of 1-1, 1-N, N-1 and N-N relations.
+    seed: int, optional (default=0)
+        Seed of the random generator.
+    chunk_size: int, optional (default=10**6)
+        Maximum number of facts drawn at once.
+
+    Returns
+    -------
+    kg: torchkge.data_structures.KnowledgeGraph
+
+    """
+    generator = KGGenerator(n_ent, n_rel, ent_exponent, rel_exponent,
+                            cardinalities, seed)
+    return KnowledgeGraph(kg=generator.generate(n_facts, chunk_size),
+                          ent2ix={i: i for i in range(n_ent)},
+                          rel2ix={i: i for i in range(n_rel)})
+
+
+def get_ranks(u, n, exponent):
+    """Return the ranks in `range(n)` at quantiles `u` of a power law of
+    density proportional to :math:`x^{-s}` on :math:`[1, n + 1)`, which is a
+    continuous approximation of a Zipf distribution of exponent :math:`s`."""
+    if exponent == 1:
+        x = (n + 1.) ** u
+    else:
+        x = (1 + u * ((n + 1.) ** (1 - exponent) - 1)) ** (1 / (1 - exponent))
+    return (x.long() - 1).clamp(0, n - 1)
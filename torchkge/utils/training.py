@@ -3,11 +3,27 @@
 Copyright TorchKGE developers
 @author: Armand Boschin <aboschin@enst.fr>
 """
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 
-from ..data_structures import SmallKG
+from numpy.lib.format import open_memmap
+from os import makedirs
+from os.path import join
+from queue import Empty
+
+from torch import Generator, bernoulli, bincount, cat, from_numpy, \
+    get_num_threads, manual_seed, ones, randint, randperm, set_num_threads, \
+    save, sparse_coo_tensor, tensor, zeros, zeros_like
+from torch import distributed, multiprocessing
+from torch.nn import Embedding
+from torch.nn.init import xavier_uniform_
+from torch.optim import SGD
+
+from ..data_structures import KnowledgeGraph, SmallKG
+from ..exceptions import NotYetEvaluatedError, WrongArgumentsError
 from ..sampling import BernoulliNegativeSampler, UniformNegativeSampler
 from ..utils.data import get_n_batches
+from ..utils.profiling import stage
 
 from tqdm.autonotebook import tqdm
 
@@ -29,22 +45,45 @@ class TrainDataLoader:
         Can be either None (no use of cuda at all), 'all' to move all the
         dataset to cuda and then split in batches or 'batch' to simply move
         the batches to cuda before they are returned.
+    streaming: bool (opt, default = False)
+        If True, each batch is negatively sampled when it is yielded instead
+        of corrupting the whole dataset at the beginning of each epoch.
+    prefetch: bool (opt, default = False)
+        If True, the next batch is prepared (and negatively sampled in
+        streaming mode) in a background thread while the current one is used.
+    record_negatives: bool (opt, default = False)
+        In streaming mode, indicates whether the negatively sampled facts
+        should be kept so that `get_counter_examples` can return them. They
+        are always available in non-streaming mode.
+    n_neg: int (opt, default = 1)
+        Number of negative facts sampled from each fact. The negative heads
+        and tails of a batch are then of size `n_neg * batch_size`, the `j`-th
+        negative of the `i`-th fact being at index `j * batch_size + i`.
 
     """
 
-    def __init__(self, kg, batch_size, sampling_type, use_cuda=None):
+    def __init__(self, kg, batch_size, sampling_type, use_cuda=None,
+                 streaming=False, prefetch=False, record_negatives=False,
+                 n_neg=1):
         self.h = kg.head_idx
         self.t = kg.tail_idx
         self.r = kg.relations
 
         self.use_cuda = use_cuda
         self.b_size = batch_size
+        self.streaming = streaming
+        self.prefetch = prefetch
+        self.record_negatives = record_negatives
+        self.n_neg = n_neg
         self.iterator = None
+        # shared by the iterators so that stopping one early does not leave
+        # a thread behind
+        self.executor = None
 
         if sampling_type == 'unif':
-            self.sampler = UniformNegativeSampler(kg)
+            self.sampler = UniformNegativeSampler(kg, n_neg=n_neg)
         elif sampling_type == 'bern':
-            self.sampler = BernoulliNegativeSampler(kg)
+            self.sampler = BernoulliNegativeSampler(kg, n_neg=n_neg)
 
         self.tmp_cuda = use_cuda in ['batch', 'all']
 
@@ -57,11 +96,39 @@ class TrainDataLoader:
         return get_n_batches(len(self.h), self.b_size)
 
     def __iter__(self):
+        if self.prefetch and self.executor is None:
+            # a single worker keeps batches (and recorded negatives) in order
+            self.executor = ThreadPoolExecutor(max_workers=1)
         self.iterator = TrainDataLoaderIter(self)
         return self.iterator
 
     def get_counter_examples(self) -> SmallKG:
-        return SmallKG(self.iterator.nh, self.iterator.nt, self.iterator.r)
+        """Return the negatively sampled facts of the last (or current)
+        epoch. In streaming mode, this requires `record_negatives` to be True
+        and only the facts of the batches yielded so far are returned.
+
+        """
+        if self.iterator is None:
+            raise NotYetEvaluatedError('No negative sample was drawn yet, '
+                                       'iterate over the dataloader first.')
+        if not self.streaming:
+            if self.n_neg > 1:
+                return SmallKG(self.iterator.nh.t().flatten(),
+                               self.iterator.nt.t().flatten(),
+                               self.iterator.r.repeat(self.n_neg))
+            return SmallKG(self.iterator.nh, self.iterator.nt, self.iterator.r)
+        if not self.record_negatives:
+            raise WrongArgumentsError('Negative samples are not kept in '
+                                      'streaming mode unless '
+                                      'record_negatives is True.')
+        empty = self.r.new_empty((0,))
+        nh = cat(self.iterator.recorded_nh) if self.iterator.recorded_nh \
+            else empty
+        nt = cat(self.iterator.recorded_nt) if self.iterator.recorded_nt \
+            else empty
+        r = cat(self.iterator.recorded_r) if self.iterator.recorded_r \
+            else empty
+        return SmallKG(nh, nt, r)
 
 
 class TrainDataLoaderIter:
@@ -70,11 +137,17 @@ class TrainDataLoaderIter:
         self.t = loader.t
         self.r = loader.r
 
-        self.nh, self.nt = loader.sampler.corrupt_kg(loader.b_size,
-                                                     loader.tmp_cuda)
-        if loader.use_cuda:
-            self.nh = self.nh.cuda()
-            self.nt = self.nt.cuda()
+        self.sampler = loader.sampler
+        self.streaming = loader.streaming
+        self.record_negatives = loader.record_negatives
+        self.recorded_nh, self.recorded_nt, self.recorded_r = [], [], []
+
+        if not self.streaming:
+            self.nh, self.nt = loader.sampler.corrupt_kg(loader.b_size,
+                                                         loader.tmp_cuda)
+            if loader.use_cuda:
+                self.nh = self.nh.cuda()
+                self.nt = self.nt.cuda()
 
         self.use_cuda = loader.use_cuda
         self.b_size = loader.b_size
@@ -82,6 +155,39 @@ class TrainDataLoaderIter:
         self.n_batches = get_n_batches(len(self.h), self.b_size)
         self.current_batch = 0
 
+        self.executor = loader.executor
+        if self.executor is not None and self.n_batches > 0:
+            self.next_batch = self.executor.submit(self.get_batch, 0)
+
+    def get_batch(self, i):
+        batch = dict()
+        batch['h'] = self.h[i * self.b_size: (i + 1) * self.b_size]
+        batch['t'] = self.t[i * self.b_size: (i + 1) * self.b_size]
+        batch['r'] = self.r[i * self.b_size: (i + 1) * self.b_size]
+        if not self.streaming:
+            batch['nh'] = self.nh[i * self.b_size: (i + 1) * self.b_size]
+            batch['nt'] = self.nt[i * self.b_size: (i + 1) * self.b_size]
+
+        if self.use_cuda == 'batch':
+            for k in batch.keys():
+                batch[k] = batch[k].cuda()
+
+        if self.streaming:
+            batch['nh'], batch['nt'] = self.sampler.corrupt_batch(batch['h'],
+                                                                  batch['t'],
+                                                                  batch['r'])
+            if self.record_negatives:
+                self.recorded_nh.append(batch['nh'].cpu())
+                self.recorded_nt.append(batch['nt'].cpu())
+                self.recorded_r.append(
+                    batch['r'].repeat(self.sampler.n_neg).cpu())
+        elif batch['nh'].dim() > 1:
+            # negatives of the i-th fact are stored in the i-th row
+            batch['nh'] = batch['nh'].t().flatten()
+            batch['nt'] = batch['nt'].t().flatten()
+
+        return batch
+
     def __next__(self):
         if self.current_batch == self.n_batches:
             raise StopIteration
@@ -89,20 +195,13 @@ class TrainDataLoaderIter:
             i = self.current_batch
             self.current_batch += 1
 
-            batch = dict()
-            batch['h'] = self.h[i * self.b_size: (i + 1) * self.b_size]
-            batch['t'] = self.t[i * self.b_size: (i + 1) * self.b_size]
-            batch['r'] = self.r[i * self.b_size: (i + 1) * self.b_size]
-            batch['nh'] = self.nh[i * self.b_size: (i + 1) * self.b_size]
-            batch['nt'] = self.nt[i * self.b_size: (i + 1) * self.b_size]
-
-            if self.use_cuda == 'batch':
-                batch['h'] = batch['h'].cuda()
-                batch['t'] = batch['t'].cuda()
-                batch['r'] = batch['r'].cuda()
-                batch['nh'] = batch['nh'].cuda()
-                batch['nt'] = batch['nt'].cuda()
+            if self.executor is None:
+                return self.get_batch(i)
 
+            batch = self.next_batch.result()
+            if self.current_batch < self.n_batches:
+                self.next_batch = self.executor.submit(self.get_batch,
+                                                       self.current_batch)
             return batch
 
     def __iter__(self):
@@ -132,14 +231,59 @@ class Trainer:
         Can be either None (no use of cuda at all), 'all' to move all the
         dataset to cuda and then split in batches or 'batch' to simply move
         the batches to cuda before they are returned.
-
+    streaming: bool (opt, default = False)
+        If True, batches are negatively sampled on the fly. See
+        :class:`torchkge.utils.training.TrainDataLoader`. Counter-examples
+        are then not kept.
+    prefetch: bool (opt, default = False)
+        If True, the next batch is prepared in a background thread while the
+        model is trained on the current one.
+    n_neg: int (opt, default = 1)
+        Number of negative facts sampled from each fact. Each true fact is
+        compared to all of its negative ones by the criterion.
+    n_workers: int (opt, default = 1)
+        If larger than 1, the model is put in shared memory and trained
+        without locks by `n_workers` processes (Hogwild), each one on its
+        own shard of `kg_train` with its own negative sampler and its own
+        instance of the optimizer (built from the class and the parameter
+        groups of `optimizer`, without its state). Parameters are normalized
+        between epochs once all workers are done and workers wait for the
+        checkpoint to be saved before starting the next epoch. This is only
+        available on CPU and counter-examples are then not kept.
+    distributed: bool (opt, default = False)
+        If True, the model is trained in data-parallel fashion by all the
+        processes of the default group of `torch.distributed`, which should
+        have been initialized beforehand (e.g. with the gloo backend). Each
+        rank trains on its own shard of `kg_train` and gradients are averaged
+        across ranks after each batch: dense gradients are all-reduced in a
+        single buffer and the rows of sparse gradients are gathered. Losses
+        are aggregated over all ranks and only rank 0 displays the progress
+        and saves checkpoints.
+    checkpoint: str (opt, default = None)
+        If given, the state dict of the model is saved at this path at the
+        end of each epoch.
+    constrained: bool (opt, default = False)
+        If True, the entities of each batch are normalized right after the
+        optimizer step, as in the original TransE algorithm, instead of only
+        at the end of each epoch. At the end of an epoch, only the entities
+        used since their last normalization are normalized if the optimizer
+        does not modify other rows (sparse gradients or plain SGD).
+    timer: torchkge.utils.profiling.StageTimer (opt, default = None)
+        If given, the time spent in sampling, forward, backward, optimizer
+        steps and normalization is recorded batch after batch. This is only
+        available in single-process training.
 
     Attributes
     ----------
+    losses: list
+        Mean loss of each epoch (over all workers or ranks).
 
     """
     def __init__(self, model, criterion, kg_train, n_epochs, batch_size,
-                 optimizer, sampling_type='bern', use_cuda=None):
+                 optimizer, sampling_type='bern', use_cuda=None,
+                 streaming=False, prefetch=False, n_neg=1, n_workers=1,
+                 distributed=False, checkpoint=None, constrained=False,
+                 timer=None):
 
         self.model = model
         self.criterion = criterion
@@ -148,25 +292,37 @@ class Trainer:
         self.n_epochs = n_epochs
         self.optimizer = optimizer
         self.sampling_type = sampling_type
+        self.streaming = streaming
+        self.prefetch = prefetch
+        self.n_neg = n_neg
+        self.n_workers = n_workers
+        self.distributed = distributed
+        self.checkpoint = checkpoint
+        self.constrained = constrained
+        self.timer = timer
+
+        if n_workers > 1 and use_cuda is not None:
+            raise WrongArgumentsError('Multi-process training is only '
+                                      'available on CPU.')
+        if n_workers > 1 and distributed:
+            raise WrongArgumentsError('Hogwild and distributed training '
+                                      'cannot be combined.')
 
         self.batch_size = batch_size
         self.n_triples = len(kg_train)
         self.counter_examples: Optional[SmallKG] = None
+        self.losses = []
 
     def process_batch(self, current_batch):
-        self.optimizer.zero_grad()
-
-        h, t, r = current_batch['h'], current_batch['t'], current_batch['r']
-        nh, nt = current_batch['nh'], current_batch['nt']
-
-        p, n = self.model(h, t, r, nh, nt)
-        loss = self.criterion(p, n)
-        loss.backward()
-        self.optimizer.step()
-
-        return loss.detach().item()
+        return process_batch(self.model, self.criterion, self.optimizer,
+                             current_batch, self.constrained, self.timer)
 
     def run(self):
+        if self.n_workers > 1:
+            return self.run_hogwild()
+        if self.distributed:
+            return self.run_distributed()
+
         if self.use_cuda in ['all', 'batch']:
             self.model.cuda()
             self.criterion.cuda()
@@ -175,26 +331,659 @@ class Trainer:
         data_loader = TrainDataLoader(self.kg_train,
                                       batch_size=self.batch_size,
                                       sampling_type=self.sampling_type,
-                                      use_cuda=self.use_cuda)
-        self.counter_examples = data_loader.get_counter_examples()
+                                      use_cuda=self.use_cuda,
+                                      streaming=self.streaming,
+                                      prefetch=self.prefetch,
+                                      n_neg=self.n_neg)
+        # otherwise the model only normalizes the rows used since the last time
+        row_wise = updates_used_rows_only(self.model, self.optimizer)
+        if self.timer is not None:
+            self.timer.start()
         for epoch in iterator:
             sum_ = 0
-            for i, batch in enumerate(data_loader):
+            with stage(self.timer, 'sampling'):
+                batches = iter(data_loader)
+            for i in range(len(data_loader)):
+                with stage(self.timer, 'sampling'):
+                    batch = next(batches)
                 loss = self.process_batch(batch)
                 sum_ += loss
+                if self.timer is not None:
+                    self.timer.end_batch(len(batch['h']), epoch=epoch,
+                                         loss=loss)
 
+            self.losses.append(sum_ / len(data_loader))
             iterator.set_description(
-                'Epoch {} | mean loss: {:.5f}'.format(epoch + 1, sum_ / len(data_loader)))
-            self.model.normalize_parameters()
+                'Epoch {} | mean loss: {:.5f}'.format(epoch + 1,
+                                                      self.losses[-1]))
+            with stage(self.timer, 'normalize'):
+                if not row_wise:
+                    self.model.mark_dirty()
+                self.model.normalize_parameters(
+                    self.model.get_dirty_entities())
+            if self.checkpoint is not None:
+                save(self.model.state_dict(), self.checkpoint)
+        if self.timer is not None:
+            self.timer.stop()
+
+        if not self.streaming and data_loader.iterator is not None:
+            self.counter_examples = data_loader.get_counter_examples()
+
+    def run_hogwild(self):
+        """Train the model with `n_workers` processes sharing its parameters.
+        See the `n_workers` argument of the class.
+
+        """
+        context = multiprocessing.get_context()
+        self.model.share_memory()
+
+        shards = shard_kg(self.kg_train, self.n_workers)
+        barrier = context.Barrier(self.n_workers)
+        # workers are paused until the checkpoint of the epoch is saved
+        saved = None
+        if self.checkpoint is not None:
+            saved = context.Barrier(self.n_workers + 1)
+        losses = context.Queue()
+        # each worker gets its own seed so that they sample different negatives
+        seed = randint(2 ** 31, (1,)).item()
+        n_threads = max(1, get_num_threads() // self.n_workers)
+
+        param_groups = get_param_groups(self.model, self.optimizer)
+
+        workers = [context.Process(target=hogwild_worker,
+                                   args=(rank, self.model, self.criterion,
+                                         shards[rank], type(self.optimizer),
+                                         param_groups, self.n_epochs,
+                                         self.batch_size, self.sampling_type,
+                                         self.streaming, self.n_neg,
+                                         self.constrained, seed + rank,
+                                         n_threads, barrier, saved, losses))
+                   for rank in range(self.n_workers)]
+        for worker in workers:
+            worker.start()
+
+        iterator = tqdm(range(self.n_epochs), unit='epoch')
+        try:
+            for epoch in iterator:
+                sum_, n_batches = 0, 0
+                for _ in range(self.n_workers):
+                    loss, n = get_from_workers(losses, workers)
+                    sum_ += loss
+                    n_batches += n
+                self.losses.append(sum_ / max(n_batches, 1))
+                iterator.set_description(
+                    'Epoch {} | mean loss: {:.5f}'.format(epoch + 1,
+                                                          self.losses[-1]))
+                if self.checkpoint is not None:
+                    save(self.model.state_dict(), self.checkpoint)
+                    saved.wait()
+        except BaseException:
+            for worker in workers:
+                worker.terminate()
+            raise
+        for worker in workers:
+            worker.join()
+
+        self.counter_examples = None
+
+    def run_distributed(self):
+        """Train the model on the shard of `kg_train` of the current rank of
+        the default `torch.distributed` process group. See the `distributed`
+        argument of the class.
+
+        """
+        rank, world_size = distributed.get_rank(), distributed.get_world_size()
+
+        broadcast_parameters(self.model)
+        # all ranks must shard the graph in the same way
+        seed = tensor([randint(2 ** 31, (1,)).item()])
+        distributed.broadcast(seed, 0)
+        generator = Generator().manual_seed(seed.item())
+        shard = shard_kg(self.kg_train, world_size, generator=generator)[rank]
+        manual_seed(seed.item() + rank)
+
+        data_loader = TrainDataLoader(shard,
+                                      batch_size=self.batch_size,
+                                      sampling_type=self.sampling_type,
+                                      streaming=self.streaming,
+                                      prefetch=self.prefetch,
+                                      n_neg=self.n_neg)
+        # shards can have different numbers of batches but all ranks have to
+        # take part in each synchronization
+        n_batches = tensor([len(data_loader)])
+        distributed.all_reduce(n_batches, op=distributed.ReduceOp.MAX)
+
+        row_wise = updates_used_rows_only(self.model, self.optimizer)
+        iterator = tqdm(range(self.n_epochs), unit='epoch', disable=rank != 0)
+        for epoch in iterator:
+            sum_ = 0
+            batches = iter(data_loader)
+            for _ in range(n_batches.item()):
+                batch = next(batches, None)
+                self.optimizer.zero_grad()
+                ent_idx = self.kg_train.head_idx.new_empty((0,))
+                if batch is not None:
+                    p, n = self.model(batch['h'], batch['t'], batch['r'],
+                                      batch['nh'], batch['nt'])
+                    loss = self.criterion(p, n)
+                    loss.backward()
+                    sum_ += loss.detach().item()
+                    ent_idx = cat((batch['h'], batch['t'], batch['nh'],
+                                   batch['nt']))
+                all_reduce_gradients(self.model, world_size)
+                self.optimizer.step()
+                if self.constrained:
+                    # the entities of the batches of all ranks were updated
+                    self.model.normalize_parameters(
+                        all_gather_rows(ent_idx, world_size))
+
+            stats = tensor([sum_, len(data_loader)]).double()
+            distributed.all_reduce(stats)
+            self.losses.append((stats[0] / stats[1].clamp(min=1)).item())
+            iterator.set_description(
+                'Epoch {} | mean loss: {:.5f}'.format(epoch + 1,
+                                                      self.losses[-1]))
+            # all ranks hold the same parameters and can normalize them locally
+            # once they agree on the entities to normalize
+            if row_wise:
+                dirty = self.model.dirty_entities.int()
+                distributed.all_reduce(dirty, op=distributed.ReduceOp.MAX)
+                self.model.dirty_entities.copy_(dirty.bool())
+            else:
+                self.model.mark_dirty()
+            self.model.normalize_parameters(self.model.get_dirty_entities())
+            if rank == 0 and self.checkpoint is not None:
+                save(self.model.state_dict(), self.checkpoint)
+
+        if not self.streaming and data_loader.iterator is not None:
+            self.counter_examples = data_loader.get_counter_examples()
 
     def get_counter_examples(self) -> Optional[SmallKG]:
         """
-        Retrieve the counter-examples generated while training the model.
+        Retrieve the counter-examples generated during the last epoch of
+        training.
 
-        If the model has not been trained yet, return None
+        If the model has not been trained yet or if training was done in
+        streaming mode, return None
 
         Returns
         -------
         A simple knowledge graph containing the triplets that were used as counter-examples during the training phase.
         """
         return self.counter_examples
+
+
+class PartitionedTrainer:
+    """Out-of-core training procedure for graphs whose entity embeddings do
+    not fit in memory, as in PyTorch-BigGraph. Entities are split into
+    `n_partitions` partitions of consecutive indices and the embeddings of
+    all entities are stored in memory-mapped .npy files in `directory` (one
+    file per entity embedding of the model, e.g. `ent_emb.npy`). Facts are
+    bucketed by the partitions of their heads and tails and each epoch
+    iterates over the buckets, keeping only the two partitions of the
+    current bucket in memory. Relation embeddings always stay in memory.
+
+    The model should be built with `PartitionedTrainer.get_n_resident`
+    entities: the first half of its entity embeddings holds the partition of
+    the heads of the current bucket and the second half the one of the
+    tails. Negative facts are sampled among the entities of these two
+    partitions. As rows of the optimizer state are reset when a partition is
+    loaded, optimizers with little or no state (e.g. SGD or Adagrad) are
+    advised.
+
+    References
+    ----------
+    * Adam Lerer, Ledell Wu, Jiajun Shen, Timothee Lacroix, Luca Wehrstedt,
+      Abhijit Bose and Alex Peysakhovich.
+      PyTorch-BigGraph: A Large-scale Graph Embedding System.
+      In Proceedings of the 2nd SysML Conference, 2019.
+      https://arxiv.org/abs/1903.12287
+
+    Parameters
+    ----------
+    model: torchkge.models.interfaces.Model
+        Model to be trained, with `get_n_resident(kg_train.n_ent,
+        n_partitions)` entities.
+    criterion:
+        Criteria which should differentiate positive and negative scores. Can
+        be an elements of torchkge.utils.losses
+    kg_train: torchkge.data_structures.KnowledgeGraph
+        KG used for training.
+    n_epochs: int
+        Number of epochs in the training procedure.
+    batch_size: int
+        Number of batches to use.
+    optimizer: torch.optim.Optimizer
+        Optimizer of the parameters of `model`.
+    n_partitions: int
+        Number of partitions of the entities.
+    directory: str
+        Directory where the embeddings of the entities are stored. It is
+        created if needed.
+    sampling_type: str
+        Either 'unif' (uniform negative sampling) or 'bern' (Bernoulli negative
+        sampling).
+    constrained: bool (opt, default = False)
+        If True, the entities of each batch are normalized right after the
+        optimizer step. See :class:`torchkge.utils.training.Trainer`.
+
+    Attributes
+    ----------
+    part_size: int
+        Maximum number of entities in a partition.
+    embeddings: dict
+        Keys are the names of the entity embeddings of the model and values
+        are the memory-mapped numpy arrays of shape (n_ent, dim) holding
+        them.
+    bucket_offsets: torch.Tensor, shape: (n_partitions ** 2 + 1),
+        dtype: torch.long
+        Facts of bucket (i, j) (heads in partition i and tails in
+        partition j) are
+        `bucket_facts[bucket_offsets[k]:bucket_offsets[k + 1]]` with
+        `k = i * n_partitions + j`.
+    bucket_facts: torch.Tensor, dtype: torch.long, shape: (n_facts)
+        Indices of the facts of `kg_train` sorted by bucket.
+    losses: list
+        Mean loss of each epoch.
+
+    """
+    def __init__(self, model, criterion, kg_train, n_epochs, batch_size,
+                 optimizer, n_partitions, directory, sampling_type='bern',
+                 constrained=False):
+        self.model = model
+        self.criterion = criterion
+        self.kg_train = kg_train
+        self.n_epochs = n_epochs
+        self.batch_size = batch_size
+        self.optimizer = optimizer
+        self.n_partitions = n_partitions
+        self.directory = directory
+        self.constrained = constrained
+        self.losses = []
+
+        self.part_size = -(-kg_train.n_ent // n_partitions)
+        n_resident = self.get_n_resident(kg_train.n_ent, n_partitions)
+        if model.n_ent != n_resident:
+            raise WrongArgumentsError(
+                'The model should have {} entities, see '
+                'PartitionedTrainer.get_n_resident.'.format(n_resident))
+
+        if sampling_type == 'bern':
+            self.bern_probs = BernoulliNegativeSampler(kg_train).bern_probs
+        else:
+            self.bern_probs = ones(kg_train.n_rel) / 2
+
+        buckets = (kg_train.head_idx // self.part_size) * n_partitions + \
+            kg_train.tail_idx // self.part_size
+        self.bucket_facts = buckets.argsort()
+        self.bucket_offsets = zeros(n_partitions ** 2 + 1).long()
+        self.bucket_offsets[1:] = bincount(
+            buckets, minlength=n_partitions ** 2).cumsum(dim=0)
+
+        self.entity_params = {name: m.weight
+                              for name, m in model.named_modules()
+                              if isinstance(m, Embedding) and 'ent' in name and
+                              m.num_embeddings == model.n_ent}
+        self.embeddings = dict()
+        self.resident = [None, None]
+        self.init_embeddings()
+
+    @staticmethod
+    def get_n_resident(n_ent, n_partitions):
+        """Number of entities the model trained on partitions should be built
+        with: twice the maximum size of a partition.
+
+        """
+        return 2 * -(-n_ent // n_partitions)
+
+    def get_bounds(self, part):
+        """Return the indices of the first and last (excluded) entities of a
+        partition.
+
+        """
+        return part * self.part_size, min((part + 1) * self.part_size,
+                                          self.kg_train.n_ent)
+
+    def init_embeddings(self):
+        """Create the memory-mapped files and initialize the embeddings of
+        each partition with Xavier uniform distribution, normalized as by
+        the model.
+
+        """
+        makedirs(self.directory, exist_ok=True)
+        for name, param in self.entity_params.items():
+            self.embeddings[name] = open_memmap(
+                join(self.directory, name + '.npy'), mode='w+',
+                dtype='float32', shape=(self.kg_train.n_ent, param.shape[1]))
+        for part in range(self.n_partitions):
+            start, end = self.get_bounds(part)
+            for param in self.entity_params.values():
+                xavier_uniform_(param.data)
+            self.model.normalize_parameters()
+            for name, param in self.entity_params.items():
+                self.embeddings[name][start:end] = \
+                    param.data[:end - start].cpu().numpy()
+        for memmap in self.embeddings.values():
+            memmap.flush()
+
+    def swap(self, slot, part):
+        """Write the partition held in a slot (0 for heads, 1 for tails) of
+        the entity embeddings of the model to the disk and replace it by
+        another one. The rows of the optimizer state of this slot are reset.
+
+        """
+        if self.resident[slot] == part:
+            return
+        rows = slice(slot * self.part_size, (slot + 1) * self.part_size)
+        if self.resident[slot] is not None:
+            self.model.normalize_parameters(self.model.get_dirty_entities())
+            start, end = self.get_bounds(self.resident[slot])
+            for name, param in self.entity_params.items():
+                self.embeddings[name][start:end] = \
+                    param.data[rows][:end - start].cpu().numpy()
+                self.embeddings[name].flush()
+        self.resident[slot] = part
+        if part is None:
+            return
+        start, end = self.get_bounds(part)
+        for name, param in self.entity_params.items():
+            stored = from_numpy(self.embeddings[name][start:end])
+            param.data[rows][:end - start] = stored.to(param.device)
+            for state in self.optimizer.state.get(param, {}).values():
+                if hasattr(state, 'shape') and state.shape == param.shape:
+                    state[rows] = 0
+        self.model.dirty_entities[rows] = False
+
+    def run(self):
+        iterator = tqdm(range(self.n_epochs), unit='epoch')
+        # otherwise the model only normalizes the rows used since the last time
+        row_wise = updates_used_rows_only(self.model, self.optimizer)
+        for epoch in iterator:
+            sum_, n_batches = 0, 0
+            for i in range(self.n_partitions):
+                for j in range(self.n_partitions):
+                    k = i * self.n_partitions + j
+                    start, end = self.bucket_offsets[k:k + 2]
+                    facts = self.bucket_facts[start:end]
+                    if len(facts) == 0:
+                        continue
+                    # a partition is only resident in one slot
+                    if self.resident[1] == i:
+                        self.swap(1, None)
+                    self.swap(0, i)
+                    if i != j:
+                        self.swap(1, j)
+
+                    facts = facts[randperm(len(facts))]
+                    for b in range(get_n_batches(len(facts), self.batch_size)):
+                        b_facts = facts[b * self.batch_size:
+                                        (b + 1) * self.batch_size]
+                        batch = self.get_batch(b_facts, i, j)
+                        sum_ += process_batch(self.model, self.criterion,
+                                              self.optimizer, batch,
+                                              self.constrained)
+                        n_batches += 1
+                    if not row_wise:
+                        self.model.mark_dirty()
+
+            self.swap(0, None)
+            self.swap(1, None)
+            self.losses.append(sum_ / max(n_batches, 1))
+            iterator.set_description(
+                'Epoch {} | mean loss: {:.5f}'.format(epoch + 1,
+                                                      self.losses[-1]))
+
+    def get_batch(self, facts, i, j):
+        """Return a batch of facts of bucket (i, j) with entities indexed as
+        in the resident embeddings of the model, and negatively sampled heads
+        (in partition i) and tails (in partition j).
+
+        """
+        start_i, end_i = self.get_bounds(i)
+        start_j, end_j = self.get_bounds(j)
+        offset_j = 0 if i == j else self.part_size
+
+        batch = dict()
+        batch['h'] = self.kg_train.head_idx[facts] - start_i
+        batch['t'] = self.kg_train.tail_idx[facts] - start_j + offset_j
+        batch['r'] = self.kg_train.relations[facts]
+
+        mask = bernoulli(self.bern_probs[batch['r'].long()]).bool()
+        batch['nh'], batch['nt'] = batch['h'].clone(), batch['t'].clone()
+        dtype = batch['h'].dtype
+        batch['nh'][mask] = randint(end_i - start_i, (int(mask.sum()),),
+                                    dtype=dtype)
+        batch['nt'][~mask] = randint(end_j - start_j, (int((~mask).sum()),),
+                                     dtype=dtype) + offset_j
+
+        device = next(self.model.parameters()).device
+        return {k: v.to(device) for k, v in batch.items()}
+
+
+def process_batch(model, criterion, optimizer, current_batch,
+                  constrained=False, timer=None):
+    """Make one optimization step of `model` on a batch yielded by a
+    :class:`torchkge.utils.training.TrainDataLoader` and return the loss. If
+    `constrained` is True, the entities of the batch are then normalized. If
+    `timer` is a :class:`torchkge.utils.profiling.StageTimer`, the time spent
+    in each stage is recorded.
+
+    """
+    optimizer.zero_grad()
+
+    h, t, r = current_batch['h'], current_batch['t'], current_batch['r']
+    nh, nt = current_batch['nh'], current_batch['nt']
+
+    with stage(timer, 'forward'):
+        p, n = model(h, t, r, nh, nt)
+        loss = criterion(p, n)
+    with stage(timer, 'backward'):
+        loss.backward()
+    with stage(timer, 'step'):
+        optimizer.step()
+    if constrained:
+        with stage(timer, 'normalize'):
+            model.normalize_parameters(cat((h, t, nh, nt)))
+
+    return loss.detach().item()
+
+
+def shard_kg(kg, n_shards, generator=None):
+    """Randomly split the facts of a knowledge graph into `n_shards` disjoint
+    knowledge graphs of (almost) equal sizes. The shards share the
+    dictionaries and filtering indexes of `kg`.
+
+    Parameters
+    ----------
+    kg: torchkge.data_structures.KnowledgeGraph
+        Knowledge graph to split.
+    n_shards: int
+        Number of shards.
+    generator: torch.Generator (opt, default = None)
+        Random generator used to shuffle the facts.
+
+    Returns
+    -------
+    shards: list
+        List of `n_shards` instances of
+        :class:`torchkge.data_structures.KnowledgeGraph`.
+
+    """
+    perm = randperm(kg.n_facts, generator=generator)
+    return [KnowledgeGraph(kg={'heads': kg.head_idx[idx],
+                               'tails': kg.tail_idx[idx],
+                               'relations': kg.relations[idx]},
+                           ent2ix=kg.ent2ix, rel2ix=kg.rel2ix,
+                           index_of_heads=kg.index_of_heads,
+                           index_of_tails=kg.index_of_tails,
+                           index_of_rels=kg.index_of_rels,
+                           index_dtype=kg.index_dtype)
+            for idx in perm.chunk(n_shards)]
+
+
+def hogwild_worker(rank, model, criterion, kg, optimizer_class, param_groups,
+                   n_epochs, batch_size, sampling_type, streaming, n_neg,
+                   constrained, seed, n_threads, barrier, saved, losses):
+    """Training loop of one of the processes of
+    :meth:`torchkge.utils.training.Trainer.run_hogwild`. The parameters of
+    `model` are in shared memory and updated without locks. Each epoch ends
+    with a barrier after which the first worker normalizes the parameters.
+    If `saved` is not None, workers then wait on it for the main process to
+    save the checkpoint.
+
+    """
+    set_num_threads(n_threads)
+    manual_seed(seed)
+    params = list(model.parameters())
+    optimizer = optimizer_class([dict(g, params=[params[i]
+                                                 for i in g['params']])
+                                 for g in param_groups])
+    data_loader = TrainDataLoader(kg, batch_size=batch_size,
+                                  sampling_type=sampling_type,
+                                  streaming=streaming, n_neg=n_neg)
+    row_wise = updates_used_rows_only(model, optimizer)
+
+    for epoch in range(n_epochs):
+        sum_ = 0
+        for batch in data_loader:
+            sum_ += process_batch(model, criterion, optimizer, batch,
+                                  constrained)
+        if not row_wise:
+            model.mark_dirty()
+
+        barrier.wait()
+        if rank == 0:
+            normalize_shared_parameters(model)
+        barrier.wait()
+        losses.put((sum_, len(data_loader)))
+        if saved is not None:
+            saved.wait()
+
+
+def get_param_groups(model, optimizer):
+    """Get the parameter groups of `optimizer` with their options, the
+    parameters being replaced by their positions in `model.parameters()` so
+    that each Hogwild worker can rebuild the optimizer on its own copy of
+    the model.
+
+    """
+    positions = {id(p): i for i, p in enumerate(model.parameters())}
+    return [dict(g, params=[positions[id(p)] for p in g['params']])
+            for g in optimizer.param_groups]
+
+
+def normalize_shared_parameters(model):
+    """Call the `normalize_parameters` method of a model whose parameters are
+    in shared memory on its dirty entities, making sure that the normalized
+    values are written in the shared tensors even if the method replaces the
+    data of the parameters.
+
+    """
+    params = list(model.parameters())
+    shared = [p.data for p in params]
+    model.normalize_parameters(model.get_dirty_entities())
+    for p, data in zip(params, shared):
+        if p.data is not data:
+            data.copy_(p.data)
+            p.data = data
+
+
+def get_from_workers(queue, workers):
+    """Get the next item of a queue filled by worker processes, failing if
+    one of them died.
+
+    """
+    while True:
+        try:
+            return queue.get(timeout=1)
+        except Empty:
+            if any(w.exitcode not in [None, 0] for w in workers):
+                raise RuntimeError('A training worker exited unexpectedly.')
+
+
+def broadcast_parameters(model, src=0):
+    """Copy the parameters of `model` on rank `src` to all the ranks of the
+    default `torch.distributed` process group.
+
+    """
+    for p in model.parameters():
+        distributed.broadcast(p.data, src)
+
+
+def updates_used_rows_only(model, optimizer):
+    """Check whether the steps of `optimizer` only modify the embeddings of
+    `model` used in the batch, which is the case with sparse gradients or
+    with plain SGD (without momentum nor weight decay). Only the entities
+    marked dirty by the model then have to be normalized.
+
+    """
+    if len(get_sparse_parameters(model)) > 0:
+        return True
+    return isinstance(optimizer, SGD) and \
+        all(g['momentum'] == 0 and g['weight_decay'] == 0
+            for g in optimizer.param_groups)
+
+
+def get_sparse_parameters(model):
+    """Return the set of the ids of the parameters of `model` receiving
+    sparse gradients (weights of embeddings created with `sparse=True`).
+
+    """
+    return {id(m.weight) for m in model.modules()
+            if isinstance(m, Embedding) and m.sparse}
+
+
+def all_reduce_gradients(model, world_size):
+    """Average the gradients of the parameters of `model` over the ranks of
+    the default `torch.distributed` process group. Dense gradients are
+    reduced in a single flat buffer. For sparse gradients, only the updated
+    rows are exchanged. Missing gradients count as zeros.
+
+    """
+    sparse_ids = get_sparse_parameters(model)
+    dense, sparse = [], []
+    for p in model.parameters():
+        if not p.requires_grad:
+            continue
+        if id(p) in sparse_ids:
+            sparse.append(p)
+        else:
+            if p.grad is None:
+                p.grad = zeros_like(p)
+            dense.append(p)
+
+    if len(dense) > 0:
+        buffer = cat([p.grad.flatten() for p in dense])
+        distributed.all_reduce(buffer)
+        buffer /= world_size
+        i = 0
+        for p in dense:
+            p.grad.copy_(buffer[i: i + p.numel()].view_as(p))
+            i += p.numel()
+
+    for p in sparse:
+        if p.grad is None:
+            p.grad = sparse_coo_tensor(zeros((1, 0)).long(),
+                                       p.new_empty((0, p.shape[1])), p.shape)
+        grad = p.grad.coalesce()
+        indices = all_gather_rows(grad.indices()[0], world_size)
+        values = all_gather_rows(grad.values(), world_size)
+        p.grad = sparse_coo_tensor(indices.view(1, -1), values / world_size,
+                                   p.shape).coalesce()
+
+
+def all_gather_rows(x, world_size):
+    """Concatenate the tensors `x` of all the ranks of the default
+    `torch.distributed` process group, which can have different numbers of
+    rows.
+
+    """
+    # all_gather needs tensors of the same size on all ranks
+    sizes = [tensor([0]) for _ in range(world_size)]
+    distributed.all_gather(sizes, tensor([len(x)]))
+    max_size = max(s.item() for s in sizes)
+    padding = x.new_zeros((max_size - len(x),) + x.shape[1:])
+    gathered = [x.new_zeros((max_size,) + x.shape[1:])
+                for _ in range(world_size)]
+    distributed.all_gather(gathered, cat([x, padding]))
+    return cat([g[:s.item()] for g, s in zip(gathered, sizes)])